@@ -0,0 +1,208 @@
+"""
+Per-user daily activity rollup.
+
+UserDailyActivity keeps one row per (user, day) with meditation time, session
+counts by type, moods, completed tasks and assessments; UserActivityTotals
+keeps the lifetime sums. Both are updated incrementally in the same flush as
+the MeditationSession / Assessment / RoutineTask write, so dashboard stats
+are a handful of primary-key reads regardless of how much history a user has.
+
+`flask backfill-activity` rebuilds the rollup from the source tables.
+"""
+
+from datetime import datetime, timedelta
+from collections import defaultdict
+from sqlalchemy import event, inspect, func, delete
+from database import db
+from db_routing import RoutingSession
+from db_utils import upsert_add
+from models import (User, MeditationSession, Assessment, RoutineTask,
+                    UserDailyActivity, UserActivityTotals)
+
+SESSION_TYPE_COLUMNS = {
+    'meditation': 'meditation_count',
+    'music': 'music_count',
+    'breathing': 'breathing_count',
+    'venting': 'venting_count',
+}
+
+
+def _session_increments(session_type, duration, sign=1):
+    """Rollup column deltas for one MeditationSession row"""
+    increments = {
+        'meditation_seconds': sign * (duration or 0),
+        'session_count': sign,
+    }
+    session_type = session_type or ''
+    if session_type.startswith('mood_'):
+        increments['mood_count'] = sign
+    elif session_type in SESSION_TYPE_COLUMNS:
+        increments[SESSION_TYPE_COLUMNS[session_type]] = sign
+    return increments
+
+
+def _today():
+    return datetime.utcnow().date()
+
+
+def _apply(conn, user_id, day, increments, last_mood=None):
+    upsert_add(conn, UserDailyActivity.__table__,
+               {'user_id': user_id, 'date': day}, increments,
+               replace={'last_mood': last_mood})
+    totals = {name: increments[name] for name in ('meditation_seconds', 'session_count', 'assessments_count')
+              if name in increments}
+    if totals:
+        upsert_add(conn, UserActivityTotals.__table__, {'user_id': user_id}, totals)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _update_rollup(db_session, flush_context):
+    # new/dirty/deleted still hold the pre-flush state here
+    changes = []
+    for obj in db_session.new:
+        if isinstance(obj, MeditationSession):
+            mood = obj.session_type[len('mood_'):] if (obj.session_type or '').startswith('mood_') else None
+            changes.append((obj.user_id, obj.date or _today(),
+                            _session_increments(obj.session_type, obj.duration), mood))
+        elif isinstance(obj, Assessment):
+            day = (obj.completed_at or datetime.utcnow()).date()
+            changes.append((obj.user_id, day, {'assessments_count': 1}, None))
+        elif isinstance(obj, RoutineTask) and obj.status == 'completed':
+            changes.append((obj.user_id, obj.created_date or _today(), {'tasks_completed': 1}, None))
+
+    for obj in db_session.dirty:
+        if isinstance(obj, RoutineTask):
+            history = inspect(obj).attrs.status.history
+            if not history.has_changes():
+                continue
+            was_completed = 'completed' in (history.deleted or ())
+            now_completed = obj.status == 'completed'
+            if was_completed != now_completed:
+                changes.append((obj.user_id, obj.created_date or _today(),
+                                {'tasks_completed': 1 if now_completed else -1}, None))
+
+    for obj in db_session.deleted:
+        if isinstance(obj, MeditationSession):
+            changes.append((obj.user_id, obj.date or _today(),
+                            _session_increments(obj.session_type, obj.duration, sign=-1), None))
+        elif isinstance(obj, Assessment):
+            day = (obj.completed_at or datetime.utcnow()).date()
+            changes.append((obj.user_id, day, {'assessments_count': -1}, None))
+
+    if not changes:
+        return
+    conn = db_session.connection()
+    for user_id, day, increments, mood in changes:
+        _apply(conn, user_id, day, increments, last_mood=mood)
+
+
+def get_activity_rows(user_id, since):
+    """Rollup rows for a user from `since` (a date) onwards, keyed by date"""
+    rows = UserDailyActivity.query.filter(
+        UserDailyActivity.user_id == user_id,
+        UserDailyActivity.date >= since
+    ).all()
+    return {row.date: row for row in rows}
+
+
+def activity_summary(user_id, today=None, series_days=0):
+    """Meditation stats shown on the dashboards, read from the rollup.
+
+    Returns weekly_sessions_count (since Monday), sessions_last_7_days,
+    today_sessions_count, total_minutes_meditated and, when series_days is
+    set, a per-day minutes series for the last `series_days` days.
+    """
+    today = today or _today()
+    start_of_week = today - timedelta(days=today.weekday())
+    last_7 = today - timedelta(days=7)
+    series_start = today - timedelta(days=max(series_days - 1, 0))
+    rows = get_activity_rows(user_id, min(start_of_week, last_7, series_start))
+
+    totals = db.session.get(UserActivityTotals, user_id)
+    total_seconds = totals.meditation_seconds if totals else 0
+
+    summary = {
+        'weekly_sessions_count': sum(r.session_count for d, r in rows.items() if d >= start_of_week),
+        'sessions_last_7_days': sum(r.session_count for d, r in rows.items() if d >= last_7),
+        'today_sessions_count': rows[today].session_count if today in rows else 0,
+        'total_minutes_meditated': total_seconds // 60,
+    }
+    if series_days:
+        days = [today - timedelta(days=i) for i in range(series_days - 1, -1, -1)]
+        summary['series'] = [(d, (rows[d].meditation_seconds // 60) if d in rows else 0) for d in days]
+    return summary
+
+
+def backfill_activity(user_ids=None, batch_size=500, progress=None):
+    """Rebuild the rollup tables from the source tables, a batch of users at a time"""
+    query = db.session.query(User.id).order_by(User.id)
+    if user_ids:
+        query = query.filter(User.id.in_(user_ids))
+    ids = [row.id for row in query]
+    done = 0
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        daily = defaultdict(lambda: defaultdict(int))
+        last_mood = {}
+
+        sessions = db.session.query(
+            MeditationSession.user_id, MeditationSession.date, MeditationSession.session_type,
+            func.count(MeditationSession.id), func.coalesce(func.sum(MeditationSession.duration), 0)
+        ).filter(MeditationSession.user_id.in_(batch)).group_by(
+            MeditationSession.user_id, MeditationSession.date, MeditationSession.session_type
+        )
+        for user_id, day, session_type, count, seconds in sessions:
+            row = daily[(user_id, day)]
+            for name, value in _session_increments(session_type, 0).items():
+                row[name] += value * count
+            row['meditation_seconds'] += seconds
+
+        latest_moods = db.session.query(
+            MeditationSession.user_id, MeditationSession.date, MeditationSession.session_type
+        ).filter(
+            MeditationSession.user_id.in_(batch),
+            MeditationSession.session_type.like('mood\\_%', escape='\\')
+        ).order_by(MeditationSession.completed_at)
+        for user_id, day, session_type in latest_moods:
+            last_mood[(user_id, day)] = session_type[len('mood_'):]
+
+        day_of_assessment = func.date(Assessment.completed_at)
+        for user_id, day, count in db.session.query(
+            Assessment.user_id, day_of_assessment, func.count(Assessment.id)
+        ).filter(Assessment.user_id.in_(batch)).group_by(Assessment.user_id, day_of_assessment):
+            if isinstance(day, str):
+                day = datetime.strptime(day, '%Y-%m-%d').date()
+            daily[(user_id, day)]['assessments_count'] += count
+
+        for user_id, day, count in db.session.query(
+            RoutineTask.user_id, RoutineTask.created_date, func.count(RoutineTask.id)
+        ).filter(RoutineTask.user_id.in_(batch), RoutineTask.status == 'completed').group_by(
+            RoutineTask.user_id, RoutineTask.created_date
+        ):
+            daily[(user_id, day)]['tasks_completed'] += count
+
+        db.session.execute(delete(UserDailyActivity).where(UserDailyActivity.user_id.in_(batch)))
+        db.session.execute(delete(UserActivityTotals).where(UserActivityTotals.user_id.in_(batch)))
+        daily_rows = [
+            {'user_id': user_id, 'date': day, 'last_mood': last_mood.get((user_id, day)), **values}
+            for (user_id, day), values in daily.items() if day is not None
+        ]
+        totals = defaultdict(lambda: defaultdict(int))
+        for row in daily_rows:
+            for name in ('meditation_seconds', 'session_count', 'assessments_count'):
+                totals[row['user_id']][name] += row.get(name, 0)
+        if daily_rows:
+            db.session.execute(UserDailyActivity.__table__.insert(), [
+                {column.name: row.get(column.name, 0 if column.name != 'last_mood' else None)
+                 for column in UserDailyActivity.__table__.columns}
+                for row in daily_rows
+            ])
+        if totals:
+            db.session.execute(UserActivityTotals.__table__.insert(), [
+                {'user_id': user_id, **values} for user_id, values in totals.items()
+            ])
+        db.session.commit()
+        done += len(batch)
+        if progress:
+            progress(done, len(ids))
+    return done
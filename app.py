@@ -9,6 +9,10 @@ from werkzeug.middleware.proxy_fix import ProxyFix
 from sqlalchemy.orm import DeclarativeBase
 ## Removed inkblot import; will define inkblot routes in routes.py
 from database import db
+from db_engine import configure_engine
+import db_routing
+from db_routing import REPLICA_BIND_KEY
+import passwords
 
 logging.basicConfig(level=logging.DEBUG)
 
@@ -29,12 +33,99 @@ app.config['BABEL_DEFAULT_TIMEZONE'] = 'UTC'
 
 app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///mental_health.db")
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    'pool_pre_ping': True,
-    "pool_recycle": 300,
-}
+# Engine options come from the selected profile (tuned SQLite or pooled Postgres), see db_engine.py
+app.config['DB_ENGINE_PROFILE'] = os.environ.get('DB_ENGINE_PROFILE', 'auto')
+configure_engine(app)
+
+# Optional read replica for analytics routes (see db_routing.py); falls back to the primary
+if os.environ.get("REPLICA_DATABASE_URL"):
+    app.config["SQLALCHEMY_BINDS"] = {REPLICA_BIND_KEY: os.environ["REPLICA_DATABASE_URL"]}
+app.config['REPLICA_STICKY_SECONDS'] = int(os.environ.get('REPLICA_STICKY_SECONDS', '5'))
+
+# Background jobs run on threads in each worker, started on its first request (see background.py)
+app.config['BACKGROUND_JOBS_ENABLED'] = os.environ.get('BACKGROUND_JOBS_ENABLED', '1') == '1'
+app.config['COHORT_STATS_REFRESH_SECONDS'] = int(os.environ.get('COHORT_STATS_REFRESH_SECONDS', '300'))
+app.config['LIKE_FLUSH_SECONDS'] = float(os.environ.get('LIKE_FLUSH_SECONDS', '2'))
+# Flask-Login identity cache per worker (see user_cache.py); 0 disables it
+app.config['USER_CACHE_TTL_SECONDS'] = int(os.environ.get('USER_CACHE_TTL_SECONDS', '30'))
+app.config['USER_CACHE_SIZE'] = int(os.environ.get('USER_CACHE_SIZE', '1024'))
+# Password KDF and the per-worker hashing pool (see passwords.py); 0 workers hashes inline
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+app.config['PASSWORD_SALT_LENGTH'] = int(os.environ.get('PASSWORD_SALT_LENGTH', '16'))
+app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', '2'))
+app.config['PASSWORD_HASH_QUEUE'] = int(os.environ.get('PASSWORD_HASH_QUEUE', '16'))
+app.config['PASSWORD_HASH_TIMEOUT'] = float(os.environ.get('PASSWORD_HASH_TIMEOUT', '5'))
+# Venting hall moderation pipeline (see moderation.py)
+app.config['MODERATION_WORKERS'] = int(os.environ.get('MODERATION_WORKERS', '1'))
+app.config['MODERATION_BATCH_SIZE'] = int(os.environ.get('MODERATION_BATCH_SIZE', '100'))
+app.config['MODERATION_POLL_SECONDS'] = float(os.environ.get('MODERATION_POLL_SECONDS', '2'))
+app.config['MODERATION_SWEEP_SECONDS'] = int(os.environ.get('MODERATION_SWEEP_SECONDS', '300'))
+app.config['MODERATION_FLAG_THRESHOLD'] = float(os.environ.get('MODERATION_FLAG_THRESHOLD', '0.5'))
+app.config['MODERATION_CLASSIFIER'] = os.environ.get('MODERATION_CLASSIFIER')  # "module:function", optional
+# Cold storage for idle chat sessions (see chat_archive.py)
+app.config['CHAT_ARCHIVE_AFTER_DAYS'] = int(os.environ.get('CHAT_ARCHIVE_AFTER_DAYS', '30'))
+app.config['CHAT_ARCHIVE_BATCH_SIZE'] = int(os.environ.get('CHAT_ARCHIVE_BATCH_SIZE', '200'))
+app.config['CHAT_ARCHIVE_INTERVAL_SECONDS'] = int(os.environ.get('CHAT_ARCHIVE_INTERVAL_SECONDS', '3600'))
+# Retention windows in days for `flask purge-expired`; 0 keeps data forever (see retention.py)
+app.config['RETENTION_CHAT_DAYS'] = int(os.environ.get('RETENTION_CHAT_DAYS', '0'))
+app.config['RETENTION_VENTING_DAYS'] = int(os.environ.get('RETENTION_VENTING_DAYS', '0'))
+app.config['RETENTION_MODERATION_DAYS'] = int(os.environ.get('RETENTION_MODERATION_DAYS', '0'))
+app.config['RETENTION_EMAIL_DAYS'] = int(os.environ.get('RETENTION_EMAIL_DAYS', '0'))
+app.config['RETENTION_SCHEDULED_JOB_DAYS'] = int(os.environ.get('RETENTION_SCHEDULED_JOB_DAYS', '0'))
+# Outgoing mail: SMTP server and the outbox sender (see email_outbox.py); no SMTP_HOST only logs emails
+app.config['SMTP_HOST'] = os.environ.get('SMTP_HOST')
+app.config['SMTP_PORT'] = int(os.environ.get('SMTP_PORT', '587'))
+app.config['SMTP_USER'] = os.environ.get('SMTP_USER')
+app.config['SMTP_PASS'] = os.environ.get('SMTP_PASS')
+app.config['SMTP_FROM'] = os.environ.get('SMTP_FROM')
+app.config['MENTOR_EMAIL'] = os.environ.get('MENTOR_EMAIL')
+app.config['COUNSELLOR_EMAIL'] = os.environ.get('COUNSELLOR_EMAIL')
+app.config['SMTP_STARTTLS'] = os.environ.get('SMTP_STARTTLS', '1') == '1'
+app.config['SMTP_TIMEOUT'] = float(os.environ.get('SMTP_TIMEOUT', '10'))
+app.config['SMTP_POOL_SIZE'] = int(os.environ.get('SMTP_POOL_SIZE', '2'))
+app.config['SMTP_IDLE_SECONDS'] = int(os.environ.get('SMTP_IDLE_SECONDS', '60'))
+app.config['EMAIL_POLL_SECONDS'] = float(os.environ.get('EMAIL_POLL_SECONDS', '5'))
+app.config['EMAIL_BATCH_SIZE'] = int(os.environ.get('EMAIL_BATCH_SIZE', '50'))
+app.config['EMAIL_LEASE_SECONDS'] = int(os.environ.get('EMAIL_LEASE_SECONDS', '300'))
+app.config['EMAIL_MAX_ATTEMPTS'] = int(os.environ.get('EMAIL_MAX_ATTEMPTS', '6'))
+app.config['EMAIL_RETRY_BASE_SECONDS'] = int(os.environ.get('EMAIL_RETRY_BASE_SECONDS', '60'))
+app.config['EMAIL_RETRY_MAX_SECONDS'] = int(os.environ.get('EMAIL_RETRY_MAX_SECONDS', '3600'))
+# Routine notifications are batched into digests (see notifications.py): immediate, hourly, daily or off
+app.config['NOTIFY_DEFAULT_WINDOW'] = os.environ.get('NOTIFY_DEFAULT_WINDOW', 'hourly')
+app.config['NOTIFY_DIGEST_POLL_SECONDS'] = int(os.environ.get('NOTIFY_DIGEST_POLL_SECONDS', '300'))
+# Consultation reminders and escalations (see scheduler.py and consultation_reminders.py)
+app.config['SCHEDULER_POLL_SECONDS'] = float(os.environ.get('SCHEDULER_POLL_SECONDS', '30'))
+app.config['SCHEDULER_BATCH_SIZE'] = int(os.environ.get('SCHEDULER_BATCH_SIZE', '100'))
+app.config['SCHEDULER_LEASE_SECONDS'] = int(os.environ.get('SCHEDULER_LEASE_SECONDS', '300'))
+app.config['SCHEDULER_MAX_ATTEMPTS'] = int(os.environ.get('SCHEDULER_MAX_ATTEMPTS', '5'))
+app.config['SCHEDULER_RETRY_BASE_SECONDS'] = int(os.environ.get('SCHEDULER_RETRY_BASE_SECONDS', '60'))
+app.config['SCHEDULER_RETRY_MAX_SECONDS'] = int(os.environ.get('SCHEDULER_RETRY_MAX_SECONDS', '3600'))
+app.config['SESSION_REMINDER_HOURS'] = float(os.environ.get('SESSION_REMINDER_HOURS', '24'))
+app.config['FOLLOW_UP_REMINDER_HOURS'] = float(os.environ.get('FOLLOW_UP_REMINDER_HOURS', '24'))
+app.config['PENDING_ESCALATION_HOURS'] = float(os.environ.get('PENDING_ESCALATION_HOURS', '48'))
+app.config['PENDING_ESCALATION_HIGH_HOURS'] = float(os.environ.get('PENDING_ESCALATION_HIGH_HOURS', '4'))
+# Counsellor matching for requests without a chosen counsellor (see matching.py)
+app.config['MATCHING_MAX_LOAD'] = int(os.environ.get('MATCHING_MAX_LOAD', '10'))
+app.config['MATCHING_POLL_SECONDS'] = float(os.environ.get('MATCHING_POLL_SECONDS', '60'))
+app.config['MATCHING_RECONCILE_SECONDS'] = int(os.environ.get('MATCHING_RECONCILE_SECONDS', '300'))
+app.config['MATCHING_SLOT_HORIZON_DAYS'] = int(os.environ.get('MATCHING_SLOT_HORIZON_DAYS', '7'))
+# How far ahead weekly availability rules are expanded when searching or checking for clashes
+app.config['AVAILABILITY_HORIZON_DAYS'] = int(os.environ.get('AVAILABILITY_HORIZON_DAYS', '30'))
+# /api/open_slots ETags roll over at least this often, so slots that have started drop out
+app.config['OPEN_SLOTS_CACHE_SECONDS'] = int(os.environ.get('OPEN_SLOTS_CACHE_SECONDS', '120'))
+# Live dashboard updates over Server-Sent Events (see live.py)
+app.config['LIVE_BACKEND'] = os.environ.get('LIVE_BACKEND')  # "module:factory" for cross-worker delivery, optional
+app.config['LIVE_STREAM_SECONDS'] = int(os.environ.get('LIVE_STREAM_SECONDS', '300'))
+app.config['LIVE_HEARTBEAT_SECONDS'] = int(os.environ.get('LIVE_HEARTBEAT_SECONDS', '20'))
+app.config['LIVE_QUEUE_SIZE'] = int(os.environ.get('LIVE_QUEUE_SIZE', '100'))
+# .ics schedule feeds (see calendar_feed.py)
+app.config['CALENDAR_PAST_DAYS'] = int(os.environ.get('CALENDAR_PAST_DAYS', '90'))
+app.config['CALENDAR_SESSION_MINUTES'] = int(os.environ.get('CALENDAR_SESSION_MINUTES', '60'))
+app.config['CALENDAR_UID_DOMAIN'] = os.environ.get('CALENDAR_UID_DOMAIN', 'mindcare')
 
 db.init_app(app)
+db_routing.init_app(app)
+passwords.init_app(app)
 
 # Initialize Babel
 babel = Babel()
@@ -61,12 +152,19 @@ login_manager.login_message_category = 'info'
 
 @login_manager.user_loader
 def load_user(user_id):
-    from models import User
-    return User.query.get(int(user_id))
+    # Served from a per-process identity cache; the User row loads only when needed (see user_cache.py)
+    from user_cache import load_user as load_cached_user
+    return load_cached_user(user_id)
 
 with app.app_context():
     import models  # noqa: F401
+    import activity  # noqa: F401  (registers the rollup flush listener)
+    import calendar_feed  # noqa: F401  (registers the schedule version flush listener)
+    import user_cache
+    user_cache.init_app(app)
     db.create_all()  # Ensure all tables are created, including routine_tasks
+    import venting_search
+    venting_search.ensure_search_index()
     logging.info("Database tables created")
 
 def nl2br(value):
@@ -83,6 +181,30 @@ app.jinja_env.globals['get_locale'] = get_locale
 
 ## Import routes to register them
 import routes
+import commands  # noqa: F401
+
+## Register background jobs
+import background
+import cohort_stats
+import like_buffer
+import moderation
+import chat_archive
+import email_outbox
+import notifications
+import scheduler
+import consultation_reminders  # noqa: F401  (registers the scheduler handlers)
+import matching
+import live
+background.init_app(app)
+cohort_stats.init_app(app)
+like_buffer.init_app(app)
+moderation.init_app(app)
+chat_archive.init_app(app)
+email_outbox.init_app(app)
+notifications.init_app(app)
+scheduler.init_app(app)
+matching.init_app(app)
+live.init_app(app)
 
 ## Removed inkblot_bp blueprint registration; now using direct route in routes.py
 
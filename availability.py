@@ -0,0 +1,259 @@
+"""
+Recurring availability and open-slot search.
+
+Counsellors describe their week with AvailabilityRule rows, e.g. "Mon and
+Wed 14:00-17:00 in 30 minute slots". Rules are never expanded into the
+database up front. `iter_open_slots()` expands them lazily for the window
+being looked at, merges them with the concrete AvailabilitySlot rows and
+drops any generated slot that overlaps a concrete one. Per counsellor the
+concrete slots are kept in an IntervalIndex (sorted, merged intervals
+searched with bisect), so each check is O(log n). The per-counsellor streams
+are already in time order, so heapq.merge yields the earliest free slots
+across all counsellors without sorting everything. `open_slots_page()` pages
+through that order with a (start, counsellor_id) keyset cursor.
+
+A generated slot only becomes an AvailabilitySlot row when somebody books
+it (`materialize()`). The unique (counsellor_id, start_time) makes that
+idempotent under concurrent bookings.
+"""
+
+import heapq
+from bisect import bisect_left, bisect_right
+from collections import defaultdict, namedtuple
+from datetime import datetime, date, time, timedelta
+from itertools import dropwhile, islice
+from flask import current_app
+from sqlalchemy import select, or_
+from database import db
+from db_utils import insert_ignore
+from models import AvailabilityRule, AvailabilitySlot
+import change_counters
+from venting_feed import encode_cursor, decode_cursor
+
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# Furthest ahead a search may look; rules are expanded for the whole window
+MAX_WINDOW_DAYS = 90
+MINUTES_PER_DAY = 24 * 60
+MAX_SLOT_MINUTES = 240
+
+# Sorted by (start, counsellor_id); slot_id is None until a generated slot is booked
+OpenSlot = namedtuple('OpenSlot', 'start end counsellor_id slot_id rule_id')
+
+
+class AvailabilityConflict(ValueError):
+    """The new availability overlaps availability the counsellor already has"""
+
+
+class IntervalIndex:
+    """Disjoint, sorted [start, end) intervals; overlapping or touching intervals are merged on add"""
+
+    def __init__(self, intervals=()):
+        self._starts = []
+        self._ends = []
+        for start, end in sorted(intervals):
+            self.add(start, end)
+
+    def __len__(self):
+        return len(self._starts)
+
+    def add(self, start, end):
+        i = bisect_left(self._ends, start)    # first interval ending at or after `start`
+        j = bisect_right(self._starts, end)   # past the last interval starting at or before `end`
+        if i < j:
+            start = min(start, self._starts[i])
+            end = max(end, self._ends[j - 1])
+        self._starts[i:j] = [start]
+        self._ends[i:j] = [end]
+
+    def overlaps(self, start, end):
+        i = bisect_right(self._ends, start)   # first interval ending after `start`
+        return i < len(self._starts) and self._starts[i] < end
+
+
+def expand_rule(rule, window_start, window_end):
+    """Yield the rule's (start, end) slots that lie inside [window_start, window_end), in order"""
+    first = max(window_start.date(), rule.valid_from)
+    last = min((window_end - timedelta(microseconds=1)).date(), rule.valid_until or date.max)
+    if first > last or rule.slot_minutes <= 0:
+        return
+    step = timedelta(minutes=rule.slot_minutes)
+    offsets = [timedelta(minutes=m)
+               for m in range(rule.start_minute, rule.end_minute - rule.slot_minutes + 1, rule.slot_minutes)]
+    day = first
+    while day <= last:
+        if rule.weekdays >> day.weekday() & 1:
+            midnight = datetime.combine(day, time())
+            for offset in offsets:
+                start = midnight + offset
+                if start >= window_end:
+                    return
+                if start >= window_start:
+                    yield start, start + step
+        day += timedelta(days=1)
+
+
+def _generated_slots(counsellor_id, rules, taken, window_start, window_end):
+    generated = heapq.merge(*(
+        ((start, end, rule.id) for start, end in expand_rule(rule, window_start, window_end))
+        for rule in rules
+    ))
+    last_end = None
+    for start, end, rule_id in generated:
+        # Concrete slots win over generated ones; so does an earlier rule of the same counsellor
+        if taken.overlaps(start, end) or (last_end is not None and start < last_end):
+            continue
+        last_end = end
+        yield OpenSlot(start, end, counsellor_id, None, rule_id)
+
+
+def _counsellor_slots(counsellor_id, rules, concrete, window_start, window_end):
+    """Open slots of one counsellor in time order: open concrete slots plus non-overlapping generated ones"""
+    taken = IntervalIndex((slot.start_time, slot.end_time) for slot in concrete)
+    fixed = (OpenSlot(slot.start_time, slot.end_time, counsellor_id, slot.id, slot.rule_id)
+             for slot in concrete if not slot.is_booked and slot.start_time >= window_start)
+    return heapq.merge(fixed, _generated_slots(counsellor_id, rules, taken, window_start, window_end),
+                       key=lambda s: s.start)
+
+
+def iter_open_slots(window_start=None, window_end=None, counsellor_id=None, after=None):
+    """Lazily yield open slots of every (or one) counsellor in [window_start, window_end), earliest first.
+
+    `after` is a (start, counsellor_id) position; only slots sorting after it are yielded.
+    """
+    window_start = window_start or datetime.utcnow()
+    window_end = window_end or window_start + timedelta(days=current_app.config.get('AVAILABILITY_HORIZON_DAYS', 30))
+    if after is not None:
+        # Nothing before the cursor's start time can follow it
+        window_start = max(window_start, after[0])
+
+    rules_q = select(AvailabilityRule).where(
+        AvailabilityRule.valid_from <= window_end.date(),
+        or_(AvailabilityRule.valid_until.is_(None), AvailabilityRule.valid_until >= window_start.date())
+    )
+    # Slots running into the window still block generated slots; a day of look-back covers any slot length
+    slots_q = select(
+        AvailabilitySlot.id, AvailabilitySlot.counsellor_id, AvailabilitySlot.start_time, AvailabilitySlot.end_time,
+        AvailabilitySlot.is_booked, AvailabilitySlot.rule_id
+    ).where(
+        AvailabilitySlot.start_time >= window_start - timedelta(days=1), AvailabilitySlot.start_time < window_end,
+        AvailabilitySlot.end_time > window_start
+    ).order_by(AvailabilitySlot.start_time)
+    if counsellor_id is not None:
+        rules_q = rules_q.where(AvailabilityRule.counsellor_id == counsellor_id)
+        slots_q = slots_q.where(AvailabilitySlot.counsellor_id == counsellor_id)
+
+    rules, concrete = defaultdict(list), defaultdict(list)
+    for rule in db.session.execute(rules_q).scalars():
+        rules[rule.counsellor_id].append(rule)
+    # Plain rows: the search never needs identity-mapped AvailabilitySlot objects
+    for slot in db.session.execute(slots_q):
+        concrete[slot.counsellor_id].append(slot)
+
+    streams = [_counsellor_slots(cid, rules[cid], concrete[cid], window_start, window_end)
+               for cid in sorted(set(rules) | set(concrete))]
+    merged = heapq.merge(*streams, key=lambda s: (s.start, s.counsellor_id))
+    if after is not None:
+        merged = dropwhile(lambda s: (s.start, s.counsellor_id) <= after, merged)
+    return merged
+
+
+def open_slots(window_start=None, window_end=None, counsellor_id=None, limit=None):
+    """List of the open slots from iter_open_slots(), at most `limit` of them"""
+    return list(islice(iter_open_slots(window_start, window_end, counsellor_id), limit))
+
+
+def open_slots_page(window_start=None, window_end=None, counsellor_id=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """Return (slots, next_cursor) for the page after `cursor`; next_cursor is None on the last page"""
+    limit = max(1, min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
+    slots = list(islice(iter_open_slots(window_start, window_end, counsellor_id, decode_cursor(cursor)), limit + 1))
+    next_cursor = encode_cursor((slots[limit - 1].start, slots[limit - 1].counsellor_id)) if len(slots) > limit else None
+    return slots[:limit], next_cursor
+
+
+def _rules_overlap(a, b):
+    """True if two weekly rules ever offer the same minutes on the same day"""
+    if not a.weekdays & b.weekdays:
+        return False
+    if a.start_minute >= b.end_minute or b.start_minute >= a.end_minute:
+        return False
+    return a.valid_from <= (b.valid_until or date.max) and b.valid_from <= (a.valid_until or date.max)
+
+
+def check_slot(counsellor_id, start, end):
+    """Raise AvailabilityConflict if [start, end) overlaps an existing slot or rule of the counsellor"""
+    existing = db.session.execute(
+        select(AvailabilitySlot.start_time, AvailabilitySlot.end_time).where(
+            AvailabilitySlot.counsellor_id == counsellor_id,
+            AvailabilitySlot.start_time < end, AvailabilitySlot.end_time > start)
+    ).all()
+    if IntervalIndex(existing).overlaps(start, end):
+        raise AvailabilityConflict('This time overlaps one of your existing slots.')
+    rules = AvailabilityRule.query.filter_by(counsellor_id=counsellor_id).all()
+    day_start = datetime.combine(start.date(), time())
+    generated = IntervalIndex(
+        interval for rule in rules
+        for interval in expand_rule(rule, day_start, max(end, day_start + timedelta(days=1)))
+    )
+    if generated.overlaps(start, end):
+        raise AvailabilityConflict('This time is already offered by one of your weekly rules.')
+
+
+def check_rule(rule):
+    """Raise AvailabilityConflict if `rule` overlaps another rule or an upcoming slot of the counsellor"""
+    if not 0 <= rule.start_minute < rule.end_minute <= MINUTES_PER_DAY:
+        raise AvailabilityConflict('Times must fall within one day, with the end after the start.')
+    if not 0 < rule.slot_minutes <= MAX_SLOT_MINUTES:
+        raise AvailabilityConflict(f'Slots must be between 1 and {MAX_SLOT_MINUTES} minutes long.')
+    if not rule.weekdays or rule.end_minute - rule.start_minute < rule.slot_minutes:
+        raise AvailabilityConflict('Choose at least one day and a time range that fits one slot.')
+    if rule.valid_until and rule.valid_until < rule.valid_from:
+        raise AvailabilityConflict('The end date is before the start date.')
+    for other in AvailabilityRule.query.filter(AvailabilityRule.counsellor_id == rule.counsellor_id,
+                                               AvailabilityRule.id != rule.id):
+        if _rules_overlap(rule, other):
+            raise AvailabilityConflict('This rule overlaps one of your existing weekly rules.')
+    horizon_start = max(datetime.utcnow(), datetime.combine(rule.valid_from, time()))
+    horizon_end = horizon_start + timedelta(days=current_app.config.get('AVAILABILITY_HORIZON_DAYS', 30))
+    existing = db.session.execute(
+        select(AvailabilitySlot.start_time, AvailabilitySlot.end_time).where(
+            AvailabilitySlot.counsellor_id == rule.counsellor_id,
+            AvailabilitySlot.end_time > horizon_start, AvailabilitySlot.start_time < horizon_end)
+    ).all()
+    taken = IntervalIndex(existing)
+    if len(taken) and any(taken.overlaps(s, e) for s, e in expand_rule(rule, horizon_start, horizon_end)):
+        raise AvailabilityConflict('This rule overlaps upcoming slots you added by hand.')
+
+
+def materialize(rule_id, start):
+    """The AvailabilitySlot for a generated slot, created if needed; None if the rule does not offer it"""
+    rule = db.session.get(AvailabilityRule, rule_id)
+    if rule is None:
+        return None
+    offered = next((s for s in expand_rule(rule, start, start + timedelta(minutes=rule.slot_minutes))
+                    if s[0] == start), None)
+    if offered is None:
+        return None
+    clash = db.session.execute(
+        select(AvailabilitySlot.id).where(
+            AvailabilitySlot.counsellor_id == rule.counsellor_id, AvailabilitySlot.start_time != offered[0],
+            AvailabilitySlot.start_time < offered[1], AvailabilitySlot.end_time > offered[0])
+    ).first()
+    if clash is not None:
+        return None
+    if insert_ignore(db.session.connection(), AvailabilitySlot.__table__, {
+        'counsellor_id': rule.counsellor_id, 'start_time': offered[0], 'end_time': offered[1],
+        'is_booked': False, 'rule_id': rule.id, 'created_at': datetime.utcnow(),
+    }):
+        change_counters.bump(change_counters.AVAILABILITY)
+    return AvailabilitySlot.query.filter_by(counsellor_id=rule.counsellor_id, start_time=offered[0]).first()
+
+
+def delete_rule(rule):
+    """Remove a rule and its unbooked materialized slots; booked ones stay as plain slots. The caller commits."""
+    AvailabilitySlot.query.filter(AvailabilitySlot.rule_id == rule.id,
+                                  AvailabilitySlot.is_booked == False).delete(  # noqa: E712
+        synchronize_session=False)
+    db.session.delete(rule)
+    change_counters.bump(change_counters.AVAILABILITY)
@@ -0,0 +1,74 @@
+"""
+In-process background jobs.
+
+Each gunicorn worker runs its registered jobs on daemon threads, started on
+the first request so CLI commands and migration scripts never spawn them.
+Set BACKGROUND_JOBS_ENABLED=0 to turn them off (e.g. when a separate worker
+process runs them instead).
+"""
+
+import logging
+import threading
+from database import db
+
+_jobs = []
+_started = False
+_lock = threading.Lock()
+
+
+class PeriodicJob:
+    """Calls `func()` inside an app context every `interval` seconds"""
+
+    def __init__(self, app, name, func, interval):
+        self.app = app
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self):
+        with self.app.app_context():
+            try:
+                self.func()
+            except Exception as e:
+                logging.error(f"Background job {self.name} failed: {e}")
+                db.session.rollback()
+            finally:
+                db.session.remove()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name=f"job-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+def register_job(app, name, func, interval):
+    """Register a periodic job; it starts with the first request of this process"""
+    job = PeriodicJob(app, name, func, interval)
+    _jobs.append(job)
+    return job
+
+
+def start_background_jobs():
+    global _started
+    with _lock:
+        if _started:
+            return
+        _started = True
+        for job in _jobs:
+            job.start()
+            logging.info(f"Started background job {job.name} (every {job.interval}s)")
+
+
+def init_app(app):
+    @app.before_request
+    def _start_jobs():
+        if not _started and app.config.get('BACKGROUND_JOBS_ENABLED', True):
+            start_background_jobs()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Delivery benchmark for the email outbox in email_outbox.py
+
+Starts a local SMTP stand-in (plain SMTP, no TLS) that waits --connect-ms
+before its greeting, which stands in for the TCP + STARTTLS + AUTH handshake
+to a real provider. It then delivers the same emails two ways:
+
+  direct  - one connection per email, as routes.send_email used to do inside
+            the request
+  outbox  - queue_email + commit in the "request", then the background sender
+            delivering batches over pooled connections
+
+It reports the time a request spends on email and the total delivery time.
+With --drop-every N the server hangs up every N messages, so the sender has
+to reconnect and retry; every email must still arrive exactly once.
+
+The stand-in also works for manual testing: run with --serve and point
+SMTP_HOST/SMTP_PORT at it with SMTP_STARTTLS=0.
+
+Usage:
+    python benchmarks/email_outbox_bench.py
+    python benchmarks/email_outbox_bench.py --emails 500 --connect-ms 150 --drop-every 40
+    python benchmarks/email_outbox_bench.py --serve --port 2525
+"""
+
+import argparse
+import gc
+import os
+import smtplib
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from database import db
+from models import EmailOutbox
+import email_outbox
+
+# models.py defines RoutineTask twice; let the shadowed class go before mappers configure
+gc.collect()
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib: EHLO/HELO, MAIL, RCPT, DATA, RSET, NOOP, QUIT"""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        server = self.server
+        time.sleep(server.connect_delay)
+        with server.lock:
+            server.connections += 1
+        self.reply('220 localhost bench SMTP')
+        accepted = 0
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip().upper()
+            if command.startswith(('EHLO', 'HELO')):
+                self.reply('250-localhost')
+                self.reply('250 8BITMIME')
+            elif command.startswith('MAIL'):
+                if server.drop_every and accepted >= server.drop_every:
+                    return  # hang up mid-session, like a provider recycling connections
+                self.reply('250 OK')
+            elif command.startswith(('RCPT', 'RSET', 'NOOP')):
+                self.reply('250 OK')
+            elif command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                while self.rfile.readline() not in (b'.\r\n', b'.\n', b''):
+                    pass
+                accepted += 1
+                with server.lock:
+                    server.messages += 1
+                self.reply('250 OK queued')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=0, connect_delay=0.0, drop_every=0):
+        super().__init__(('127.0.0.1', port), SMTPHandler)
+        self.connect_delay = connect_delay
+        self.drop_every = drop_every
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = 0
+
+    def reset(self):
+        with self.lock:
+            self.connections = self.messages = 0
+
+
+def make_app(port, args):
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'outbox.db')}",
+        SMTP_HOST='127.0.0.1', SMTP_PORT=port, SMTP_STARTTLS=False, SMTP_FROM='bench@example.com',
+        SMTP_POOL_SIZE=1, EMAIL_BATCH_SIZE=args.batch_size, EMAIL_RETRY_BASE_SECONDS=0,
+        EMAIL_MAX_ATTEMPTS=10,
+    )
+    db.init_app(app)
+    with app.app_context():
+        EmailOutbox.__table__.create(db.engine)
+    return app
+
+
+def direct(app, server, emails):
+    config = app.config
+    request_times = []
+    for i in range(emails):
+        start = time.perf_counter()
+        try:
+            with smtplib.SMTP(config['SMTP_HOST'], config['SMTP_PORT']) as smtp:
+                smtp.send_message(email_outbox.build_message(config, f'Direct {i}', 'Hello', f'user{i}@example.com'))
+        except smtplib.SMTPException:
+            pass  # the old helper logged and moved on; the email was lost
+        request_times.append(time.perf_counter() - start)
+    return request_times, sum(request_times)
+
+
+def outbox(app, server, emails):
+    request_times = []
+    began = time.perf_counter()
+    with app.app_context():
+        for i in range(emails):
+            start = time.perf_counter()
+            email_outbox.queue_email(f'Outbox {i}', 'Hello', f'user{i}@example.com')
+            db.session.commit()
+            request_times.append(time.perf_counter() - start)
+        email_outbox.send_pending()
+        email_outbox.smtp_pool.close_all()
+        counts = dict(db.session.query(EmailOutbox.status, db.func.count()).group_by(EmailOutbox.status).all())
+    return request_times, time.perf_counter() - began, counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--emails', type=int, default=200)
+    parser.add_argument('--connect-ms', type=float, default=50, help='Simulated handshake cost per connection')
+    parser.add_argument('--batch-size', type=int, default=50)
+    parser.add_argument('--drop-every', type=int, default=0, help='Server hangs up after this many messages')
+    parser.add_argument('--serve', action='store_true', help='Only run the SMTP stand-in')
+    parser.add_argument('--port', type=int, default=0)
+    args = parser.parse_args()
+
+    server = SMTPStandIn(args.port, args.connect_ms / 1000, args.drop_every)
+    port = server.server_address[1]
+    if args.serve:
+        print(f"SMTP stand-in listening on 127.0.0.1:{port}")
+        server.serve_forever()
+        return
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    app = make_app(port, args)
+
+    request_times, total = direct(app, server, args.emails)
+    print(f"direct: {server.messages}/{args.emails} delivered over {server.connections} connections "
+          f"in {total:.2f}s; request time {1000 * sum(request_times) / len(request_times):.1f}ms avg")
+    server.reset()
+
+    request_times, total, counts = outbox(app, server, args.emails)
+    print(f"outbox: {server.messages}/{args.emails} delivered over {server.connections} connections "
+          f"in {total:.2f}s; request time {1000 * sum(request_times) / len(request_times):.1f}ms avg; rows {counts}")
+    server.shutdown()
+    if server.messages != args.emails or counts.get('sent') != args.emails:
+        print("MISSING OR DUPLICATE EMAILS")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Fan-out benchmark for the live update broker in live.py
+
+Starts --subscribers streams, each a thread blocked on its subscription queue
+the way /live is, spread over --workers simulated worker processes. Every
+worker has its own Broker, and a stand-in bus plays the cross-worker backend:
+publish() hands each frame to every worker's deliver(), as a pub/sub channel
+would. It then publishes --events events in two patterns:
+
+  targeted   each event to one user's topic (a new request, an acceptance)
+  broadcast  each event to role:counsellor, which every subscriber is on
+             (a crisis chat)
+
+For each pattern it reports publish throughput and the delay from publish to
+a stream thread receiving the frame.
+
+Usage:
+    python benchmarks/live_fanout.py
+    python benchmarks/live_fanout.py --subscribers 2000 --workers 8 --events 500
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import live
+
+STOP = 'stop'
+
+
+class StandInBus:
+    """Cross-worker backend stand-in: every worker's broker sees every frame"""
+
+    def __init__(self):
+        self._workers = []
+
+    def start(self, deliver):
+        self._workers.append(deliver)
+
+    def publish(self, topic, frame):
+        for deliver in self._workers:
+            deliver(topic, frame)
+
+
+def consume(subscription, delays, lock):
+    mine = []
+    while True:
+        frame = subscription.queue.get()
+        if frame == STOP:
+            break
+        mine.append(time.perf_counter() - float(frame))
+    with lock:
+        delays.extend(mine)
+
+
+def run(pattern, args):
+    bus = StandInBus()
+    brokers = [live.Broker() for _ in range(args.workers)]
+    for broker in brokers:
+        bus.start(broker.deliver)
+    subscriptions = [
+        brokers[i % args.workers].subscribe([live.user_topic(i), live.role_topic('counsellor')], args.events + 1)
+        for i in range(args.subscribers)
+    ]
+    delays, lock = [], threading.Lock()
+    threads = [threading.Thread(target=consume, args=(s, delays, lock)) for s in subscriptions]
+    for thread in threads:
+        thread.start()
+
+    began = time.perf_counter()
+    for n in range(args.events):
+        topic = live.role_topic('counsellor') if pattern == 'broadcast' else live.user_topic(n % args.subscribers)
+        bus.publish(topic, repr(time.perf_counter()))
+        if args.rate:
+            time.sleep(1 / args.rate)
+    elapsed = time.perf_counter() - began
+    for subscription in subscriptions:
+        subscription.put(STOP)
+    for thread in threads:
+        thread.join()
+
+    ordered = sorted(delays)
+    p = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000 if ordered else 0.0
+    print(f"{pattern:<9}  {args.events} events in {elapsed * 1000:7.1f}ms ({args.events / elapsed:8.0f}/s)  "
+          f"{len(delays):7} deliveries  delay mean {statistics.mean(delays) * 1000 if delays else 0:6.2f}ms  "
+          f"p50 {p(0.5):6.2f}ms  p95 {p(0.95):6.2f}ms  max {p(1.0):6.2f}ms")
+    if any(s.overflowed for s in subscriptions):
+        print("  some subscriptions overflowed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--subscribers', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--events', type=int, default=200)
+    parser.add_argument('--rate', type=float, default=200.0, help='Events published per second (0 = flat out)')
+    args = parser.parse_args()
+
+    print(f"{args.subscribers} streams over {args.workers} workers")
+    for pattern in ('targeted', 'broadcast'):
+        run(pattern, args)
+
+
+if __name__ == '__main__':
+    main()
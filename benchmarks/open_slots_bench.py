@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Open-slot search benchmark for availability.py
+
+Builds --counsellors counsellors with two weekly rules each (weekday
+afternoons and a Saturday morning, 30 minute slots). About a fifth of the
+generated slots over the window are materialized as booked, plus a few
+hand-made slots, and then it times:
+
+  all      - every open slot of every counsellor in the next --days days
+  first N  - the earliest --limit open slots across everyone (what the
+             consultation page asks for)
+  one      - all open slots of a single counsellor
+
+Times include the two queries that load rules and concrete slots.
+
+Usage:
+    python benchmarks/open_slots_bench.py
+    python benchmarks/open_slots_bench.py --counsellors 500 --days 60
+"""
+
+import argparse
+import gc
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import insert
+from database import db
+from db_engine import configure_engine
+from models import User, AvailabilityRule, AvailabilitySlot
+import availability
+
+# models.py defines RoutineTask twice; let the shadowed class go before mappers configure
+gc.collect()
+
+
+def make_app(url):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    configure_engine(app)
+    db.init_app(app)
+    return app
+
+
+def populate(counsellors, days, now):
+    rng = random.Random(42)
+    db.create_all()
+    db.session.execute(insert(User.__table__), [
+        {'id': i, 'username': f'c{i}', 'email': f'c{i}@example.com', 'password_hash': 'x',
+         'role': 'counsellor', 'full_name': f'Counsellor {i}'}
+        for i in range(1, counsellors + 1)
+    ])
+    rules = []
+    for cid in range(1, counsellors + 1):
+        start = rng.choice((12, 13, 14)) * 60
+        rules.append({'counsellor_id': cid, 'weekdays': 0b0011111, 'start_minute': start, 'end_minute': start + 180,
+                      'slot_minutes': 30, 'valid_from': date(2000, 1, 1)})
+        rules.append({'counsellor_id': cid, 'weekdays': 0b0100000, 'start_minute': 9 * 60, 'end_minute': 12 * 60,
+                      'slot_minutes': 30, 'valid_from': date(2000, 1, 1)})
+    db.session.execute(insert(AvailabilityRule.__table__), rules)
+    db.session.commit()
+
+    window_end = now + timedelta(days=days)
+    slots = []
+    for rule in AvailabilityRule.query.all():
+        for start, end in availability.expand_rule(rule, now, window_end):
+            if rng.random() < 0.2:
+                slots.append({'counsellor_id': rule.counsellor_id, 'start_time': start, 'end_time': end,
+                              'is_booked': True, 'rule_id': rule.id})
+    for cid in range(1, counsellors + 1):
+        day = datetime.combine(now.date() + timedelta(days=rng.randrange(1, days)), datetime.min.time())
+        slots.append({'counsellor_id': cid, 'start_time': day + timedelta(hours=19),
+                      'end_time': day + timedelta(hours=20), 'is_booked': False, 'rule_id': None})
+    db.session.execute(insert(AvailabilitySlot.__table__), slots)
+    db.session.commit()
+    return len(rules), len(slots)
+
+
+def timed(func, repeat):
+    times = []
+    for _ in range(repeat):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return result, statistics.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--counsellors', type=int, default=200)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = make_app(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'slots.db')}")
+    now = datetime.utcnow().replace(second=0, microsecond=0)
+    end = now + timedelta(days=args.days)
+    with app.app_context():
+        rules, slots = populate(args.counsellors, args.days, now)
+        print(f"{args.counsellors} counsellors, {rules} rules, {slots} concrete slots, {args.days} day window")
+
+        found, ms = timed(lambda: availability.open_slots(now, end), args.repeat)
+        print(f"all:      {len(found)} open slots in {ms:.1f} ms")
+        assert all(a.start <= b.start for a, b in zip(found, found[1:]))
+
+        first, ms = timed(lambda: availability.open_slots(now, end, limit=args.limit), args.repeat)
+        print(f"first {args.limit}: {len(first)} open slots in {ms:.1f} ms")
+        assert first == found[:args.limit]
+
+        one, ms = timed(lambda: availability.open_slots(now, end, counsellor_id=1), args.repeat)
+        print(f"one:      {len(one)} open slots in {ms:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Login throughput benchmark for the password hashing pool in passwords.py
+
+Simulates one app worker with several request threads all verifying
+passwords (a login burst), inline and through pools of different sizes, and
+reports logins per second, login latency, requests rejected as busy, and the
+latency of a cheap "other request" probe running alongside.
+
+Usage:
+    python benchmarks/password_hash_bench.py
+    python benchmarks/password_hash_bench.py --logins 400 --threads 32 --pools 0,2,4,8
+    python benchmarks/password_hash_bench.py --method pbkdf2:sha256:600000
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from passwords import PasswordHasher, PasswordHasherBusy, DEFAULT_METHOD
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct))]
+
+
+def run(hasher, pwhash, logins, threads):
+    latencies, busy = [], [0]
+    remaining = [logins]
+    lock = threading.Lock()
+    done = threading.Event()
+    probe_latencies = []
+
+    def login_thread():
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            start = time.perf_counter()
+            try:
+                assert hasher.verify(pwhash, 'correct horse battery staple')
+                latencies.append(time.perf_counter() - start)
+            except PasswordHasherBusy:
+                busy[0] += 1
+
+    def probe_thread():
+        # Stands in for a cheap page render sharing the worker with the logins
+        while not done.is_set():
+            start = time.perf_counter()
+            json.dumps({'posts': [{'id': i, 'content': 'x' * 50} for i in range(50)]})
+            probe_latencies.append(time.perf_counter() - start)
+            time.sleep(0.01)
+
+    probe = threading.Thread(target=probe_thread)
+    probe.start()
+    workers = [threading.Thread(target=login_thread) for _ in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+    done.set()
+    probe.join()
+    return {
+        'logins_per_sec': len(latencies) / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000 if latencies else 0.0,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'busy': busy[0],
+        'probe_p95_ms': percentile(probe_latencies, 0.95) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=16, help='request threads in the simulated worker')
+    parser.add_argument('--pools', default='0,1,2,4', help='comma separated pool sizes; 0 = inline hashing')
+    parser.add_argument('--queue', type=int, default=None, help='max hashes in flight (default 4 x pool size)')
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--method', default=DEFAULT_METHOD)
+    args = parser.parse_args()
+
+    pwhash = PasswordHasher(method=args.method).hash('correct horse battery staple')
+    print(f"{args.logins} logins, {args.threads} request threads, method {args.method}, {os.cpu_count()} CPUs\n")
+    print(f"{'pool':>6} {'logins/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'busy':>6} {'probe p95 ms':>13}")
+    for size in (int(s) for s in args.pools.split(',')):
+        hasher = PasswordHasher(method=args.method, workers=size, max_queue=args.queue, timeout=args.timeout)
+        if size:
+            hasher.verify(pwhash, 'warm up the pool')
+        result = run(hasher, pwhash, args.logins, args.threads)
+        hasher.shutdown()
+        label = 'inline' if size == 0 else str(size)
+        print(f"{label:>6} {result['logins_per_sec']:>10.1f} {result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} "
+              f"{result['busy']:>6} {result['probe_p95_ms']:>13.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Race-free booking of counsellor availability slots.
+
+book_slot() claims the slot with one conditional UPDATE
+(... SET is_booked = true WHERE id = :id AND is_booked = false AND the slot
+is still in the future) and adds the ConsultationRequest in the same
+transaction, so the slot and the request are committed together or not at
+all. Of any number of concurrent bookings only one matches the row. On
+PostgreSQL the others block on the row lock and then re-check the condition.
+On SQLite writers are serialized, and a booking whose snapshot went stale
+retries in a fresh transaction. The unique consultation_request.slot_id
+enforces the same rule in the schema.
+
+release_slot() opens the slot again when its request is cancelled or
+rejected.
+"""
+
+from datetime import datetime
+from sqlalchemy import update
+from sqlalchemy.exc import OperationalError
+from database import db
+from models import AvailabilitySlot, ConsultationRequest
+import change_counters
+
+CLAIM_RETRIES = 3
+
+
+def _claim(slot_id, now):
+    result = db.session.execute(
+        update(AvailabilitySlot)
+        .where(AvailabilitySlot.id == slot_id, AvailabilitySlot.is_booked == False,  # noqa: E712
+               AvailabilitySlot.start_time > now)
+        .values(is_booked=True)
+    )
+    return result.rowcount == 1
+
+
+def book_slot(slot, user_id):
+    """Atomically take `slot` for `user_id`; returns the new pending request, or None if it is gone.
+
+    The caller commits (after queueing its notifications) or rolls back.
+    """
+    slot_id, now = slot.id, datetime.utcnow()
+    for attempt in range(CLAIM_RETRIES):
+        try:
+            claimed = _claim(slot_id, now)
+            break
+        except OperationalError:
+            # SQLite: another booking committed after this transaction's first read
+            db.session.rollback()
+            if attempt == CLAIM_RETRIES - 1:
+                raise
+    if not claimed:
+        return None
+    change_counters.bump(change_counters.AVAILABILITY)
+    slot = db.session.get(AvailabilitySlot, slot_id)
+    consultation = ConsultationRequest(
+        user_id=user_id,
+        counsellor_id=slot.counsellor_id,
+        slot_id=slot_id,
+        urgency_level='low',
+        time_slot=f"{slot.start_time.strftime('%d %b %Y %I:%M %p')} - {slot.end_time.strftime('%I:%M %p')}",
+        contact_preference='video',
+        additional_notes='Booked via availability slot',
+        status='pending'
+    )
+    db.session.add(consultation)
+    return consultation
+
+
+def release_slot(consultation):
+    """Reopen the slot held by a cancelled or rejected request; the caller commits"""
+    if consultation.slot_id is None:
+        return False
+    db.session.execute(
+        update(AvailabilitySlot).where(AvailabilitySlot.id == consultation.slot_id).values(is_booked=False)
+    )
+    consultation.slot_id = None
+    change_counters.bump(change_counters.AVAILABILITY)
+    return True
@@ -0,0 +1,157 @@
+"""
+Bulk student import from CSV (`flask import-students`).
+
+The file is streamed in batches of batch_size rows. Each batch is validated
+with two set-based queries (usernames and emails already taken) plus the
+names seen earlier in the file. Passwords and student ids are hashed across
+a process pool, and the batch is written with one executemany INSERT and one
+commit.
+
+Rows for an account that already exists (same username and email, emails
+compared case-insensitively) are skipped, so re-running an interrupted import
+continues where it stopped without duplicating anyone. A row whose username
+or email belongs to a different account is rejected.
+
+Columns: username, email, student_id, accommodation_type, and optionally
+full_name (defaults to the username) and password. Rows without a password
+get a random one, written to the credentials file so it can be handed out;
+without a credentials file such rows are rejected, since nobody could log in.
+"""
+
+import csv
+import os
+import secrets
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from sqlalchemy import select, insert, func, or_
+from werkzeug.security import generate_password_hash
+from database import db
+from models import User
+from passwords import hasher, pool_context
+from utils import hash_student_id
+
+REQUIRED_COLUMNS = ('username', 'email', 'student_id', 'accommodation_type')
+ACCOMMODATION_TYPES = ('hostel', 'local')
+DEFAULT_BATCH_SIZE = 1000
+
+
+def _hash_credentials(item):
+    """Runs in the pool: (password, student_id, method, salt_length) -> (password_hash, student_id_hash)"""
+    password, student_id, method, salt_length = item
+    return generate_password_hash(password, method, salt_length), hash_student_id(student_id)
+
+
+def _read_batches(stream, batch_size):
+    reader = csv.DictReader(stream)
+    missing = [c for c in REQUIRED_COLUMNS if c not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"CSV is missing columns: {', '.join(missing)}")
+    batch = []
+    for line_no, row in enumerate(reader, start=2):
+        batch.append((line_no, {k: (v or '').strip() for k, v in row.items() if k}))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _validate(batch, seen_usernames, seen_emails, require_password=False):
+    """Split a batch into (valid rows, skipped existing, rejected [(line, reason)])"""
+    usernames = {row['username'] for _, row in batch if row['username']}
+    emails = {row['email'].lower() for _, row in batch if row['email']}
+    # username -> lowercased email and back, for every account either side of a row matches
+    email_of, username_of = {}, {}
+    for username, email in db.session.execute(
+            select(User.username, func.lower(User.email))
+            .where(or_(User.username.in_(usernames), func.lower(User.email).in_(emails)))):
+        email_of[username] = email
+        username_of[email] = username
+
+    valid, skipped, rejected = [], 0, []
+    for line_no, row in batch:
+        username, email = row['username'], row['email'].lower()
+        if not username or not email or not row['student_id']:
+            rejected.append((line_no, 'username, email and student_id are required'))
+        elif '@' not in email:
+            rejected.append((line_no, f'invalid email {email}'))
+        elif row['accommodation_type'] and row['accommodation_type'] not in ACCOMMODATION_TYPES:
+            rejected.append((line_no, f"accommodation_type must be one of {', '.join(ACCOMMODATION_TYPES)}"))
+        elif email_of.get(username) == email:
+            # Imported by an earlier run (or registered already)
+            skipped += 1
+        elif username in email_of:
+            rejected.append((line_no, f'username {username} belongs to another account'))
+        elif email in username_of:
+            rejected.append((line_no, f'email {email} belongs to another account'))
+        elif username in seen_usernames or email in seen_emails:
+            rejected.append((line_no, 'duplicate username or email earlier in the file'))
+        elif require_password and not row.get('password'):
+            rejected.append((line_no, 'password is blank and generated passwords are not being recorded'))
+        else:
+            seen_usernames.add(username)
+            seen_emails.add(email)
+            row['email'] = email
+            valid.append((line_no, row))
+    return valid, skipped, rejected
+
+
+def import_students(stream, batch_size=DEFAULT_BATCH_SIZE, workers=None, credentials=None,
+                    dry_run=False, progress=None):
+    """Import students from a CSV text stream.
+
+    credentials: optional text file, opened for appending, receiving CSV rows of (username, email,
+        password) for generated passwords; rows without a password are rejected if it is None
+    progress: optional callback(rows read, imported, skipped, rejected list)
+    Returns {'read', 'imported', 'skipped', 'rejected': [(line, reason)]}.
+    """
+    workers = workers or os.cpu_count() or 1
+    totals = {'read': 0, 'imported': 0, 'skipped': 0, 'rejected': []}
+    seen_usernames, seen_emails = set(), set()
+    writer = csv.writer(credentials) if credentials is not None else None
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=pool_context()) as pool:
+        for batch in _read_batches(stream, batch_size):
+            valid, skipped, rejected = _validate(batch, seen_usernames, seen_emails,
+                                                 require_password=credentials is None and not dry_run)
+            totals['read'] += len(batch)
+            totals['skipped'] += skipped
+            totals['rejected'].extend(rejected)
+
+            if valid and not dry_run:
+                generated = {}
+                items = []
+                for line_no, row in valid:
+                    password = row.get('password')
+                    if not password:
+                        password = generated[line_no] = secrets.token_urlsafe(9)
+                    items.append((password, row['student_id'], hasher.method, hasher.salt_length))
+                hashes = pool.map(_hash_credentials, items, chunksize=max(1, len(items) // (workers * 4)))
+
+                now = datetime.utcnow()
+                db.session.execute(insert(User.__table__), [
+                    {
+                        'username': row['username'],
+                        'email': row['email'],
+                        'password_hash': password_hash,
+                        'role': 'student',
+                        'full_name': row.get('full_name') or row['username'],
+                        'student_id_hash': student_id_hash,
+                        'accommodation_type': row['accommodation_type'] or None,
+                        'created_at': now,
+                        'login_streak': 0,
+                    }
+                    for (line_no, row), (password_hash, student_id_hash) in zip(valid, hashes)
+                ])
+                # Hand-out passwords reach the disk before the commit so none can be lost
+                if generated:
+                    for line_no, row in valid:
+                        if line_no in generated:
+                            writer.writerow([row['username'], row['email'], generated[line_no]])
+                    credentials.flush()
+                    os.fsync(credentials.fileno())
+                db.session.commit()
+            totals['imported'] += len(valid)
+            if progress:
+                progress(totals['read'], totals['imported'], totals['skipped'], rejected)
+    return totals
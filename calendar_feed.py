@@ -0,0 +1,306 @@
+"""
+iCalendar (.ics) feeds of counsellor and student schedules.
+
+Each user gets a secret feed URL, so calendar clients can subscribe without
+logging in. The secret is a random token stored in calendar_feed_token,
+created the first time the link is shown; resetting the link replaces it, and
+the old URL stops working. A counsellor's feed has their
+booked sessions and follow-ups, slot bookings still awaiting an answer
+(tentative), and their open availability: one-off slots and weekly rules, the
+rules as one recurring event each. A student's feed has their own sessions
+and follow-ups. Events that ended more than CALENDAR_PAST_DAYS ago are left
+out. Times are stored as the local times counsellors enter, so events are
+written as floating local times, which calendar apps show as-is.
+
+Every user has a schedule version, the change_counter row `schedule:<id>`.
+It is bumped in the flush that changes one of their requests, slots or
+rules (account purges, whose bulk statements skip the flush, bump it
+themselves). The version and the day make the ETag, and the row's
+updated_at is Last-Modified, so a client polling every few minutes gets a
+304 after a token check and two primary-key reads.
+
+A changed feed is streamed, not built up in memory. Rows are read as plain
+columns, and each event's VEVENT text is cached under the values it is made
+from, so only the events that actually changed are rendered again.
+"""
+
+import hashlib
+import secrets
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, time
+from flask import current_app, url_for
+from sqlalchemy import event, inspect, select, update, or_, and_
+from sqlalchemy.orm import aliased
+from database import db
+from db_routing import RoutingSession
+from db_utils import insert_ignore, previous_value
+from models import (User, ConsultationRequest, AvailabilitySlot, AvailabilityRule, ChangeCounter,
+                    CalendarFeedToken)
+import change_counters
+
+PRODID = '-//MindCare//Consultation schedule//EN'
+RRULE_DAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+# Pending requests with a held slot show as tentative; other pending requests have no time yet
+LISTED_STATUSES = ('booked', 'pending')
+# Request columns that appear in a feed; changes to anything else (notes, feedback) don't bump it
+FEED_ATTRIBUTES = ('status', 'session_datetime', 'follow_up_datetime', 'chat_video_link', 'slot_id',
+                   'user_id', 'counsellor_id')
+
+
+def schedule_key(user_id):
+    return f'schedule:{user_id}'
+
+
+def bump(user_ids, conn=None):
+    """Mark these users' schedules as changed; the caller commits"""
+    for user_id in sorted({uid for uid in user_ids if uid is not None}):
+        change_counters.bump(schedule_key(user_id), conn)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _track_changes(db_session, flush_context):
+    changed = set()
+    for obj in db_session.dirty:
+        if isinstance(obj, ConsultationRequest):
+            state = inspect(obj)
+            if any(state.attrs[name].history.has_changes() for name in FEED_ATTRIBUTES):
+                changed.update((obj.user_id, obj.counsellor_id, previous_value(state, 'counsellor_id')))
+        elif isinstance(obj, (AvailabilitySlot, AvailabilityRule)):
+            if db_session.is_modified(obj, include_collections=False):
+                changed.add(obj.counsellor_id)
+    for obj in list(db_session.new) + list(db_session.deleted):
+        if isinstance(obj, ConsultationRequest):
+            changed.update((obj.user_id, obj.counsellor_id))
+        elif isinstance(obj, (AvailabilitySlot, AvailabilityRule)):
+            changed.add(obj.counsellor_id)
+    if changed:
+        bump(changed, db_session.connection())
+
+
+def _new_token():
+    return secrets.token_urlsafe(32)
+
+
+def feed_token(user_id):
+    """The user's feed token, created (and committed) the first time it is asked for"""
+    token = db.session.execute(
+        select(CalendarFeedToken.token).where(CalendarFeedToken.user_id == user_id)).scalar()
+    if token is None:
+        # Two pages loading at once both try; whichever insert lands first wins
+        insert_ignore(db.session.connection(), CalendarFeedToken.__table__,
+                      {'user_id': user_id, 'token': _new_token(), 'created_at': datetime.utcnow()})
+        db.session.commit()
+        return feed_token(user_id)
+    return token
+
+
+def reset_token(user_id):
+    """Give the user a new feed token, revoking the old URL; the caller commits"""
+    values = {'token': _new_token(), 'created_at': datetime.utcnow()}
+    if not db.session.execute(update(CalendarFeedToken).where(CalendarFeedToken.user_id == user_id)
+                              .values(**values)).rowcount:
+        insert_ignore(db.session.connection(), CalendarFeedToken.__table__, {'user_id': user_id, **values})
+
+
+def user_for_token(token):
+    """The user id a feed token belongs to, or None if it is not (or no longer) valid"""
+    return db.session.execute(
+        select(CalendarFeedToken.user_id).where(CalendarFeedToken.token == token)).scalar()
+
+
+def feed_url(user_id):
+    return url_for('calendar_ics', token=feed_token(user_id), _external=True)
+
+
+def feed_version(user_id, today=None):
+    """(etag, last_modified) for a user's feed; the ETag also rolls over daily as old events drop out"""
+    row = db.session.execute(
+        select(ChangeCounter.version, ChangeCounter.updated_at).where(ChangeCounter.key == schedule_key(user_id))
+    ).first()
+    version, updated_at = (row.version, row.updated_at) if row else (0, None)
+    today = today or datetime.utcnow().date()
+    midnight = datetime.combine(today, time())
+    etag = hashlib.sha1(f"{user_id}|{version}|{today.isoformat()}".encode()).hexdigest()
+    return etag, max(updated_at or midnight, midnight).replace(microsecond=0)
+
+
+class BlockCache:
+    """VEVENT text by the values it was rendered from, least recently used dropped first"""
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._blocks = OrderedDict()
+
+    def get(self, key, render):
+        with self._lock:
+            block = self._blocks.get(key)
+            if block is not None:
+                self._blocks.move_to_end(key)
+                return block
+        block = render()
+        with self._lock:
+            self._blocks[key] = block
+            if len(self._blocks) > self.max_size:
+                self._blocks.popitem(last=False)
+        return block
+
+
+block_cache = BlockCache()
+
+
+def _escape(text):
+    return (text or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def _fold(line):
+    """Split a content line into 75-octet pieces as RFC 5545 requires"""
+    data = line.encode()
+    if len(data) <= 75:
+        return line + '\r\n'
+    parts, start, width = [], 0, 75
+    while start < len(data):
+        end = min(start + width, len(data))
+        while end < len(data) and (data[end] & 0xC0) == 0x80:  # don't cut a UTF-8 sequence
+            end -= 1
+        parts.append(data[start:end].decode())
+        start, width = end, 74  # continuation lines start with a space
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def _stamp(value):
+    """UTC time, for DTSTAMP (created_at columns are utcnow)"""
+    return value.strftime('%Y%m%dT%H%M%SZ')
+
+
+def _local(value):
+    """Floating local time: no Z and no TZID, shown as the same wall-clock time everywhere"""
+    return value.strftime('%Y%m%dT%H%M%S')
+
+
+def _vevent(uid, stamp, start, end, summary, description='', status='CONFIRMED', rrule=None, free=False):
+    lines = ['BEGIN:VEVENT', f'UID:{uid}', f'DTSTAMP:{_stamp(stamp)}', f'DTSTART:{_local(start)}',
+             f'DTEND:{_local(end)}', f'SUMMARY:{_escape(summary)}', f'STATUS:{status}']
+    if description:
+        lines.append(f'DESCRIPTION:{_escape(description)}')
+    if rrule:
+        lines.append(f'RRULE:{rrule}')
+    if free:
+        lines.append('TRANSP:TRANSPARENT')
+    lines.append('END:VEVENT')
+    return ''.join(_fold(line) for line in lines)
+
+
+def _host():
+    return current_app.config.get('CALENDAR_UID_DOMAIN', 'mindcare')
+
+
+def _consultation_blocks(row, other_name):
+    """VEVENTs for one request row: its session (or held slot) and its follow-up"""
+    session_minutes = current_app.config.get('CALENDAR_SESSION_MINUTES', 60)
+    stamp = row.created_at or datetime(2000, 1, 1)
+    tentative = row.status != 'booked'
+    title = f"Counselling session with {other_name}"
+    if tentative:
+        title += ' (awaiting confirmation)'
+    link = f"Join: {row.chat_video_link}" if row.chat_video_link else ''
+
+    start = row.session_datetime or row.slot_start
+    if start is not None:
+        end = (row.slot_end if row.session_datetime is None and row.slot_end
+               else start + timedelta(minutes=session_minutes))
+        key = ('session', row.id, row.status, start, end, other_name, row.chat_video_link, stamp)
+        yield block_cache.get(key, lambda: _vevent(
+            f"consultation-{row.id}-session@{_host()}", stamp, start, end, title, link,
+            status='TENTATIVE' if tentative else 'CONFIRMED'))
+    if row.follow_up_datetime is not None and not tentative:
+        start = row.follow_up_datetime
+        end = start + timedelta(minutes=session_minutes)
+        key = ('follow_up', row.id, start, end, other_name, row.chat_video_link, stamp)
+        yield block_cache.get(key, lambda: _vevent(
+            f"consultation-{row.id}-follow-up@{_host()}", stamp, start, end,
+            f"Follow-up with {other_name}", link))
+
+
+def _rule_block(rule):
+    count = (rule.end_minute - rule.start_minute) // rule.slot_minutes if rule.slot_minutes > 0 else 0
+    days = [day for day in range(7) if rule.weekdays >> day & 1]
+    if not count or not days:
+        return None
+    first = rule.valid_from
+    while first.weekday() not in days:
+        first += timedelta(days=1)
+    if rule.valid_until and first > rule.valid_until:
+        return None
+    start = datetime.combine(first, time()) + timedelta(minutes=rule.start_minute)
+    end = start + timedelta(minutes=count * rule.slot_minutes)
+    rrule = f"FREQ=WEEKLY;BYDAY={','.join(RRULE_DAYS[day] for day in days)}"
+    if rule.valid_until:
+        # UNTIL has to be floating too when DTSTART is
+        rrule += f";UNTIL={_local(datetime.combine(rule.valid_until, time(23, 59, 59)))}"
+    key = ('rule', rule.id, start, end, rrule, rule.created_at)
+    return block_cache.get(key, lambda: _vevent(
+        f"availability-rule-{rule.id}@{_host()}", rule.created_at or start, start, end,
+        'Available for consultations', status='CONFIRMED', rrule=rrule, free=True))
+
+
+def generate(user_id, role, now=None):
+    """Yield the feed of `user_id` as iCalendar text, a few events at a time"""
+    now = now or datetime.utcnow()
+    since = now - timedelta(days=current_app.config.get('CALENDAR_PAST_DAYS', 90))
+    batch = current_app.config.get('CALENDAR_BATCH_SIZE', 500)
+    as_counsellor = role == 'counsellor'
+    yield (f"BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:{PRODID}\r\nCALSCALE:GREGORIAN\r\nMETHOD:PUBLISH\r\n"
+           f"X-WR-CALNAME:{'MindCare sessions' if not as_counsellor else 'MindCare schedule'}\r\n")
+
+    other = aliased(User)
+    own_column = ConsultationRequest.counsellor_id if as_counsellor else ConsultationRequest.user_id
+    other_column = ConsultationRequest.user_id if as_counsellor else ConsultationRequest.counsellor_id
+    rows = db.session.execute(
+        select(ConsultationRequest.id, ConsultationRequest.status, ConsultationRequest.session_datetime,
+               ConsultationRequest.follow_up_datetime, ConsultationRequest.chat_video_link,
+               ConsultationRequest.created_at, AvailabilitySlot.start_time.label('slot_start'),
+               AvailabilitySlot.end_time.label('slot_end'), other.full_name.label('other_name'))
+        .outerjoin(AvailabilitySlot, AvailabilitySlot.id == ConsultationRequest.slot_id)
+        .outerjoin(other, other.id == other_column)
+        .where(own_column == user_id, ConsultationRequest.status.in_(LISTED_STATUSES),
+               or_(ConsultationRequest.session_datetime >= since, ConsultationRequest.follow_up_datetime >= since,
+                   and_(ConsultationRequest.session_datetime.is_(None), AvailabilitySlot.start_time >= since)))
+        .order_by(ConsultationRequest.id)
+        .execution_options(yield_per=batch)
+    )
+    for row in rows:
+        name = row.other_name or ('your counsellor' if not as_counsellor else 'a student')
+        yield ''.join(_consultation_blocks(row, name))
+
+    if not as_counsellor:
+        yield "END:VCALENDAR\r\n"
+        return
+
+    # Open one-off slots; slots made from a rule are covered by the rule's recurring event
+    slots = db.session.execute(
+        select(AvailabilitySlot.id, AvailabilitySlot.start_time, AvailabilitySlot.end_time,
+               AvailabilitySlot.created_at)
+        .where(AvailabilitySlot.counsellor_id == user_id, AvailabilitySlot.is_booked == False,  # noqa: E712
+               AvailabilitySlot.rule_id.is_(None), AvailabilitySlot.end_time >= since)
+        .order_by(AvailabilitySlot.start_time)
+        .execution_options(yield_per=batch)
+    )
+    for slot in slots:
+        key = ('slot', slot.id, slot.start_time, slot.end_time, slot.created_at)
+        yield block_cache.get(key, lambda: _vevent(
+            f"availability-slot-{slot.id}@{_host()}", slot.created_at or slot.start_time, slot.start_time,
+            slot.end_time, 'Available for consultations', free=True))
+
+    rules = db.session.execute(
+        select(AvailabilityRule)
+        .where(AvailabilityRule.counsellor_id == user_id,
+               or_(AvailabilityRule.valid_until.is_(None), AvailabilityRule.valid_until >= since.date()))
+        .order_by(AvailabilityRule.id)
+    ).scalars()
+    for rule in rules:
+        block = _rule_block(rule)
+        if block:
+            yield block
+    yield "END:VCALENDAR\r\n"
@@ -0,0 +1,29 @@
+"""
+Version counters for cheap change detection.
+
+Code that changes a group of tables calls `bump(key)` in the same
+transaction, so the new version commits (or rolls back) together with the
+change. Readers compare `version(key)` with the one they last saw, e.g. to
+answer conditional requests with 304 Not Modified without re-running the
+query behind the response. One primary-key read per check.
+"""
+
+from datetime import datetime
+from sqlalchemy import select
+from database import db
+from db_utils import upsert_add
+from models import ChangeCounter
+
+# Availability slots and rules: anything that changes which slots are open
+AVAILABILITY = 'availability'
+
+
+def bump(key, conn=None):
+    """Increment the version of `key`; the caller commits"""
+    upsert_add(conn or db.session.connection(), ChangeCounter.__table__, {'key': key}, {'version': 1},
+               replace={'updated_at': datetime.utcnow()})
+
+
+def version(key):
+    """Current version of `key`, 0 if it never changed"""
+    return db.session.execute(select(ChangeCounter.version).where(ChangeCounter.key == key)).scalar() or 0
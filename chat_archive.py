@@ -0,0 +1,148 @@
+"""
+Cold storage for old chat messages.
+
+Sessions whose newest message is older than CHAT_ARCHIVE_AFTER_DAYS are
+closed and their messages moved out of chat_message into one ChatArchive row
+per session, holding the messages as zlib-compressed JSON. Work is done in
+batches of sessions, each its own transaction, walking session ids in order,
+so an interrupted run simply continues where the hot rows are left. The
+archiver only uses Core statements and never loads ChatSession.messages, so
+nothing pulls a whole history into the ORM session.
+
+`get_session_messages()` reads a session back from both places, so callers
+don't need to know whether it has been archived.
+"""
+
+import json
+import logging
+import zlib
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from flask import current_app
+from sqlalchemy import select, update, delete, func, bindparam
+from database import db
+from models import ChatSession, ChatMessage, ChatArchive
+import background
+
+COMPRESSION_LEVEL = 6
+# Keep IN lists well below SQLite's bound-parameter limit
+DELETE_CHUNK = 500
+
+
+def _encode(messages):
+    return zlib.compress(json.dumps(messages, separators=(',', ':')).encode(), COMPRESSION_LEVEL)
+
+
+def _decode(payload):
+    return json.loads(zlib.decompress(payload).decode())
+
+
+def _as_message(session_id, item):
+    """Archived message dict -> object with the same attributes templates use on ChatMessage"""
+    return SimpleNamespace(
+        id=item['id'],
+        session_id=session_id,
+        message_type=item['type'],
+        content=item['content'],
+        timestamp=datetime.fromisoformat(item['timestamp']) if item['timestamp'] else None,
+        crisis_keywords=item['crisis_keywords'],
+    )
+
+
+def get_session_messages(session_id):
+    """All messages of a chat session in order, archived ones first"""
+    messages = []
+    archive = db.session.get(ChatArchive, session_id)
+    if archive:
+        messages.extend(_as_message(session_id, item) for item in _decode(archive.payload))
+    messages.extend(
+        ChatMessage.query.filter_by(session_id=session_id).order_by(ChatMessage.timestamp, ChatMessage.id).all()
+    )
+    return messages
+
+
+def _archive_batch(session_ids):
+    """Move the hot messages of these sessions into their archive rows; returns messages moved"""
+    rows = db.session.execute(
+        select(ChatMessage.id, ChatMessage.session_id, ChatMessage.message_type,
+               ChatMessage.content, ChatMessage.timestamp, ChatMessage.crisis_keywords)
+        .where(ChatMessage.session_id.in_(session_ids))
+        .order_by(ChatMessage.session_id, ChatMessage.timestamp, ChatMessage.id)
+    ).all()
+    by_session = {}
+    for row in rows:
+        by_session.setdefault(row.session_id, []).append({
+            'id': row.id,
+            'type': row.message_type,
+            'content': row.content,
+            'timestamp': row.timestamp.isoformat() if row.timestamp else None,
+            'crisis_keywords': row.crisis_keywords,
+        })
+
+    existing = {a.session_id: a for a in ChatArchive.query.filter(ChatArchive.session_id.in_(list(by_session)))}
+    now = datetime.utcnow()
+    ended = []
+    for session_id, messages in by_session.items():
+        archive = existing.get(session_id)
+        if archive:
+            # Session was reopened after an earlier archive run: append to it
+            messages = _decode(archive.payload) + messages
+        else:
+            archive = ChatArchive(session_id=session_id)
+            db.session.add(archive)
+        timestamps = [m['timestamp'] for m in messages if m['timestamp']]
+        archive.payload = _encode(messages)
+        archive.message_count = len(messages)
+        archive.first_message_at = datetime.fromisoformat(min(timestamps)) if timestamps else None
+        archive.last_message_at = datetime.fromisoformat(max(timestamps)) if timestamps else None
+        archive.archived_at = now
+        ended.append({'sid': session_id, 'ended': archive.last_message_at or now})
+    db.session.flush()
+
+    moved_ids = [row.id for row in rows]
+    for i in range(0, len(moved_ids), DELETE_CHUNK):
+        db.session.execute(delete(ChatMessage).where(ChatMessage.id.in_(moved_ids[i:i + DELETE_CHUNK])))
+    # Archived sessions are closed as of their last message
+    table = ChatSession.__table__
+    db.session.connection().execute(
+        update(table).where(table.c.id == bindparam('sid'), table.c.session_end.is_(None))
+        .values(session_end=bindparam('ended')),
+        ended
+    )
+    db.session.commit()
+    return len(moved_ids)
+
+
+def archive_chat_messages(older_than_days=None, batch_size=None, progress=None):
+    """Archive sessions idle for `older_than_days`; returns (sessions, messages) archived"""
+    config = current_app.config
+    older_than_days = older_than_days or config.get('CHAT_ARCHIVE_AFTER_DAYS', 30)
+    batch_size = batch_size or config.get('CHAT_ARCHIVE_BATCH_SIZE', 200)
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+
+    sessions = messages = 0
+    last_id = 0
+    while True:
+        session_ids = db.session.execute(
+            select(ChatMessage.session_id)
+            .where(ChatMessage.session_id > last_id)
+            .group_by(ChatMessage.session_id)
+            .having(func.max(ChatMessage.timestamp) < cutoff)
+            .order_by(ChatMessage.session_id)
+            .limit(batch_size)
+        ).scalars().all()
+        if not session_ids:
+            break
+        messages += _archive_batch(session_ids)
+        sessions += len(session_ids)
+        last_id = session_ids[-1]
+        if progress:
+            progress(sessions, messages)
+    if sessions:
+        logging.info(f"Archived {messages} chat messages from {sessions} sessions")
+    return sessions, messages
+
+
+def init_app(app):
+    background.register_job(app, 'chat-archive', archive_chat_messages,
+                            app.config.get('CHAT_ARCHIVE_INTERVAL_SECONDS', 3600))
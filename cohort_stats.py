@@ -0,0 +1,105 @@
+"""
+Materialized cohort statistics for the mentor dashboard.
+
+The stats are computed with one grouped pass per source table (students,
+assessments, chat sessions) and stored as a single CohortStats row. A
+background job refreshes it every COHORT_STATS_REFRESH_SECONDS, so the page
+itself is a one-row primary key read no matter how many assessments exist.
+Until the job has stored the row, the page computes the stats itself without
+storing them: it runs on the read replica, where it must not write.
+"""
+
+import json
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import func, case
+from database import db
+from db_utils import upsert_add
+from models import User, Assessment, ChatSession, CohortStats
+import background
+
+MENTOR_STATS_KEY = 'mentor_dashboard'
+
+
+def compute_mentor_stats(now=None):
+    """Compute the mentor dashboard statistics from the source tables"""
+    now = now or datetime.utcnow()
+    month_ago = now - timedelta(days=30)
+    week_ago = now.date() - timedelta(days=7)
+
+    # Students: totals per accommodation type and weekly active users in one pass
+    student_rows = db.session.query(
+        User.accommodation_type,
+        func.count(User.id),
+        func.sum(case((User.last_streak_date >= week_ago, 1), else_=0))
+    ).filter(User.role == 'student').group_by(User.accommodation_type).all()
+    students_by_type = {acc: count for acc, count, _ in student_rows}
+    active_users = sum(active or 0 for _, _, active in student_rows)
+
+    # Assessments: recent counts by type/severity and PHQ-9 score sums per accommodation type
+    is_recent = case((Assessment.completed_at >= month_ago, 1), else_=0)
+    assessment_rows = db.session.query(
+        Assessment.assessment_type,
+        Assessment.severity_level,
+        User.accommodation_type,
+        func.sum(is_recent),
+        func.count(Assessment.id),
+        func.sum(Assessment.score)
+    ).join(User, User.id == Assessment.user_id).group_by(
+        Assessment.assessment_type, Assessment.severity_level, User.accommodation_type
+    ).all()
+
+    recent = defaultdict(int)
+    phq9 = defaultdict(lambda: [0, 0])  # accommodation_type -> [score sum, count]
+    for assessment_type, severity, accommodation, recent_count, count, score_sum in assessment_rows:
+        if recent_count:
+            recent[(assessment_type, severity)] += recent_count
+        if assessment_type == 'PHQ-9':
+            phq9[accommodation][0] += score_sum or 0
+            phq9[accommodation][1] += count
+
+    def avg_stress(accommodation):
+        score_sum, count = phq9.get(accommodation, (0, 0))
+        return round(score_sum / count, 2) if count else 0
+
+    crisis_sessions = db.session.query(func.count(ChatSession.id)).filter(
+        ChatSession.crisis_flag == True,
+        ChatSession.session_start >= month_ago
+    ).scalar() or 0
+
+    return {
+        'total_students': sum(students_by_type.values()),
+        'hostel_students': students_by_type.get('hostel', 0),
+        'local_students': students_by_type.get('local', 0),
+        'recent_assessments': [
+            {'assessment_type': assessment_type, 'severity_level': severity, 'count': count}
+            for (assessment_type, severity), count in sorted(recent.items())
+        ],
+        'crisis_sessions': crisis_sessions,
+        'active_users': active_users,
+        'hostel_avg_stress': avg_stress('hostel'),
+        'local_avg_stress': avg_stress('local'),
+    }
+
+
+def refresh_mentor_stats():
+    """Recompute the mentor stats and store them in the materialized row; returns (stats, refreshed_at)"""
+    stats, refreshed_at = compute_mentor_stats(), datetime.utcnow()
+    # Upsert, so workers refreshing at the same moment don't collide on the first insert
+    upsert_add(db.session.connection(), CohortStats.__table__, {'key': MENTOR_STATS_KEY}, {},
+               replace={'payload': json.dumps(stats), 'refreshed_at': refreshed_at})
+    db.session.commit()
+    return stats, refreshed_at
+
+
+def get_mentor_stats():
+    """Return (stats, refreshed_at) from the materialized row, or computed now if the job hasn't stored it yet"""
+    row = db.session.get(CohortStats, MENTOR_STATS_KEY)
+    if row is None:
+        return compute_mentor_stats(), datetime.utcnow()
+    return json.loads(row.payload), row.refreshed_at
+
+
+def init_app(app):
+    background.register_job(app, 'cohort-stats', refresh_mentor_stats,
+                            app.config.get('COHORT_STATS_REFRESH_SECONDS', 300))
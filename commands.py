@@ -0,0 +1,176 @@
+"""
+Maintenance commands, run with `flask --app app <command>`.
+"""
+
+import click
+from app import app
+
+
+@app.cli.command('backfill-activity')
+@click.option('--user-id', 'user_ids', type=int, multiple=True, help='Only rebuild these users (repeatable)')
+@click.option('--batch-size', default=500, show_default=True, help='Users rebuilt per transaction')
+def backfill_activity_command(user_ids, batch_size):
+    """Rebuild the daily activity rollup from meditation, assessment and task history"""
+    from activity import backfill_activity
+
+    def progress(done, total):
+        click.echo(f"  {done}/{total} users")
+
+    total = backfill_activity(user_ids=list(user_ids) or None, batch_size=batch_size, progress=progress)
+    click.echo(f"Activity rollup rebuilt for {total} users")
+
+
+@app.cli.command('rebuild-search-index')
+@click.option('--full', is_flag=True, help='Drop and re-index everything instead of only missing rows')
+@click.option('--batch-size', default=5000, show_default=True, help='Rows indexed per transaction')
+def rebuild_search_index_command(full, batch_size):
+    """Index venting posts and responses missing from the full-text index"""
+    from venting_search import rebuild_search_index
+
+    def progress(table, total):
+        click.echo(f"  {table}: {total} rows indexed")
+
+    total = rebuild_search_index(full=full, batch_size=batch_size, progress=progress)
+    click.echo(f"Search index up to date ({total} rows indexed)")
+
+
+@app.cli.command('archive-chats')
+@click.option('--older-than-days', type=int, help='Archive sessions idle this long (default CHAT_ARCHIVE_AFTER_DAYS)')
+@click.option('--batch-size', type=int, help='Sessions archived per transaction (default CHAT_ARCHIVE_BATCH_SIZE)')
+def archive_chats_command(older_than_days, batch_size):
+    """Move messages of idle chat sessions into compressed cold storage"""
+    from chat_archive import archive_chat_messages
+
+    def progress(sessions, messages):
+        click.echo(f"  {sessions} sessions, {messages} messages")
+
+    sessions, messages = archive_chat_messages(older_than_days, batch_size, progress=progress)
+    click.echo(f"Archived {messages} messages from {sessions} chat sessions")
+
+
+@app.cli.command('send-emails')
+@click.option('--batch-size', type=int, help='Emails claimed per batch (default EMAIL_BATCH_SIZE)')
+def send_emails_command(batch_size):
+    """Deliver every due email in the outbox now"""
+    from email_outbox import send_pending, smtp_pool
+
+    sent = send_pending(batch_size)
+    smtp_pool.close_all()
+    click.echo(f"Sent {sent} emails")
+
+
+@app.cli.command('run-scheduled-jobs')
+@click.option('--batch-size', type=int, help='Jobs claimed per batch (default SCHEDULER_BATCH_SIZE)')
+def run_scheduled_jobs_command(batch_size):
+    """Run every due reminder, follow-up and escalation job now"""
+    from scheduler import run_due
+
+    ran = run_due(batch_size)
+    click.echo(f"Ran {ran} scheduled jobs")
+
+
+@app.cli.command('sync-consultation-reminders')
+@click.option('--batch-size', default=500, show_default=True, help='Requests synced per transaction')
+def sync_consultation_reminders_command(batch_size):
+    """Schedule reminder and escalation jobs for every open consultation request"""
+    from consultation_reminders import sync_all
+
+    def progress(total):
+        click.echo(f"  {total} requests")
+
+    total = sync_all(batch_size, progress=progress)
+    click.echo(f"Reminder jobs in sync for {total} consultation requests")
+
+
+@app.cli.command('rebuild-consultation-counts')
+@click.option('--batch-size', default=500, show_default=True, help='Counsellors rebuilt per transaction')
+def rebuild_consultation_counts_command(batch_size):
+    """Recompute the counsellor dashboard tab counts from the consultation requests"""
+    from consultation_lists import rebuild_all
+
+    def progress(done, total):
+        click.echo(f"  {done}/{total} counsellors")
+
+    total = rebuild_all(batch_size, progress=progress)
+    click.echo(f"Consultation counts rebuilt for {total} counsellors")
+
+
+@app.cli.command('purge-users')
+@click.option('--user-id', 'user_ids', type=int, multiple=True, help='Delete these users (repeatable)')
+@click.option('--inactive-days', type=int, help='Delete users who have not logged in for this many days')
+@click.option('--role', default='student', show_default=True, help='Role considered with --inactive-days')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows deleted per transaction')
+@click.option('--yes', is_flag=True, help='Do not ask for confirmation')
+def purge_users_command(user_ids, inactive_days, role, batch_size, yes):
+    """Delete user accounts and all of their data in bounded batches"""
+    from retention import purge_user, inactive_user_ids
+
+    ids = list(user_ids)
+    if inactive_days:
+        ids += [i for i in inactive_user_ids(inactive_days, role) if i not in ids]
+    if not ids:
+        click.echo("No users to purge")
+        return
+    if not yes:
+        click.confirm(f"Permanently delete {len(ids)} users and all of their data?", abort=True)
+
+    def progress(table, total):
+        click.echo(f"  {table}: {total} rows")
+
+    for user_id in ids:
+        click.echo(f"User {user_id}:")
+        if not purge_user(user_id, batch_size=batch_size, progress=progress):
+            click.echo("  not found")
+    click.echo(f"Purged {len(ids)} users")
+
+
+@app.cli.command('purge-expired')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows deleted per transaction')
+def purge_expired_command(batch_size):
+    """Delete data older than the RETENTION_* windows"""
+    from retention import purge_expired
+
+    def progress(table, total):
+        click.echo(f"  {table}: {total} rows")
+
+    deleted = purge_expired(batch_size=batch_size, progress=progress)
+    if not deleted:
+        click.echo("No retention windows configured")
+    for category, total in deleted.items():
+        click.echo(f"{category}: {total} deleted")
+
+
+@app.cli.command('import-students')
+@click.argument('csv_file', type=click.File('r', encoding='utf-8-sig'))
+@click.option('--batch-size', default=1000, show_default=True, help='Rows validated and inserted per transaction')
+@click.option('--workers', type=int, help='Hashing processes (default: CPU count)')
+@click.option('--credentials-out', type=click.Path(dir_okay=False),
+              help='Append generated passwords here (without it, rows with a blank password are rejected)')
+@click.option('--dry-run', is_flag=True, help='Validate only, insert nothing')
+def import_students_command(csv_file, batch_size, workers, credentials_out, dry_run):
+    """Create student accounts from a CSV (username, email, student_id, accommodation_type)"""
+    import csv
+    from bulk_import import import_students
+
+    header = csv_file.readline()
+    csv_file.seek(0)
+    if 'password' not in next(csv.reader([header]), []) and not credentials_out and not dry_run:
+        raise click.UsageError('The CSV has no password column; pass --credentials-out to store generated passwords')
+
+    def progress(read, imported, skipped, rejected):
+        click.echo(f"  {read} rows read, {imported} imported, {skipped} already present")
+        for line_no, reason in rejected:
+            click.echo(f"  line {line_no}: {reason}", err=True)
+
+    credentials_file = open(credentials_out, 'a', newline='') if credentials_out else None
+    try:
+        totals = import_students(
+            csv_file, batch_size=batch_size, workers=workers, dry_run=dry_run, progress=progress,
+            credentials=credentials_file,
+        )
+    finally:
+        if credentials_file:
+            credentials_file.close()
+    verb = 'would be imported' if dry_run else 'imported'
+    click.echo(f"{totals['imported']} students {verb}, {totals['skipped']} already present, "
+               f"{len(totals['rejected'])} rejected")
@@ -0,0 +1,166 @@
+"""
+Counsellor dashboard lists, one per tab.
+
+A counsellor's requests are split into three tabs: pending, booked and
+history (rejected, cancelled, completed, ...). Each tab is read newest first
+in pages of (created_at, id) keyset order over the (counsellor_id, status,
+created_at) index, so a page costs the same however long a counsellor's
+history gets. Students are joined into the page query and their latest
+assessments come from one windowed query per page, not one lazy load per row.
+
+The tab counts live in consultation_count, one row per (counsellor, tab),
+updated in the same flush as the ConsultationRequest write, like the
+activity rollup. Bulk statements that skip the flush (matching, retention)
+call `rebuild()` or `move()` themselves. `flask rebuild-consultation-counts`
+recomputes every row from the requests table.
+"""
+
+from sqlalchemy import event, inspect, select, delete, func, case, or_, and_
+from sqlalchemy.orm import contains_eager
+from database import db
+from db_routing import RoutingSession
+from db_utils import upsert_add, previous_value
+from models import User, Assessment, ConsultationRequest, ConsultationCount
+from venting_feed import encode_cursor, decode_cursor
+
+TABS = ('pending', 'booked', 'history')
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 50
+RECENT_ASSESSMENTS = 3
+
+
+def tab_of(status):
+    """Dashboard tab a request with `status` is listed under"""
+    status = status or 'pending'
+    return status if status in ('pending', 'booked') else 'history'
+
+
+def _tab_filter(tab):
+    if tab == 'history':
+        return or_(ConsultationRequest.status.is_(None), ConsultationRequest.status.notin_(('pending', 'booked')))
+    return ConsultationRequest.status == tab
+
+
+def _entry(status, counsellor_id):
+    return (counsellor_id, tab_of(status)) if counsellor_id is not None else None
+
+
+def move(conn, old, new):
+    """Move one request between (counsellor id, tab) counts; either side may be None"""
+    if old == new:
+        return
+    if old is not None:
+        upsert_add(conn, ConsultationCount.__table__, {'counsellor_id': old[0], 'bucket': old[1]}, {'count': -1})
+    if new is not None:
+        upsert_add(conn, ConsultationCount.__table__, {'counsellor_id': new[0], 'bucket': new[1]}, {'count': 1})
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _update_counts(db_session, flush_context):
+    changes = []
+    for obj in db_session.new:
+        if isinstance(obj, ConsultationRequest):
+            changes.append((None, _entry(obj.status, obj.counsellor_id)))
+    for obj in db_session.dirty:
+        if isinstance(obj, ConsultationRequest):
+            state = inspect(obj)
+            changes.append((_entry(previous_value(state, 'status'), previous_value(state, 'counsellor_id')),
+                            _entry(obj.status, obj.counsellor_id)))
+    for obj in db_session.deleted:
+        if isinstance(obj, ConsultationRequest):
+            state = inspect(obj)
+            changes.append((_entry(previous_value(state, 'status'), previous_value(state, 'counsellor_id')), None))
+
+    changes = [(old, new) for old, new in changes if old != new]
+    if not changes:
+        return
+    conn = db_session.connection()
+    for old, new in changes:
+        move(conn, old, new)
+
+
+def rebuild(counsellor_ids):
+    """Recompute the tab counts of these counsellors from the requests table; the caller commits"""
+    counsellor_ids = list(counsellor_ids)
+    if not counsellor_ids:
+        return
+    tab = case((ConsultationRequest.status.in_(('pending', 'booked')), ConsultationRequest.status),
+               else_='history')
+    counts = {(cid, name): 0 for cid in counsellor_ids for name in TABS}
+    counts.update({
+        (cid, name): count for cid, name, count in db.session.execute(
+            select(ConsultationRequest.counsellor_id, tab, func.count())
+            .where(ConsultationRequest.counsellor_id.in_(counsellor_ids))
+            .group_by(ConsultationRequest.counsellor_id, tab)
+        )
+    })
+    conn = db.session.connection()
+    for (cid, name), count in counts.items():
+        upsert_add(conn, ConsultationCount.__table__, {'counsellor_id': cid, 'bucket': name}, {},
+                   replace={'count': count})
+
+
+def rebuild_all(batch_size=500, progress=None):
+    """Recompute the tab counts of every counsellor; returns counsellors rebuilt"""
+    ids = db.session.execute(select(User.id).where(User.role == 'counsellor').order_by(User.id)).scalars().all()
+    db.session.execute(delete(ConsultationCount).where(ConsultationCount.counsellor_id.notin_(ids)))
+    for start in range(0, len(ids), batch_size):
+        rebuild(ids[start:start + batch_size])
+        db.session.commit()
+        if progress:
+            progress(min(start + batch_size, len(ids)), len(ids))
+    db.session.commit()
+    return len(ids)
+
+
+def get_counts(counsellor_id):
+    """{tab: number of requests} for a counsellor, read from consultation_count"""
+    counts = dict(db.session.execute(
+        select(ConsultationCount.bucket, ConsultationCount.count)
+        .where(ConsultationCount.counsellor_id == counsellor_id)
+    ).all())
+    if len(counts) < len(TABS):
+        # rebuild() always writes every tab, so this counsellor was never counted (e.g. data from before the table)
+        rebuild([counsellor_id])
+        db.session.commit()
+        return get_counts(counsellor_id)
+    return {name: max(0, counts[name]) for name in TABS}
+
+
+def get_page(counsellor_id, tab, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """Return (requests, next_cursor) for one tab, newest first; next_cursor is None on the last page"""
+    limit = max(1, min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
+    query = (ConsultationRequest.query
+             .join(User, ConsultationRequest.user_id == User.id)
+             .options(contains_eager(ConsultationRequest.user))
+             .filter(ConsultationRequest.counsellor_id == counsellor_id, _tab_filter(tab)))
+    position = decode_cursor(cursor)
+    if position:
+        created_at, request_id = position
+        query = query.filter(or_(
+            ConsultationRequest.created_at < created_at,
+            and_(ConsultationRequest.created_at == created_at, ConsultationRequest.id < request_id)
+        ))
+    requests = query.order_by(ConsultationRequest.created_at.desc(), ConsultationRequest.id.desc()) \
+        .limit(limit + 1).all()
+    next_cursor = encode_cursor((requests[limit - 1].created_at, requests[limit - 1].id)) if len(requests) > limit else None
+    return requests[:limit], next_cursor
+
+
+def recent_assessments(user_ids, per_user=RECENT_ASSESSMENTS):
+    """{user id: their latest `per_user` assessments, newest first} in one query"""
+    user_ids = set(user_ids)
+    if not user_ids:
+        return {}
+    ranked = select(
+        Assessment.id,
+        func.row_number().over(partition_by=Assessment.user_id,
+                               order_by=(Assessment.completed_at.desc(), Assessment.id.desc())).label('position')
+    ).where(Assessment.user_id.in_(user_ids)).subquery()
+    rows = (Assessment.query.join(ranked, ranked.c.id == Assessment.id)
+            .filter(ranked.c.position <= per_user)
+            .order_by(Assessment.user_id, ranked.c.position).all())
+    latest = {}
+    for assessment in rows:
+        latest.setdefault(assessment.user_id, []).append(assessment)
+    return latest
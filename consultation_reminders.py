@@ -0,0 +1,127 @@
+"""
+Consultation reminders, follow-ups and escalations, run by scheduler.py.
+
+`sync()` is called whenever a consultation request changes. It schedules or
+cancels the request's jobs so they match its current state:
+
+  session_reminder    SESSION_REMINDER_HOURS before a booked session
+  follow_up_reminder  FOLLOW_UP_REMINDER_HOURS before a booked follow-up
+  pending_escalation  a request still pending PENDING_ESCALATION_HOURS after
+                      it was made (PENDING_ESCALATION_HIGH_HOURS for high urgency)
+
+Handlers re-read the request when they fire and do nothing if it moved on,
+e.g. the session was cancelled or the request was answered.
+"""
+
+from datetime import datetime, timedelta
+from flask import current_app
+from database import db
+from models import User, ConsultationRequest
+from notifications import notify
+import scheduler
+
+SESSION_REMINDER = 'session_reminder'
+FOLLOW_UP_REMINDER = 'follow_up_reminder'
+PENDING_ESCALATION = 'pending_escalation'
+JOB_KINDS = (SESSION_REMINDER, FOLLOW_UP_REMINDER, PENDING_ESCALATION)
+
+
+def _hours(name, default):
+    return timedelta(hours=current_app.config.get(name, default))
+
+
+def sync(consultation):
+    """Schedule or cancel the request's reminder jobs to match its state; the caller commits"""
+    if consultation.id is None or consultation.created_at is None:
+        db.session.flush()
+    booked = consultation.status == 'booked'
+
+    if booked and consultation.session_datetime:
+        scheduler.schedule(SESSION_REMINDER, consultation.id,
+                           consultation.session_datetime - _hours('SESSION_REMINDER_HOURS', 24))
+    else:
+        scheduler.cancel(SESSION_REMINDER, consultation.id)
+
+    if booked and consultation.follow_up_datetime:
+        scheduler.schedule(FOLLOW_UP_REMINDER, consultation.id,
+                           consultation.follow_up_datetime - _hours('FOLLOW_UP_REMINDER_HOURS', 24))
+    else:
+        scheduler.cancel(FOLLOW_UP_REMINDER, consultation.id)
+
+    if consultation.status == 'pending':
+        wait = (_hours('PENDING_ESCALATION_HIGH_HOURS', 4) if consultation.urgency_level == 'high'
+                else _hours('PENDING_ESCALATION_HOURS', 48))
+        scheduler.schedule(PENDING_ESCALATION, consultation.id, consultation.created_at + wait)
+    else:
+        scheduler.cancel(PENDING_ESCALATION, consultation.id)
+
+
+def _counsellor_name(consultation):
+    return consultation.counsellor.full_name if consultation.counsellor else 'your counsellor'
+
+
+@scheduler.handler(SESSION_REMINDER)
+def send_session_reminder(job):
+    consultation = db.session.get(ConsultationRequest, job.target_id)
+    if (consultation is None or consultation.status != 'booked' or consultation.session_datetime is None
+            or consultation.session_datetime <= datetime.utcnow()):
+        return
+    when = consultation.session_datetime.strftime('%d %b %Y, %I:%M %p')
+    link = f' Join here: {consultation.chat_video_link}' if consultation.chat_video_link else ''
+    notify(consultation.user, SESSION_REMINDER, subject='Session reminder',
+           body=f'Reminder: your session with {_counsellor_name(consultation)} is scheduled for {when} UTC.{link}',
+           urgent=True)
+    notify(consultation.counsellor, SESSION_REMINDER, subject='Session reminder',
+           body=f'Reminder: session with {consultation.user.full_name} ({consultation.user.username}) at {when} UTC.',
+           urgent=True)
+
+
+@scheduler.handler(FOLLOW_UP_REMINDER)
+def send_follow_up_reminder(job):
+    consultation = db.session.get(ConsultationRequest, job.target_id)
+    if (consultation is None or consultation.status != 'booked' or consultation.follow_up_datetime is None
+            or consultation.follow_up_datetime <= datetime.utcnow()):
+        return
+    when = consultation.follow_up_datetime.strftime('%d %b %Y, %I:%M %p')
+    notify(consultation.user, FOLLOW_UP_REMINDER, subject='Follow-up reminder',
+           body=f'Reminder: your follow-up with {_counsellor_name(consultation)} is on {when} UTC.', urgent=True)
+    notify(consultation.counsellor, FOLLOW_UP_REMINDER, subject='Follow-up reminder',
+           body=f'Reminder: follow-up with {consultation.user.full_name} ({consultation.user.username}) on {when} UTC.',
+           urgent=True)
+
+
+@scheduler.handler(PENDING_ESCALATION)
+def escalate_pending_request(job):
+    consultation = db.session.get(ConsultationRequest, job.target_id)
+    if consultation is None or consultation.status != 'pending':
+        return
+    waiting = datetime.utcnow() - consultation.created_at
+    body = (f'The {consultation.urgency_level}-urgency consultation request from {consultation.user.full_name} '
+            f'({consultation.user.username}) to {_counsellor_name(consultation)} has been waiting for a response '
+            f'for {int(waiting.total_seconds() // 3600)} hours.')
+    notify(consultation.counsellor, PENDING_ESCALATION, subject='Consultation request awaiting response',
+           body=body, urgent=True)
+    # Admins see them in their digests, or at once for high urgency
+    for admin in User.query.filter_by(role='admin'):
+        notify(admin, PENDING_ESCALATION, subject='Consultation request awaiting response', body=body,
+               urgent=consultation.urgency_level == 'high')
+
+
+def sync_all(batch_size=500, progress=None):
+    """Re-sync every open request, e.g. after deploying or restoring a backup; returns requests synced"""
+    total = 0
+    last_id = 0
+    while True:
+        batch = (ConsultationRequest.query
+                 .filter(ConsultationRequest.id > last_id, ConsultationRequest.status.in_(('pending', 'booked')))
+                 .order_by(ConsultationRequest.id).limit(batch_size).all())
+        if not batch:
+            return total
+        for consultation in batch:
+            sync(consultation)
+        db.session.commit()
+        last_id = batch[-1].id
+        total += len(batch)
+        if progress:
+            progress(total)
+        db.session.expunge_all()
@@ -0,0 +1,128 @@
+"""
+Database engine profiles.
+
+Picks SQLAlchemy engine options for the configured database. SQLite gets
+connect-time pragmas (WAL, synchronous=NORMAL, mmap, busy_timeout, cache size)
+so several gunicorn workers can share one file without "database is locked"
+stalls; Postgres gets explicit pool sizing, statement timeouts and prepared
+statement reuse.
+
+SQLITE_FOREIGN_KEYS=1 makes SQLite enforce foreign keys, and with them the
+ON DELETE CASCADE / SET NULL clauses in models.py. It is off by default:
+databases created before those clauses have plain REFERENCES constraints,
+and there is no migration rebuilding their tables yet, so enforcing them
+would make deleting a user fail instead of cascading. Account deletion goes
+through retention.purge_user, which deletes child rows itself either way.
+
+Profile selection (DB_ENGINE_PROFILE): auto (default, by URL), sqlite,
+postgres or basic (the old pre_ping/recycle-only options).
+"""
+
+import os
+import logging
+import sqlite3
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+
+# Pragmas applied to every new SQLite connection when the sqlite profile is active
+SQLITE_PRAGMAS = {}
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def sqlite_pragmas():
+    """Connect-time pragmas for the sqlite profile, overridable from the environment"""
+    return {
+        'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'busy_timeout': _env_int('SQLITE_BUSY_TIMEOUT_MS', 5000),
+        'mmap_size': _env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024),
+        # Negative cache_size is in KiB rather than pages
+        'cache_size': -_env_int('SQLITE_CACHE_SIZE_KB', 64 * 1024),
+        'temp_store': 'MEMORY',
+        # SQLite ignores ON DELETE CASCADE unless foreign keys are enforced per connection (see above)
+        'foreign_keys': 'ON' if os.environ.get('SQLITE_FOREIGN_KEYS', '0') == '1' else 'OFF',
+    }
+
+
+def resolve_profile(database_uri, profile=None):
+    """Return the profile name to use for a database URL"""
+    profile = (profile or os.environ.get('DB_ENGINE_PROFILE', 'auto')).lower()
+    if profile != 'auto':
+        return profile
+    backend = make_url(database_uri).get_backend_name()
+    if backend == 'sqlite':
+        return 'sqlite'
+    if backend == 'postgresql':
+        return 'postgres'
+    return 'basic'
+
+
+def build_engine_options(database_uri, profile=None):
+    """Build the SQLALCHEMY_ENGINE_OPTIONS dict for the selected profile"""
+    profile = resolve_profile(database_uri, profile)
+    options = {
+        'pool_pre_ping': True,
+        'pool_recycle': 300,
+    }
+
+    if profile == 'sqlite':
+        options['connect_args'] = {
+            # Let busy_timeout do the waiting instead of the driver's 5s default
+            'timeout': sqlite_pragmas()['busy_timeout'] / 1000.0,
+            'check_same_thread': False,
+        }
+    elif profile == 'postgres':
+        url = make_url(database_uri)
+        statement_timeout = _env_int('PG_STATEMENT_TIMEOUT_MS', 15000)
+        idle_timeout = _env_int('PG_IDLE_IN_TRANSACTION_TIMEOUT_MS', 60000)
+        connect_args = {
+            'options': f'-c statement_timeout={statement_timeout} '
+                       f'-c idle_in_transaction_session_timeout={idle_timeout}',
+        }
+        if url.get_driver_name() == 'psycopg':
+            # psycopg 3 prepares a statement server-side after it has run this many times
+            connect_args['prepare_threshold'] = _env_int('PG_PREPARE_THRESHOLD', 5)
+        options.update({
+            'pool_size': _env_int('DB_POOL_SIZE', 10),
+            'max_overflow': _env_int('DB_MAX_OVERFLOW', 10),
+            'pool_timeout': _env_int('DB_POOL_TIMEOUT', 30),
+            'pool_use_lifo': True,
+            # Compiled-SQL cache shared by all connections of the engine
+            'query_cache_size': _env_int('DB_QUERY_CACHE_SIZE', 1200),
+            'connect_args': connect_args,
+        })
+    return options
+
+
+def configure_engine(app):
+    """Apply the engine profile to a Flask app before db.init_app()"""
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    profile = resolve_profile(uri, app.config.get('DB_ENGINE_PROFILE'))
+    app.config['DB_ENGINE_PROFILE'] = profile
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = build_engine_options(uri, profile)
+    SQLITE_PRAGMAS.clear()
+    if profile == 'sqlite':
+        SQLITE_PRAGMAS.update(sqlite_pragmas())
+    logging.info(f"Database engine profile: {profile}")
+    return profile
+
+
+def apply_sqlite_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+@event.listens_for(Engine, "connect")
+def _on_connect(dbapi_connection, connection_record):
+    if SQLITE_PRAGMAS and isinstance(dbapi_connection, sqlite3.Connection):
+        apply_sqlite_pragmas(dbapi_connection, SQLITE_PRAGMAS)
@@ -0,0 +1,81 @@
+"""
+Read-replica routing for analytics-heavy routes.
+
+Routes decorated with @read_replica send their queries to the 'replica' bind
+(SQLALCHEMY_BINDS['replica'], set from REPLICA_DATABASE_URL) instead of the
+primary that handles chats and bookings. Without a replica configured every
+query stays on the primary.
+
+A user who wrote recently keeps reading from the primary for
+REPLICA_STICKY_SECONDS so they always see their own writes despite replica lag.
+"""
+
+import time
+from functools import wraps
+from flask import g, has_request_context, session, current_app
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+REPLICA_BIND_KEY = 'replica'
+LAST_WRITE_KEY = '_db_last_write'
+
+
+class RoutingSession(Session):
+    """Session that sends reads from @read_replica routes to the replica bind"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and _replica_requested():
+            replica = self._db.engines.get(REPLICA_BIND_KEY)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _replica_requested():
+    return has_request_context() and g.get('_db_use_replica', False)
+
+
+def recently_wrote():
+    """True if the current user wrote inside the stickiness window"""
+    last_write = session.get(LAST_WRITE_KEY)
+    if not last_write:
+        return False
+    window = current_app.config.get('REPLICA_STICKY_SECONDS', 5)
+    return time.time() - last_write < window
+
+
+def read_replica(view):
+    """Route decorator: serve this read-only view from the replica when one is configured"""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        g._db_use_replica = not recently_wrote()
+        return view(*args, **kwargs)
+    return wrapped
+
+
+def _mark_write():
+    if not has_request_context():
+        return
+    # Anything after a write in this request must read its own data
+    g._db_use_replica = False
+    g._db_wrote = True
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _on_flush(db_session, flush_context):
+    _mark_write()
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _on_execute(orm_execute_state):
+    # Bulk UPDATE/DELETE/INSERT statements bypass the flush
+    if not orm_execute_state.is_select:
+        _mark_write()
+
+
+def init_app(app):
+    @app.after_request
+    def _remember_write(response):
+        if g.get('_db_wrote'):
+            session[LAST_WRITE_KEY] = time.time()
+        return response
@@ -0,0 +1,68 @@
+"""
+Small SQL helpers shared by the rollup and counter tables, and by the
+after_flush listeners that keep them in step with the ORM.
+"""
+
+from sqlalchemy import update, insert, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects import sqlite, postgresql
+
+
+def _dialect_insert(conn, table):
+    name = conn.dialect.name
+    if name == 'sqlite':
+        return sqlite.insert(table)
+    if name == 'postgresql':
+        return postgresql.insert(table)
+    return None
+
+
+def upsert_add(conn, table, keys, increments, replace=None):
+    """Atomically add `increments` to the row identified by `keys`, creating it if missing.
+
+    keys: {column name: value} for the primary key
+    increments: {column name: amount} added to the current value
+    replace: {column name: value} overwritten when the value is not None
+    """
+    replace = {k: v for k, v in (replace or {}).items() if v is not None}
+    stmt = _dialect_insert(conn, table)
+    if stmt is not None:
+        stmt = stmt.values(**keys, **increments, **replace)
+        set_ = {name: table.c[name] + stmt.excluded[name] for name in increments}
+        set_.update({name: stmt.excluded[name] for name in replace})
+        conn.execute(stmt.on_conflict_do_update(index_elements=list(keys), set_=set_))
+        return
+
+    # Generic fallback: UPDATE first, INSERT when nothing matched
+    where = [table.c[name] == value for name, value in keys.items()]
+    values = {name: func.coalesce(table.c[name], 0) + amount for name, amount in increments.items()}
+    values.update(replace)
+    result = conn.execute(update(table).where(*where).values(**values))
+    if result.rowcount == 0:
+        conn.execute(insert(table).values(**keys, **increments, **replace))
+
+
+def insert_ignore(conn, table, values):
+    """INSERT a row unless it conflicts with an existing key; returns 1 if inserted, else 0"""
+    stmt = _dialect_insert(conn, table)
+    if stmt is not None:
+        return conn.execute(stmt.values(**values).on_conflict_do_nothing()).rowcount
+
+    # Generic fallback: savepoint so the conflict doesn't abort the outer transaction
+    try:
+        with conn.begin_nested():
+            conn.execute(insert(table).values(**values))
+        return 1
+    except IntegrityError:
+        return 0
+
+
+def previous_value(state, name):
+    """Value of attribute `name` before the flush, from an after_flush listener.
+
+    In after_flush, session.new/dirty/deleted still hold the flushed objects
+    and their attribute history is not reset yet, so the old value of a
+    changed attribute is in history.deleted.
+    """
+    history = state.attrs[name].history
+    return history.deleted[0] if history.deleted else getattr(state.object, name)
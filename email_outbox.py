@@ -0,0 +1,234 @@
+"""
+Transactional email outbox.
+
+Routes call `queue_email()` before they commit. It only adds an EmailOutbox
+row to the session, so the email is stored atomically with the change it
+announces and the request never talks to SMTP. A background job claims due
+rows in batches of EMAIL_BATCH_SIZE and delivers them over pooled, persistent
+SMTP connections: one STARTTLS + login per connection instead of per message.
+
+Claiming a row pushes its next_attempt_at forward by EMAIL_LEASE_SECONDS, so
+several workers or processes never send the same row at once, and a worker
+that dies mid-batch just lets the lease expire. Failed sends are retried with
+exponential backoff (EMAIL_RETRY_BASE_SECONDS, doubling, capped at
+EMAIL_RETRY_MAX_SECONDS) until EMAIL_MAX_ATTEMPTS. Addresses the server
+refuses are marked failed right away. Without SMTP_HOST, emails are only
+logged, as before.
+"""
+
+import logging
+import smtplib
+import ssl
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from flask import current_app
+from sqlalchemy import select, update
+from database import db
+from models import EmailOutbox
+import background
+
+# Errors that mean this message will never be accepted, so retrying is pointless
+PERMANENT_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused)
+
+
+def queue_email(subject, body, to_email, sender_type='user'):
+    """Add an email to the outbox in the current transaction; it is sent after the caller commits"""
+    if not to_email:
+        return None
+    message = EmailOutbox(subject=subject, body=body, to_email=to_email, sender_type=sender_type)
+    db.session.add(message)
+    return message
+
+
+def _from_address(config, sender_type):
+    if sender_type == 'mentor':
+        return config.get('MENTOR_EMAIL') or config.get('SMTP_USER')
+    if sender_type == 'counsellor':
+        return config.get('COUNSELLOR_EMAIL') or config.get('SMTP_USER')
+    return config.get('SMTP_FROM') or config.get('SMTP_USER')
+
+
+def build_message(config, subject, body, to_email, sender_type='user'):
+    msg = EmailMessage()
+    msg['Subject'] = subject
+    msg['From'] = _from_address(config, sender_type)
+    msg['To'] = to_email
+    msg.set_content(body)
+    return msg
+
+
+class SMTPPool:
+    """Logged-in SMTP connections kept open between batches; at most `size` in use at once"""
+
+    def __init__(self, size=2):
+        self._lock = threading.Lock()
+        self._idle = []  # (connection, last used monotonic time)
+        self.configure(size)
+
+    def configure(self, size):
+        self.size = size
+        self._slots = threading.BoundedSemaphore(max(1, size))
+
+    def _connect(self, config):
+        server = smtplib.SMTP(config['SMTP_HOST'], config.get('SMTP_PORT', 587),
+                              timeout=config.get('SMTP_TIMEOUT', 10))
+        if config.get('SMTP_STARTTLS', True):
+            server.starttls(context=ssl.create_default_context())
+        if config.get('SMTP_USER') and config.get('SMTP_PASS'):
+            server.login(config['SMTP_USER'], config['SMTP_PASS'])
+        return server
+
+    def _checkout(self, config):
+        max_idle = config.get('SMTP_IDLE_SECONDS', 60)
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                server, last_used = self._idle.pop()
+            if time.monotonic() - last_used < max_idle:
+                try:
+                    # Servers drop idle sessions; make sure this one is still there
+                    if server.noop()[0] == 250:
+                        return server
+                except (smtplib.SMTPException, OSError):
+                    pass
+            self._discard(server)
+        return self._connect(config)
+
+    def _discard(self, server):
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+
+    @contextmanager
+    def connection(self, config):
+        self._slots.acquire()
+        server = None
+        try:
+            server = self._checkout(config)
+            yield server
+        except (smtplib.SMTPServerDisconnected, OSError):
+            if server is not None:
+                server.close()
+            server = None
+            raise
+        finally:
+            if server is not None:
+                with self._lock:
+                    self._idle.append((server, time.monotonic()))
+            self._slots.release()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for server, _ in idle:
+            self._discard(server)
+
+
+smtp_pool = SMTPPool()
+
+
+def send_now(subject, body, to_email, sender_type='user'):
+    """Send one email synchronously over the pool; returns False if it was only logged or failed"""
+    config = current_app.config
+    if not (config.get('SMTP_HOST') and to_email):
+        logging.info(f"EMAIL (stub) to {to_email}: {subject} | {body}")
+        return False
+    try:
+        with smtp_pool.connection(config) as server:
+            server.send_message(build_message(config, subject, body, to_email, sender_type))
+        return True
+    except Exception as e:
+        logging.warning(f"EMAIL send failed to {to_email}: {e}. Subject: {subject}")
+        return False
+
+
+def _retry_delay(config, attempts):
+    base = config.get('EMAIL_RETRY_BASE_SECONDS', 60)
+    return min(base * 2 ** max(attempts - 1, 0), config.get('EMAIL_RETRY_MAX_SECONDS', 3600))
+
+
+def _claim(config, batch_size, now):
+    """Lease up to batch_size due rows to this worker; returns their ids"""
+    due = db.session.execute(
+        select(EmailOutbox.id)
+        .where(EmailOutbox.status == 'pending', EmailOutbox.next_attempt_at <= now)
+        .order_by(EmailOutbox.next_attempt_at, EmailOutbox.id)
+        .limit(batch_size)
+    ).scalars().all()
+    lease_until = now + timedelta(seconds=config.get('EMAIL_LEASE_SECONDS', 300))
+    claimed = []
+    for message_id in due:
+        # Conditional per row: a row another worker leased meanwhile no longer matches
+        result = db.session.execute(
+            update(EmailOutbox)
+            .where(EmailOutbox.id == message_id, EmailOutbox.status == 'pending',
+                   EmailOutbox.next_attempt_at <= now)
+            .values(next_attempt_at=lease_until, attempts=EmailOutbox.attempts + 1)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount:
+            claimed.append(message_id)
+    db.session.commit()
+    return claimed
+
+
+def send_pending(batch_size=None):
+    """Deliver due outbox rows until none are left; returns the number sent"""
+    config = current_app.config
+    batch_size = batch_size or config.get('EMAIL_BATCH_SIZE', 50)
+    total = 0
+    while True:
+        claimed = _claim(config, batch_size, datetime.utcnow())
+        if not claimed:
+            return total
+        messages = EmailOutbox.query.filter(EmailOutbox.id.in_(claimed)).order_by(EmailOutbox.id).all()
+        errors, delivered = {}, set()
+        if not config.get('SMTP_HOST'):
+            for message in messages:
+                logging.info(f"EMAIL (stub) to {message.to_email}: {message.subject} | {message.body}")
+        else:
+            try:
+                with smtp_pool.connection(config) as server:
+                    for message in messages:
+                        try:
+                            server.send_message(build_message(config, message.subject, message.body,
+                                                              message.to_email, message.sender_type))
+                            delivered.add(message.id)
+                        except PERMANENT_ERRORS as e:
+                            errors[message.id] = (True, str(e))
+                        except smtplib.SMTPResponseException as e:
+                            errors[message.id] = (False, str(e))
+            except (smtplib.SMTPException, OSError) as e:
+                # Connection-level failure: whatever was not confirmed goes back for a retry
+                logging.warning(f"SMTP connection failed: {e}")
+                for message in messages:
+                    if message.id not in delivered:
+                        errors.setdefault(message.id, (False, str(e)))
+
+        now = datetime.utcnow()
+        for message in messages:
+            error = errors.get(message.id)
+            if error is None:
+                message.status = 'sent' if config.get('SMTP_HOST') else 'logged'
+                message.sent_at = now
+                message.last_error = None
+                total += 1
+                continue
+            permanent, text = error
+            message.last_error = text
+            if permanent or message.attempts >= config.get('EMAIL_MAX_ATTEMPTS', 6):
+                message.status = 'failed'
+                logging.error(f"Giving up on email {message.id} to {message.to_email}: {text}")
+            else:
+                message.next_attempt_at = now + timedelta(seconds=_retry_delay(config, message.attempts))
+        db.session.commit()
+
+
+def init_app(app):
+    smtp_pool.configure(app.config.get('SMTP_POOL_SIZE', 2))
+    background.register_job(app, 'email-outbox', send_pending, app.config.get('EMAIL_POLL_SECONDS', 5))
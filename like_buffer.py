@@ -0,0 +1,207 @@
+"""
+Write-behind like counters for venting posts.
+
+`like()` only touches memory: it checks a per-post set of user ids that
+have already liked the post and adds new likes to a pending buffer. A
+background job flushes the buffer every LIKE_FLUSH_SECONDS. The flush records
+the likes in venting_post_like (the durable per-user dedupe) and applies one
+atomic `UPDATE venting_post SET likes = likes + n` per post, so concurrent
+likes are never lost and a burst of likes costs one write transaction.
+
+Counts shown to users are the stored count plus whatever is still pending.
+"""
+
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from flask import current_app, has_app_context
+from sqlalchemy import select, update, bindparam
+from database import db
+from db_utils import insert_ignore
+from models import VentingPost, VentingPostLike
+import background
+
+# How many posts keep their liker set in memory before the oldest is dropped
+MAX_CACHED_POSTS = 10000
+# Rough memory per id in a Python set (hash slot plus int object)
+SET_BYTES_PER_ID = 64
+
+
+class UserBitmap:
+    """Set of integer user ids: a plain set while sparse, one bit per id once that is smaller.
+
+    Most posts have a handful of likers with ids anywhere up to the newest
+    user's, so a bitmap sized by the largest id would cost max_user_id / 8
+    bytes for each of them.
+    """
+
+    __slots__ = ('ids', 'bits', 'count', 'top')
+
+    def __init__(self):
+        self.ids = set()
+        self.bits = None
+        self.count = 0
+        self.top = 0
+
+    def add(self, user_id):
+        if user_id in self:
+            return
+        self.count += 1
+        self.top = max(self.top, user_id)
+        dense = self.count * SET_BYTES_PER_ID > self.top // 8 + 1
+        if dense != (self.bits is not None):
+            self._convert(dense)
+        if self.bits is None:
+            self.ids.add(user_id)
+            return
+        byte, bit = divmod(user_id, 8)
+        if byte >= len(self.bits):
+            self.bits.extend(b'\x00' * (byte + 1 - len(self.bits)))
+        self.bits[byte] |= 1 << bit
+
+    def _convert(self, dense):
+        if dense:
+            self.bits = bytearray(self.top // 8 + 1)
+            for user_id in self.ids:
+                byte, bit = divmod(user_id, 8)
+                self.bits[byte] |= 1 << bit
+            self.ids = None
+        else:
+            self.ids = {byte * 8 + bit for byte, value in enumerate(self.bits) if value
+                        for bit in range(8) if value >> bit & 1}
+            self.bits = None
+
+    def __contains__(self, user_id):
+        if self.bits is None:
+            return user_id in self.ids
+        byte, bit = divmod(user_id, 8)
+        return byte < len(self.bits) and bool(self.bits[byte] & (1 << bit))
+
+
+class LikeBuffer:
+    def __init__(self, max_cached_posts=MAX_CACHED_POSTS):
+        self._lock = threading.Lock()
+        self._pending = {}  # post_id -> set of user ids waiting to be flushed
+        self._likers = OrderedDict()  # post_id -> UserBitmap of users known to have liked it (LRU)
+        self._max_cached_posts = max_cached_posts
+
+    def _cached_likers(self, post_id):
+        """The cached liker set of a post, or None; call with the lock held"""
+        likers = self._likers.get(post_id)
+        if likers is not None:
+            self._likers.move_to_end(post_id)
+        return likers
+
+    def _load_likers(self, post_id):
+        likers = UserBitmap()
+        for user_id in db.session.execute(
+            select(VentingPostLike.user_id).where(VentingPostLike.post_id == post_id)
+        ).scalars():
+            likers.add(user_id)
+        return likers
+
+    def _cache_likers(self, post_id, loaded):
+        """Cache a freshly loaded liker set, unless another thread got there first; call with the lock held"""
+        likers = self._cached_likers(post_id)
+        if likers is not None:
+            return likers
+        for user_id in self._pending.get(post_id, ()):
+            loaded.add(user_id)
+        self._likers[post_id] = loaded
+        if len(self._likers) > self._max_cached_posts:
+            self._likers.popitem(last=False)
+        return loaded
+
+    def like(self, post_id, user_id):
+        """Record a like; returns False if this user already liked the post"""
+        with self._lock:
+            likers = self._cached_likers(post_id)
+        if likers is None:
+            # Read outside the lock so one cold post doesn't hold up every other like. A like
+            # flushed between this read and the merge is still deduped by venting_post_like in flush().
+            loaded = self._load_likers(post_id)
+        with self._lock:
+            if likers is None:
+                likers = self._cache_likers(post_id, loaded)
+            if user_id in likers:
+                return False
+            likers.add(user_id)
+            self._pending.setdefault(post_id, set()).add(user_id)
+        if has_app_context() and not current_app.config.get('BACKGROUND_JOBS_ENABLED', True):
+            # Nothing else will flush the buffer in this process
+            self.flush()
+        return True
+
+    def pending(self, post_id):
+        with self._lock:
+            return len(self._pending.get(post_id, ()))
+
+    def get_counts(self, post_ids):
+        """Current like counts (stored + pending) for the given posts"""
+        stored = dict(db.session.execute(
+            select(VentingPost.id, VentingPost.likes).where(VentingPost.id.in_(post_ids))
+        ).all())
+        with self._lock:
+            return {post_id: (likes or 0) + len(self._pending.get(post_id, ()))
+                    for post_id, likes in stored.items()}
+
+    def discard(self, post_id):
+        """Forget a deleted post"""
+        with self._lock:
+            self._pending.pop(post_id, None)
+            self._likers.pop(post_id, None)
+
+    def flush(self):
+        """Write pending likes to the database; returns the number of likes stored"""
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return 0
+        try:
+            conn = db.session.connection()
+            existing = set(db.session.execute(
+                select(VentingPost.id).where(VentingPost.id.in_(list(batch)))
+            ).scalars())
+            now = datetime.utcnow()
+            increments = []
+            for post_id, user_ids in batch.items():
+                if post_id not in existing:
+                    continue
+                added = sum(
+                    insert_ignore(conn, VentingPostLike.__table__,
+                                  {'post_id': post_id, 'user_id': user_id, 'created_at': now})
+                    for user_id in user_ids
+                )
+                if added:
+                    increments.append({'post_id': post_id, 'n': added})
+            if increments:
+                table = VentingPost.__table__
+                conn.execute(
+                    update(table).where(table.c.id == bindparam('post_id'))
+                    .values(likes=table.c.likes + bindparam('n')),
+                    increments
+                )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            with self._lock:
+                for post_id, user_ids in batch.items():
+                    self._pending.setdefault(post_id, set()).update(user_ids)
+            raise
+        stored = sum(item['n'] for item in increments)
+        if stored:
+            logging.debug(f"Flushed {stored} likes across {len(increments)} posts")
+        return stored
+
+
+like_buffer = LikeBuffer()
+
+
+def init_app(app):
+    job = background.register_job(app, 'like-flush', like_buffer.flush,
+                                  app.config.get('LIKE_FLUSH_SECONDS', 2))
+    # Likes still in the buffer when the process exits would otherwise be lost
+    atexit.register(job.run_once)
+    app.jinja_env.globals['pending_likes'] = like_buffer.pending
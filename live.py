@@ -0,0 +1,189 @@
+"""
+Live updates for open dashboards over Server-Sent Events.
+
+Write paths call `publish(topic, event, data)` with a per-user topic
+(`user_topic()`) or a per-role one (`role_topic()`). Events wait in the
+session and go out only after the transaction commits, so nobody hears about
+a change that was rolled back. `/live` streams a logged-in user's own topic
+and their role's topic; the page shows a banner with a refresh link instead
+of counsellors and students reloading to find out whether anything changed.
+
+The in-process `broker` hands each event to every connected stream of this
+worker. Events reach it through a backend: the default LocalBackend delivers
+straight back to this process, which is all a single worker needs and what
+tests and development use. With several workers, LIVE_BACKEND names a
+"module:factory" that receives the app and returns an object with the same
+two methods, e.g. a Redis pub/sub channel whose listener thread calls
+`deliver` in every worker.
+
+Each stream has a bounded queue (LIVE_QUEUE_SIZE). A browser that falls that
+far behind is sent 'resync' and reloads, so one slow client never holds up
+the publisher. Streams end after LIVE_STREAM_SECONDS and the browser
+reconnects by itself, so long-lived connections don't pin a worker forever.
+"""
+
+import importlib
+import json
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+from flask import current_app
+from sqlalchemy import event
+from database import db
+from db_routing import RoutingSession
+
+_SESSION_KEY = 'live_events'
+
+
+def user_topic(user_id):
+    return f'user:{user_id}'
+
+
+def role_topic(role):
+    return f'role:{role}'
+
+
+def _frame(event_name, data):
+    """One SSE message, encoded once and shared by every subscriber"""
+    return f"event: {event_name}\ndata: {json.dumps(data)}\n\n"
+
+
+class Subscription:
+    """One open stream: its topics and a bounded queue of frames"""
+
+    def __init__(self, topics, queue_size):
+        self.topics = tuple(topics)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+    def put(self, frame):
+        try:
+            self.queue.put_nowait(frame)
+        except queue.Full:
+            self.overflowed = True
+
+
+class Broker:
+    """Fans frames out to this process's subscriptions by topic"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._topics = defaultdict(set)
+
+    def subscribe(self, topics, queue_size=100):
+        subscription = Subscription(topics, queue_size)
+        with self._lock:
+            for topic in subscription.topics:
+                self._topics[topic].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for topic in subscription.topics:
+                subscribers = self._topics.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._topics[topic]
+
+    def deliver(self, topic, frame):
+        """Queue `frame` for everyone subscribed to `topic`; returns how many that was"""
+        with self._lock:
+            subscribers = tuple(self._topics.get(topic, ()))
+        for subscription in subscribers:
+            subscription.put(frame)
+        return len(subscribers)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len({s for subscribers in self._topics.values() for s in subscribers})
+
+
+broker = Broker()
+
+
+class LocalBackend:
+    """Delivers to this process only; the stand-in for a cross-worker backend"""
+
+    def start(self, deliver):
+        self._deliver = deliver
+
+    def publish(self, topic, frame):
+        self._deliver(topic, frame)
+
+
+_backend = None
+
+
+def _load_backend(app):
+    path = app.config.get('LIVE_BACKEND')
+    backend = None
+    if path:
+        try:
+            module_name, _, attr = path.partition(':')
+            backend = getattr(importlib.import_module(module_name), attr or 'create_backend')(app)
+        except Exception as e:
+            logging.error(f"Could not load live backend {path}, delivering in this process only: {e}")
+    backend = backend or LocalBackend()
+    backend.start(broker.deliver)
+    return backend
+
+
+def publish(topic, event_name, data=None):
+    """Send an event to `topic` once the current transaction commits"""
+    db.session().info.setdefault(_SESSION_KEY, []).append((topic, _frame(event_name, data or {})))
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _send(db_session):
+    for topic, frame in db_session.info.pop(_SESSION_KEY, ()):
+        try:
+            if _backend is not None:
+                _backend.publish(topic, frame)
+            else:
+                broker.deliver(topic, frame)
+        except Exception as e:
+            # The change is committed either way; the page still shows it on the next load
+            logging.error(f"Live event for {topic} not sent: {e}")
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _discard(db_session):
+    db_session.info.pop(_SESSION_KEY, None)
+
+
+def stream(topics):
+    """Generator of SSE text for `topics`; subscribes now and unsubscribes when the client goes away"""
+    config = current_app.config
+    max_seconds = config.get('LIVE_STREAM_SECONDS', 300)
+    heartbeat = config.get('LIVE_HEARTBEAT_SECONDS', 20)
+    subscription = broker.subscribe(topics, config.get('LIVE_QUEUE_SIZE', 100))
+
+    def generate():
+        try:
+            yield "retry: 5000\n\n"
+            deadline = time.monotonic() + max_seconds
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    frame = subscription.queue.get(timeout=min(heartbeat, remaining))
+                except queue.Empty:
+                    # Comment line; keeps proxies from closing an idle connection
+                    frame = ": keepalive\n\n"
+                if subscription.overflowed:
+                    yield _frame('resync', {})
+                    return
+                yield frame
+        finally:
+            broker.unsubscribe(subscription)
+
+    return generate()
+
+
+def init_app(app):
+    global _backend
+    _backend = _load_backend(app)
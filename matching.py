@@ -0,0 +1,239 @@
+"""
+Load-aware counsellor matching.
+
+Students can leave the choice of counsellor to the service. Such requests
+are created unassigned and wait in an urgency priority queue: high before
+medium before low, oldest first within a level. `assign_waiting()` hands
+each one to a counsellor below MATCHING_MAX_LOAD, ranked by:
+
+  high urgency    earliest open slot first, then lightest load
+  medium / low    lightest load first, then earliest open slot
+
+A counsellor's load is their number of pending and booked requests. It is
+kept in memory by LoadCounters, which is seeded with one grouped query and
+then updated from committed flushes, so matching never runs a COUNT per
+request. Each worker re-seeds every MATCHING_RECONCILE_SECONDS, which also
+picks up changes made by other processes and by bulk statements. Requests
+nobody has capacity for stay queued until a later pass (a background job
+every MATCHING_POLL_SECONDS) finds room. Assignment is a conditional UPDATE
+(... WHERE counsellor_id IS NULL), so a request is assigned only once.
+"""
+
+import heapq
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import event, inspect, select, update, func
+from database import db
+from db_routing import RoutingSession
+from db_utils import previous_value
+from models import User, ConsultationRequest
+from notifications import notify
+from email_outbox import queue_email
+import availability
+import consultation_lists
+import live
+import background
+
+OPEN_STATUSES = ('pending', 'booked')
+URGENCY_RANK = {'high': 0, 'medium': 1, 'low': 2}
+
+_SESSION_KEY = 'matching_load_deltas'
+
+
+class LoadCounters:
+    """Open requests per counsellor, in memory"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._load = {}
+        self._seeded_at = None
+
+    def seed(self, counts):
+        with self._lock:
+            self._load = dict(counts)
+            self._seeded_at = time.monotonic()
+
+    def is_fresh(self, max_age):
+        return self._seeded_at is not None and time.monotonic() - self._seeded_at < max_age
+
+    def adjust(self, deltas):
+        with self._lock:
+            for counsellor_id, delta in deltas.items():
+                self._load[counsellor_id] = max(0, self._load.get(counsellor_id, 0) + delta)
+
+    def get(self, counsellor_id):
+        return self._load.get(counsellor_id, 0)
+
+
+load_counters = LoadCounters()
+
+
+def reconcile():
+    """Re-seed the counters from the database"""
+    rows = db.session.execute(
+        select(ConsultationRequest.counsellor_id, func.count())
+        .where(ConsultationRequest.counsellor_id.isnot(None), ConsultationRequest.status.in_(OPEN_STATUSES))
+        .group_by(ConsultationRequest.counsellor_id)
+    ).all()
+    load_counters.seed(rows)
+
+
+def _ensure_fresh():
+    if not load_counters.is_fresh(current_app.config.get('MATCHING_RECONCILE_SECONDS', 300)):
+        reconcile()
+
+
+def _open_counsellor(status, counsellor_id):
+    """The counsellor a request in this state counts against, or None"""
+    return counsellor_id if counsellor_id is not None and (status or 'pending') in OPEN_STATUSES else None
+
+
+def _record(db_session, old, new):
+    if old == new:
+        return
+    deltas = db_session.info.setdefault(_SESSION_KEY, {})
+    if old is not None:
+        deltas[old] = deltas.get(old, 0) - 1
+    if new is not None:
+        deltas[new] = deltas.get(new, 0) + 1
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _track_load(db_session, flush_context):
+    for obj in db_session.new:
+        if isinstance(obj, ConsultationRequest):
+            _record(db_session, None, _open_counsellor(obj.status, obj.counsellor_id))
+    for obj in db_session.dirty:
+        if isinstance(obj, ConsultationRequest):
+            state = inspect(obj)
+            _record(db_session,
+                    _open_counsellor(previous_value(state, 'status'), previous_value(state, 'counsellor_id')),
+                    _open_counsellor(obj.status, obj.counsellor_id))
+    for obj in db_session.deleted:
+        if isinstance(obj, ConsultationRequest):
+            state = inspect(obj)
+            _record(db_session,
+                    _open_counsellor(previous_value(state, 'status'), previous_value(state, 'counsellor_id')), None)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _apply_load(db_session):
+    deltas = db_session.info.pop(_SESSION_KEY, None)
+    if deltas:
+        load_counters.adjust(deltas)
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _discard_load(db_session):
+    db_session.info.pop(_SESSION_KEY, None)
+
+
+def choose_counsellor(urgency, loads, next_slots, capacity):
+    """Best counsellor id for a request of `urgency` among those below `capacity`, or None"""
+    candidates = [cid for cid, load in loads.items() if load < capacity]
+    if not candidates:
+        return None
+    if urgency == 'high':
+        return min(candidates, key=lambda cid: (next_slots.get(cid, datetime.max), loads[cid], cid))
+    return min(candidates, key=lambda cid: (loads[cid], next_slots.get(cid, datetime.max), cid))
+
+
+def next_open_slots(counsellor_ids, now, days):
+    """counsellor id -> start of their earliest open slot in the next `days` days"""
+    first = {}
+    for slot in availability.iter_open_slots(now, now + timedelta(days=days)):
+        if slot.counsellor_id in counsellor_ids and slot.counsellor_id not in first:
+            first[slot.counsellor_id] = slot.start
+            if len(first) == len(counsellor_ids):
+                break
+    return first
+
+
+def _assign(request_id, counsellor_id):
+    """Give a waiting request to `counsellor_id`; False if it was taken meanwhile (or there is nobody)"""
+    if counsellor_id is None:
+        return False
+    result = db.session.execute(
+        update(ConsultationRequest)
+        .where(ConsultationRequest.id == request_id, ConsultationRequest.counsellor_id.is_(None),
+               ConsultationRequest.status == 'pending')
+        .values(counsellor_id=counsellor_id)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount:
+        # Bulk statements skip the flush listeners; count the assignment ourselves
+        _record(db.session(), None, counsellor_id)
+        consultation_lists.move(db.session.connection(), None, (counsellor_id, 'pending'))
+        return True
+    return False
+
+
+def _notify_assigned(request_id):
+    # The assignment was a bulk UPDATE; reload in case the request is already in the session
+    consultation = db.session.get(ConsultationRequest, request_id, populate_existing=True)
+    counsellor, student = consultation.counsellor, consultation.user
+    notify(
+        counsellor, 'consultation_request',
+        subject='New consultation request',
+        body=f'New consultation request from {student.full_name} ({student.username}), matched to you. '
+             f'Urgency: {consultation.urgency_level}.',
+        urgent=consultation.urgency_level == 'high'
+    )
+    queue_email(
+        subject='Counsellor assigned',
+        body=f'Your consultation request has been matched with {counsellor.full_name}. '
+             f'We will notify you once they respond.',
+        to_email=student.email
+    )
+    live.publish(live.user_topic(counsellor.id), 'consultation_request', {
+        'id': consultation.id,
+        'message': f'New {consultation.urgency_level}-urgency consultation request from {student.full_name}, matched to you.'
+    })
+    live.publish(live.user_topic(student.id), 'consultation_updated', {
+        'id': consultation.id, 'status': consultation.status,
+        'message': f'Your consultation request has been matched with {counsellor.full_name}.'
+    })
+
+
+def assign_waiting(now=None):
+    """Assign queued requests, most urgent and oldest first, while counsellors have capacity; returns {id: counsellor}"""
+    config = current_app.config
+    now = now or datetime.utcnow()
+    _ensure_fresh()
+    waiting = db.session.execute(
+        select(ConsultationRequest.id, ConsultationRequest.urgency_level, ConsultationRequest.created_at)
+        .where(ConsultationRequest.counsellor_id.is_(None), ConsultationRequest.status == 'pending')
+    ).all()
+    if not waiting:
+        return {}
+    queue = [(URGENCY_RANK.get(urgency, 1), created_at or now, request_id, urgency)
+             for request_id, urgency, created_at in waiting]
+    heapq.heapify(queue)
+
+    roster = set(db.session.execute(select(User.id).where(User.role == 'counsellor')).scalars())
+    loads = {cid: load_counters.get(cid) for cid in roster}
+    capacity = config.get('MATCHING_MAX_LOAD', 10)
+    next_slots = next_open_slots(roster, now, config.get('MATCHING_SLOT_HORIZON_DAYS', 7))
+
+    assigned = {}
+    while queue:
+        _, _, request_id, urgency = heapq.heappop(queue)
+        counsellor_id = choose_counsellor(urgency, loads, next_slots, capacity)
+        if counsellor_id is None:
+            break
+        if _assign(request_id, counsellor_id):
+            loads[counsellor_id] += 1
+            assigned[request_id] = counsellor_id
+    for request_id in assigned:
+        _notify_assigned(request_id)
+    db.session.commit()
+    if assigned:
+        logging.info(f"Matched {len(assigned)} consultation requests, {len(queue)} still waiting")
+    return assigned
+
+
+def init_app(app):
+    background.register_job(app, 'counsellor-matching', assign_waiting, app.config.get('MATCHING_POLL_SECONDS', 60))
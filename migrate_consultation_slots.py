@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Database Migration Script
+Brings consultation and availability tables created before slot booking up to date:
+- consultation_request.slot_id (the availability slot a request holds), unique
+- availability_slot.rule_id (the weekly rule a slot was generated from)
+- one slot per (counsellor_id, start_time), so a generated slot is only ever stored once
+- the (counsellor_id, status, created_at) index behind the counsellor dashboard tabs
+"""
+
+import sqlite3
+import os
+
+
+def _columns(cursor, table):
+    cursor.execute(f"PRAGMA table_info({table})")
+    return [column[1] for column in cursor.fetchall()]
+
+
+def _table_exists(cursor, table):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+    return cursor.fetchone() is not None
+
+
+def add_consultation_slot(cursor):
+    """Add consultation_request.slot_id and its unique index"""
+    if 'slot_id' in _columns(cursor, 'consultation_request'):
+        print("✅ consultation_request.slot_id already exists")
+    else:
+        print("🔄 Adding slot_id column to consultation_request...")
+        cursor.execute("""
+            ALTER TABLE consultation_request
+            ADD COLUMN slot_id INTEGER REFERENCES availability_slot (id) ON DELETE SET NULL
+        """)
+    # ALTER TABLE can't add a UNIQUE column; a unique index enforces the same thing
+    cursor.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_consultation_request_slot_id
+        ON consultation_request (slot_id)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS ix_consultation_request_counsellor_status_created
+        ON consultation_request (counsellor_id, status, created_at)
+    """)
+
+
+def dedupe_slots(cursor):
+    """Remove duplicate (counsellor_id, start_time) slots, keeping the one a request holds or that is booked"""
+    held = 'slot_id' in _columns(cursor, 'consultation_request')
+    cursor.execute("""
+        SELECT counsellor_id, start_time FROM availability_slot
+        GROUP BY counsellor_id, start_time HAVING COUNT(*) > 1
+    """)
+    groups = cursor.fetchall()
+    removed = 0
+    for counsellor_id, start_time in groups:
+        cursor.execute(f"""
+            SELECT s.id,
+                   {'EXISTS (SELECT 1 FROM consultation_request c WHERE c.slot_id = s.id)' if held else '0'} AS held
+            FROM availability_slot s
+            WHERE s.counsellor_id = ? AND s.start_time = ?
+            ORDER BY held DESC, COALESCE(s.is_booked, 0) DESC, s.id
+        """, (counsellor_id, start_time))
+        duplicates = cursor.fetchall()[1:]  # the first row is kept
+        if any(is_held for _, is_held in duplicates):
+            raise RuntimeError(f"Counsellor {counsellor_id} has several slots at {start_time} held by "
+                               f"consultation requests; merge them by hand first")
+        cursor.executemany("DELETE FROM availability_slot WHERE id = ?", [(slot_id,) for slot_id, _ in duplicates])
+        removed += len(duplicates)
+    if removed:
+        print(f"🔄 Removed {removed} duplicate availability slots")
+
+
+def add_slot_rule(cursor):
+    """Add availability_slot.rule_id and the (counsellor_id, start_time) unique index"""
+    if 'rule_id' in _columns(cursor, 'availability_slot'):
+        print("✅ availability_slot.rule_id already exists")
+    else:
+        print("🔄 Adding rule_id column to availability_slot...")
+        cursor.execute("""
+            ALTER TABLE availability_slot
+            ADD COLUMN rule_id INTEGER REFERENCES availability_rule (id) ON DELETE SET NULL
+        """)
+    dedupe_slots(cursor)
+    cursor.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_availability_slot_counsellor_start
+        ON availability_slot (counsellor_id, start_time)
+    """)
+
+
+def migrate_database():
+    """Apply every step; tables that don't exist yet are created complete by the app"""
+
+    db_path = "instance/mental_health.db"
+
+    if not os.path.exists(db_path):
+        print("❌ Database file not found!")
+        return False
+
+    conn = None
+    try:
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+
+        if _table_exists(cursor, 'consultation_request'):
+            add_consultation_slot(cursor)
+        if _table_exists(cursor, 'availability_slot'):
+            add_slot_rule(cursor)
+
+        conn.commit()
+        print("✅ Migration completed successfully!")
+        return True
+
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        print(f"❌ Migration failed: {e}")
+        return False
+
+    finally:
+        if conn:
+            conn.close()
+
+
+if __name__ == "__main__":
+    print("🗃️  Database Migration Tool")
+    print("=" * 30)
+
+    success = migrate_database()
+
+    if success:
+        print("\n🎉 Migration completed! You can now run the application.")
+    else:
+        print("\n💡 Fix the problem above and run this script again; finished steps are skipped.")
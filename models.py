@@ -1,14 +1,16 @@
 from datetime import datetime, timedelta
 from database import db
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from passwords import hasher
+from sqlalchemy import update, select, case, func
+from sqlalchemy.orm.attributes import set_committed_value
 import hashlib
 import json
 
 class RoutineTask(db.Model):
     __tablename__ = 'routine_tasks'
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
     title = db.Column(db.String(100), nullable=False)
     start_time = db.Column(db.String(5), nullable=False)  # HH:MM
     end_time = db.Column(db.String(5), nullable=False)    # HH:MM
@@ -18,7 +20,7 @@ class RoutineTask(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
-    user = db.relationship('User', backref='routine_tasks')
+    user = db.relationship('User', backref=db.backref('routine_tasks', passive_deletes=True))
 
     def duration_minutes(self):
         try:
@@ -55,60 +57,93 @@ class User(UserMixin, db.Model):
     login_streak = db.Column(db.Integer, default=0)
     last_streak_date = db.Column(db.Date)
     
-    # Relationships
-    chat_sessions = db.relationship('ChatSession', backref='user', lazy=True, cascade='all, delete-orphan')
-    assessments = db.relationship('Assessment', backref='user', lazy=True, cascade='all, delete-orphan')
-    meditation_sessions = db.relationship('MeditationSession', backref='user', lazy=True, cascade='all, delete-orphan')
-    venting_posts = db.relationship('VentingPost', backref='user', lazy=True, cascade='all, delete-orphan')
+    # Relationships (child rows are left to ON DELETE CASCADE, not loaded and deleted one by one; accounts
+    # are deleted with retention.purge_user, which also works where SQLite doesn't enforce the cascades)
+    chat_sessions = db.relationship('ChatSession', backref='user', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    assessments = db.relationship('Assessment', backref='user', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    meditation_sessions = db.relationship('MeditationSession', backref='user', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    venting_posts = db.relationship('VentingPost', backref='user', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        # Runs in the password hashing pool (see passwords.py)
+        self.password_hash = hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return hasher.verify(self.password_hash, password)
+
+    def rehash_password_if_needed(self, password):
+        """Re-hash with the current KDF parameters after a successful login; True if changed"""
+        if hasher.needs_rehash(self.password_hash):
+            self.set_password(password)
+            return True
+        return False
     
     def set_student_id(self, student_id):
         # Hash student ID for privacy
         self.student_id_hash = hashlib.sha256(str(student_id).encode()).hexdigest()
     
+    @classmethod
+    def login_streak_statement(cls, user_id, now):
+        """One conditional UPDATE advancing the streak, evaluated against the row's current values"""
+        table = cls.__table__
+        today = now.date()
+        return update(table).where(table.c.id == user_id).values(
+            login_streak=case(
+                (table.c.last_streak_date == today, func.coalesce(table.c.login_streak, 0)),
+                (table.c.last_streak_date == today - timedelta(days=1), func.coalesce(table.c.login_streak, 0) + 1),
+                else_=1
+            ),
+            last_streak_date=today,
+            last_login=now,
+        )
+
     def update_login_streak(self):
-        today = datetime.utcnow().date()
-        if self.last_streak_date:
-            if self.last_streak_date == today:
-                return  # Already updated today
-            elif self.last_streak_date == today - timedelta(days=1):
-                self.login_streak += 1
-            else:
-                self.login_streak = 1
+        """Advance the login streak in the current transaction; the caller commits"""
+        now = datetime.utcnow()
+        stmt = self.login_streak_statement(self.id, now).execution_options(invalidate_user_id=self.id)
+        if db.session.get_bind().dialect.update_returning:
+            streak = db.session.execute(stmt.returning(User.__table__.c.login_streak)).scalar_one()
         else:
-            self.login_streak = 1
-        
-        self.last_streak_date = today
-        self.last_login = datetime.utcnow()
-        db.session.commit()
+            db.session.execute(stmt)
+            streak = db.session.execute(select(User.login_streak).where(User.id == self.id)).scalar_one()
+        # Keep the loaded object in step without marking it dirty
+        set_committed_value(self, 'login_streak', streak)
+        set_committed_value(self, 'last_streak_date', now.date())
+        set_committed_value(self, 'last_login', now)
+        return streak
 
 class ChatSession(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
     session_start = db.Column(db.DateTime, default=datetime.utcnow)
     session_end = db.Column(db.DateTime)
     crisis_flag = db.Column(db.Boolean, default=False)
     keywords_detected = db.Column(db.Text)  # JSON string of detected keywords
     
     # Relationship
-    messages = db.relationship('ChatMessage', backref='session', lazy=True, cascade='all, delete-orphan')
+    messages = db.relationship('ChatMessage', backref='session', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
 
 class ChatMessage(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    session_id = db.Column(db.Integer, db.ForeignKey('chat_session.id'), nullable=False)
+    session_id = db.Column(db.Integer, db.ForeignKey('chat_session.id', ondelete='CASCADE'), nullable=False, index=True)
     message_type = db.Column(db.String(10), nullable=False)  # user, bot
     content = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     crisis_keywords = db.Column(db.Text)  # JSON string of crisis keywords in this message
 
+class ChatArchive(db.Model):
+    """Messages of an old chat session moved out of chat_message (see chat_archive.py)"""
+    __tablename__ = 'chat_archive'
+    session_id = db.Column(db.Integer, db.ForeignKey('chat_session.id', ondelete='CASCADE'), primary_key=True)
+    message_count = db.Column(db.Integer, nullable=False, default=0)
+    first_message_at = db.Column(db.DateTime)
+    last_message_at = db.Column(db.DateTime)
+    payload = db.Column(db.LargeBinary, nullable=False)  # zlib-compressed JSON list of messages
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 class Assessment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
     assessment_type = db.Column(db.String(10), nullable=False)  # PHQ-9, GAD-7, GHQ
     responses = db.Column(db.Text, nullable=False)  # JSON string of responses
     score = db.Column(db.Integer, nullable=False)
@@ -119,36 +154,91 @@ class Assessment(db.Model):
 
 class MeditationSession(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
     session_type = db.Column(db.String(20), nullable=False)  # meditation, music
     duration = db.Column(db.Integer)  # in minutes
     completed_at = db.Column(db.DateTime, default=datetime.utcnow)
-    date = db.Column(db.Date, default=datetime.utcnow().date)
+    date = db.Column(db.Date, default=lambda: datetime.utcnow().date())
+
+class UserDailyActivity(db.Model):
+    """Per-user, per-day rollup of activity, kept up to date on write (see activity.py)"""
+    __tablename__ = 'user_daily_activity'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    meditation_seconds = db.Column(db.Integer, nullable=False, default=0)  # sum of MeditationSession.duration
+    session_count = db.Column(db.Integer, nullable=False, default=0)  # all MeditationSession rows
+    meditation_count = db.Column(db.Integer, nullable=False, default=0)
+    music_count = db.Column(db.Integer, nullable=False, default=0)
+    breathing_count = db.Column(db.Integer, nullable=False, default=0)
+    venting_count = db.Column(db.Integer, nullable=False, default=0)
+    mood_count = db.Column(db.Integer, nullable=False, default=0)
+    last_mood = db.Column(db.String(20))
+    tasks_completed = db.Column(db.Integer, nullable=False, default=0)
+    assessments_count = db.Column(db.Integer, nullable=False, default=0)
+
+class UserActivityTotals(db.Model):
+    """Lifetime totals per user, so all-time stats don't scan the daily rows"""
+    __tablename__ = 'user_activity_totals'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    meditation_seconds = db.Column(db.Integer, nullable=False, default=0)
+    session_count = db.Column(db.Integer, nullable=False, default=0)
+    assessments_count = db.Column(db.Integer, nullable=False, default=0)
 
 class VentingPost(db.Model):
+    __table_args__ = (
+        db.Index('ix_venting_post_created_at_id', 'created_at', 'id'),  # keyset pagination order
+    )
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
     content = db.Column(db.Text, nullable=False)
     anonymous = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     likes = db.Column(db.Integer, default=0)
     
     # Relationship
-    responses = db.relationship('VentingResponse', backref='post', lazy=True, cascade='all, delete-orphan')
+    responses = db.relationship('VentingResponse', backref='post', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+
+class VentingPostLike(db.Model):
+    """One row per (post, user) like; the durable dedupe behind the write-behind like buffer"""
+    __tablename__ = 'venting_post_like'
+    post_id = db.Column(db.Integer, db.ForeignKey('venting_post.id', ondelete='CASCADE'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class VentingResponse(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    post_id = db.Column(db.Integer, db.ForeignKey('venting_post.id'), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    post_id = db.Column(db.Integer, db.ForeignKey('venting_post.id', ondelete='CASCADE'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
     content = db.Column(db.Text, nullable=False)
     anonymous = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    user = db.relationship('User', backref='venting_responses')
+    user = db.relationship('User', backref=db.backref('venting_responses', passive_deletes=True))
+
+class ModerationFlag(db.Model):
+    """Result of scanning one venting post or response (see moderation.py)"""
+    __tablename__ = 'moderation_flag'
+    __table_args__ = (
+        db.UniqueConstraint('content_type', 'content_id', name='uq_moderation_flag_content'),
+        db.Index('ix_moderation_flag_status_score', 'status', 'score'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    content_type = db.Column(db.String(10), nullable=False)  # post, response
+    content_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    score = db.Column(db.Float, nullable=False, default=0.0)  # 0..1, higher is more concerning
+    crisis_keywords = db.Column(db.Text)  # JSON list of matched lexicon terms
+    status = db.Column(db.String(20), nullable=False, default='clear')  # clear, flagged, reviewed
+    scanned_at = db.Column(db.DateTime, default=datetime.utcnow)
+    reviewed_by = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'))
+    reviewed_at = db.Column(db.DateTime)
+
+    user = db.relationship('User', foreign_keys=[user_id])
+    reviewer = db.relationship('User', foreign_keys=[reviewed_by])
 
 class SoundVentingSession(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
     duration = db.Column(db.Integer, nullable=False)  # Session duration in seconds
     max_decibel = db.Column(db.Float)  # Maximum decibel level reached
     avg_decibel = db.Column(db.Float)  # Average decibel level
@@ -157,12 +247,16 @@ class SoundVentingSession(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     date = db.Column(db.Date, default=datetime.utcnow().date)
     
-    user = db.relationship('User', backref='sound_venting_sessions')
+    user = db.relationship('User', backref=db.backref('sound_venting_sessions', passive_deletes=True))
 
 class ConsultationRequest(db.Model):
+    __table_args__ = (
+        # Counsellor dashboard lists, one per status, newest first (see consultation_lists.py)
+        db.Index('ix_consultation_request_counsellor_status_created', 'counsellor_id', 'status', 'created_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    counsellor_id = db.Column(db.Integer, db.ForeignKey('user.id'))  # Link to counsellor
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    counsellor_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'), index=True)  # Link to counsellor
     urgency_level = db.Column(db.String(10), nullable=False)  # low, medium, high
     time_slot = db.Column(db.String(50))  # Selected time slot
     contact_preference = db.Column(db.String(20))  # phone, email, video
@@ -174,24 +268,135 @@ class ConsultationRequest(db.Model):
     feedback_text = db.Column(db.Text)  # User feedback
     chat_video_link = db.Column(db.String(256))  # Secure chat/video link
     follow_up_datetime = db.Column(db.DateTime)  # Next follow-up session
+    # Availability slot held by this request; cleared when it is cancelled or rejected (see booking.py)
+    slot_id = db.Column(db.Integer, db.ForeignKey('availability_slot.id', ondelete='SET NULL'), unique=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    user = db.relationship('User', foreign_keys=[user_id], backref=db.backref('consultation_requests', passive_deletes=True))
+    counsellor = db.relationship('User', foreign_keys=[counsellor_id], backref=db.backref('counsellor_consultations', passive_deletes=True))
+    slot = db.relationship('AvailabilitySlot')
+
+class AvailabilityRule(db.Model):
+    """Recurring weekly availability, expanded into slots on demand (see availability.py)"""
+    __tablename__ = 'availability_rule'
+    id = db.Column(db.Integer, primary_key=True)
+    counsellor_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
+    weekdays = db.Column(db.Integer, nullable=False)  # bit mask, Monday = 1
+    start_minute = db.Column(db.Integer, nullable=False)  # minutes after midnight
+    end_minute = db.Column(db.Integer, nullable=False)
+    slot_minutes = db.Column(db.Integer, nullable=False, default=30)
+    valid_from = db.Column(db.Date, nullable=False)
+    valid_until = db.Column(db.Date)  # inclusive; open-ended when empty
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-    user = db.relationship('User', foreign_keys=[user_id], backref='consultation_requests')
-    counsellor = db.relationship('User', foreign_keys=[counsellor_id], backref='counsellor_consultations')
+    counsellor = db.relationship('User', backref=db.backref('availability_rules', passive_deletes=True))
+
+    def weekday_numbers(self):
+        """Days of the week the rule applies to, Monday = 0"""
+        return [day for day in range(7) if self.weekdays >> day & 1]
 
 class AvailabilitySlot(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('counsellor_id', 'start_time', name='uq_availability_slot_counsellor_start'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    counsellor_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    start_time = db.Column(db.DateTime, nullable=False)
+    counsellor_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False, index=True)
     end_time = db.Column(db.DateTime, nullable=False)
     is_booked = db.Column(db.Boolean, default=False)
+    # Set when the slot was materialized from a recurring rule to be booked
+    rule_id = db.Column(db.Integer, db.ForeignKey('availability_rule.id', ondelete='SET NULL'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-    counsellor = db.relationship('User', foreign_keys=[counsellor_id], backref='availability_slots')
+    counsellor = db.relationship('User', foreign_keys=[counsellor_id], backref=db.backref('availability_slots', passive_deletes=True))
+
+class EmailOutbox(db.Model):
+    """Queued outgoing email, written in the sender's transaction and delivered by email_outbox.py"""
+    __tablename__ = 'email_outbox'
+    __table_args__ = (
+        db.Index('ix_email_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    to_email = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(200), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    sender_type = db.Column(db.String(20), nullable=False, default='user')  # user, mentor, counsellor
+    status = db.Column(db.String(10), nullable=False, default='pending')  # pending, sent, logged, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # also the claim lease
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+class NotificationPreference(db.Model):
+    """How often a user receives non-urgent notification emails (see notifications.py)"""
+    __tablename__ = 'notification_preference'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    digest_window = db.Column(db.String(10), nullable=False, default='hourly')  # immediate, hourly, daily, off
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class PendingNotification(db.Model):
+    """Buffered non-urgent notification waiting for the recipient's next digest"""
+    __tablename__ = 'pending_notification'
+    __table_args__ = (
+        db.Index('ix_pending_notification_user_created', 'user_id', 'created_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    kind = db.Column(db.String(40), nullable=False)
+    subject = db.Column(db.String(200), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class CohortStats(db.Model):
+    """Materialized cohort statistics, refreshed by a background job (see cohort_stats.py)"""
+    __tablename__ = 'cohort_stats'
+    key = db.Column(db.String(50), primary_key=True)
+    payload = db.Column(db.Text, nullable=False)  # JSON string of the computed stats
+    refreshed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class ScheduledJob(db.Model):
+    """One-off job due at a point in time, run by scheduler.py; one row per (kind, target)"""
+    __tablename__ = 'scheduled_job'
+    __table_args__ = (
+        db.UniqueConstraint('kind', 'target_id', name='uq_scheduled_job_kind_target'),
+        db.Index('ix_scheduled_job_status_due', 'status', 'due_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(40), nullable=False)
+    target_id = db.Column(db.Integer, nullable=False)  # e.g. the consultation_request id
+    due_at = db.Column(db.DateTime, nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='pending')  # pending, done, cancelled, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    locked_until = db.Column(db.DateTime)  # lease of the worker running it, or the next retry
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    done_at = db.Column(db.DateTime)
+
+class ChangeCounter(db.Model):
+    """Version number bumped whenever a group of tables changes (see change_counters.py)"""
+    __tablename__ = 'change_counter'
+    key = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class CalendarFeedToken(db.Model):
+    """Secret in a user's calendar feed URL; replaced when they reset the link (see calendar_feed.py)"""
+    __tablename__ = 'calendar_feed_token'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    token = db.Column(db.String(64), unique=True, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class ConsultationCount(db.Model):
+    """Consultation requests per counsellor and dashboard tab (see consultation_lists.py)"""
+    __tablename__ = 'consultation_count'
+    counsellor_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    bucket = db.Column(db.String(10), primary_key=True)  # pending, booked, history
+    count = db.Column(db.Integer, nullable=False, default=0)
 
 class RoutineTask(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
     title = db.Column(db.String(100), nullable=False)
     start_time = db.Column(db.String(5), nullable=False) # HH:MM
     end_time = db.Column(db.String(5), nullable=False)   # HH:MM
@@ -201,7 +406,7 @@ class RoutineTask(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
-    user = db.relationship('User', backref='routine_tasks')
+    user = db.relationship('User', backref=db.backref('routine_tasks', passive_deletes=True))
 
     def __repr__(self):
         return f"<RoutineTask {self.id}: {self.title} ({self.start_time}-{self.end_time})>"
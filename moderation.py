@@ -0,0 +1,247 @@
+"""
+Asynchronous moderation and crisis scanning for the venting hall.
+
+`enqueue()` is called after a post or response is committed and only puts
+(content_type, id) on a bounded in-memory queue, so posting never waits on
+scanning. MODERATION_WORKERS background jobs drain the queue in batches of
+MODERATION_BATCH_SIZE: each batch loads its content with one IN query per
+content type, scores it against the crisis lexicon (and the optional
+MODERATION_CLASSIFIER), and writes one ModerationFlag row per item. Items at
+or above MODERATION_FLAG_THRESHOLD are flagged for counsellors.
+
+Every scanned item gets a row, flagged or not, so a sweep job can find
+content that was never scanned (queue overflow, worker restart) and requeue
+it; the pipeline always catches up.
+"""
+
+import importlib
+import json
+import logging
+import queue
+import re
+from datetime import datetime
+from flask import current_app, has_app_context
+from sqlalchemy import select, and_
+from sqlalchemy.orm import joinedload
+from database import db
+from db_utils import insert_ignore
+from gemini_service import CRISIS_KEYWORDS
+from models import VentingPost, VentingResponse, ModerationFlag
+import background
+
+CONTENT_MODELS = {
+    'post': VentingPost,
+    'response': VentingResponse,
+}
+
+# Lexicon terms that indicate immediate risk on their own; the rest only in combination
+SEVERE_KEYWORDS = {
+    'suicide', 'kill myself', 'end my life', 'want to die', 'death wish',
+    'self harm', 'cut myself', 'hurt myself', 'overdose', 'jump off',
+    'end it all', 'better off dead', 'marna hai', 'jaan deni hai',
+}
+SEVERE_WEIGHT = 0.9
+DEFAULT_WEIGHT = 0.4
+# Added per extra distinct term, so several milder terms together still get flagged
+EXTRA_TERM_WEIGHT = 0.15
+
+MAX_QUEUE_SIZE = 10000
+
+_queue = queue.Queue(maxsize=MAX_QUEUE_SIZE)
+# Longest first so "end my life" wins over any shorter overlapping term
+_lexicon_re = re.compile(
+    r'(?<!\w)(?:' + '|'.join(re.escape(k) for k in sorted(CRISIS_KEYWORDS, key=len, reverse=True)) + r')(?!\w)',
+    re.IGNORECASE
+)
+_classifier = None
+_classifier_path = None
+
+
+def score_text(text):
+    """Score text against the crisis lexicon; returns (score, matched keywords)"""
+    matched = sorted({m.group(0).lower() for m in _lexicon_re.finditer(text or '')})
+    if not matched:
+        return 0.0, []
+    top = max(SEVERE_WEIGHT if k in SEVERE_KEYWORDS else DEFAULT_WEIGHT for k in matched)
+    return min(1.0, top + EXTRA_TERM_WEIGHT * (len(matched) - 1)), matched
+
+
+def _load_classifier():
+    """Optional local classifier from MODERATION_CLASSIFIER ("module:function").
+
+    The function receives a list of texts and returns one score in 0..1 per text.
+    """
+    global _classifier, _classifier_path
+    path = current_app.config.get('MODERATION_CLASSIFIER')
+    if path != _classifier_path:
+        _classifier_path = path
+        _classifier = None
+        if path:
+            try:
+                module_name, _, attr = path.partition(':')
+                _classifier = getattr(importlib.import_module(module_name), attr or 'classify')
+            except Exception as e:
+                logging.error(f"Could not load moderation classifier {path}: {e}")
+    return _classifier
+
+
+def _classify(texts):
+    classifier = _load_classifier()
+    if not classifier:
+        return [0.0] * len(texts)
+    try:
+        return [float(score) for score in classifier(texts)]
+    except Exception as e:
+        logging.error(f"Moderation classifier failed, using lexicon scores only: {e}")
+        return [0.0] * len(texts)
+
+
+def enqueue(content_type, content_id):
+    """Queue content for scanning; never blocks the request"""
+    try:
+        _queue.put_nowait((content_type, content_id))
+    except queue.Full:
+        # Picked up by the next sweep
+        logging.warning(f"Moderation queue full, deferring {content_type} {content_id}")
+        return
+    if has_app_context() and not current_app.config.get('BACKGROUND_JOBS_ENABLED', True):
+        # No workers in this process
+        drain()
+
+
+def scan_batch(items):
+    """Scan (content_type, content_id) pairs and record the results; returns the number flagged"""
+    ids = {}
+    for content_type, content_id in items:
+        if content_type in CONTENT_MODELS:
+            ids.setdefault(content_type, set()).add(content_id)
+    rows = []
+    for content_type, content_ids in ids.items():
+        model = CONTENT_MODELS[content_type]
+        rows.extend(
+            (content_type, row.id, row.user_id, row.content)
+            for row in db.session.execute(
+                select(model.id, model.user_id, model.content).where(model.id.in_(content_ids))
+            )
+        )
+    if not rows:
+        return 0
+
+    threshold = current_app.config.get('MODERATION_FLAG_THRESHOLD', 0.5)
+    model_scores = _classify([content for *_, content in rows])
+    conn = db.session.connection()
+    now = datetime.utcnow()
+    flagged = 0
+    for (content_type, content_id, user_id, content), model_score in zip(rows, model_scores):
+        lexicon_score, keywords = score_text(content)
+        score = max(lexicon_score, model_score)
+        status = 'flagged' if score >= threshold else 'clear'
+        inserted = insert_ignore(conn, ModerationFlag.__table__, {
+            'content_type': content_type,
+            'content_id': content_id,
+            'user_id': user_id,
+            'score': score,
+            'crisis_keywords': json.dumps(keywords),
+            'status': status,
+            'scanned_at': now,
+        })
+        if inserted and status == 'flagged':
+            flagged += 1
+    db.session.commit()
+    if flagged:
+        logging.info(f"Moderation flagged {flagged} of {len(rows)} scanned items")
+    return flagged
+
+
+def drain():
+    """Scan queued content in batches until the queue is empty"""
+    batch_size = current_app.config.get('MODERATION_BATCH_SIZE', 100)
+    while True:
+        items = []
+        try:
+            while len(items) < batch_size:
+                items.append(_queue.get_nowait())
+        except queue.Empty:
+            pass
+        if not items:
+            return
+        scan_batch(items)
+
+
+def sweep(limit=1000):
+    """Requeue content that has no moderation result yet"""
+    if not _queue.empty():
+        # Workers are still busy; don't queue the same items twice
+        return 0
+    queued = 0
+    for content_type, model in CONTENT_MODELS.items():
+        missing = db.session.execute(
+            select(model.id)
+            .outerjoin(ModerationFlag, and_(ModerationFlag.content_type == content_type,
+                                            ModerationFlag.content_id == model.id))
+            .where(ModerationFlag.id.is_(None))
+            .order_by(model.id)
+            .limit(limit)
+        ).scalars().all()
+        for content_id in missing:
+            try:
+                _queue.put_nowait((content_type, content_id))
+            except queue.Full:
+                return queued
+            queued += 1
+    return queued
+
+
+def get_open_flags(limit=20):
+    """Flagged items awaiting review, most concerning first, with their content attached"""
+    flags = ModerationFlag.query.options(joinedload(ModerationFlag.user)).filter_by(status='flagged').order_by(
+        ModerationFlag.score.desc(), ModerationFlag.scanned_at.desc()
+    ).limit(limit).all()
+    contents = {}
+    for content_type, model in CONTENT_MODELS.items():
+        content_ids = [f.content_id for f in flags if f.content_type == content_type]
+        if content_ids:
+            for item in model.query.filter(model.id.in_(content_ids)):
+                contents[(content_type, item.id)] = item
+    results = []
+    for flag in flags:
+        item = contents.get((flag.content_type, flag.content_id))
+        if item is None:
+            continue
+        results.append({
+            'flag': flag,
+            'content': item.content,
+            'anonymous': item.anonymous,
+            'created_at': item.created_at,
+            'keywords': json.loads(flag.crisis_keywords or '[]'),
+        })
+    return results
+
+
+def mark_reviewed(flag_id, reviewer_id):
+    """Mark a flag as handled; returns False if it does not exist"""
+    flag = ModerationFlag.query.get(flag_id)
+    if not flag:
+        return False
+    flag.status = 'reviewed'
+    flag.reviewed_by = reviewer_id
+    flag.reviewed_at = datetime.utcnow()
+    db.session.commit()
+    return True
+
+
+def delete_flags(content_type, content_ids):
+    """Drop moderation results for deleted content (caller commits)"""
+    if content_ids:
+        ModerationFlag.query.filter(
+            ModerationFlag.content_type == content_type,
+            ModerationFlag.content_id.in_(list(content_ids))
+        ).delete(synchronize_session=False)
+
+
+def init_app(app):
+    interval = app.config.get('MODERATION_POLL_SECONDS', 2)
+    for n in range(max(1, app.config.get('MODERATION_WORKERS', 1))):
+        background.register_job(app, f'moderation-{n + 1}', drain, interval)
+    background.register_job(app, 'moderation-sweep', sweep,
+                            app.config.get('MODERATION_SWEEP_SECONDS', 300))
@@ -0,0 +1,132 @@
+"""
+Notification digests.
+
+Routine notifications used to be one email each: every completed meditation,
+and every new consultation request, booking or shared assessment for a
+counsellor. `notify()` now buffers them per recipient in PendingNotification,
+in the caller's transaction. A background job folds each recipient's buffer
+into one digest email once their window has passed, counted from the oldest
+buffered item. The window comes from the user's NotificationPreference:
+hourly or daily digests, immediate emails, or routine emails switched off.
+Users without a preference get NOTIFY_DEFAULT_WINDOW.
+
+Urgent notifications (high-urgency consultation requests, severe assessment
+results) skip the buffer and go to the outbox right away, whatever the
+preference.
+"""
+
+import logging
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, delete, func
+from database import db
+from models import User, NotificationPreference, PendingNotification
+from email_outbox import queue_email
+import background
+
+# Window name -> seconds between digests
+DIGEST_WINDOWS = {'immediate': 0, 'hourly': 3600, 'daily': 86400, 'off': 0}
+
+# Assessment severities that reach the counsellor immediately
+URGENT_SEVERITIES = ('Severe', 'Moderately Severe', 'Very Poor')
+
+KIND_LABELS = {
+    'meditation_completed': 'Meditation',
+    'consultation_request': 'Consultation requests',
+    'slot_booked': 'Slot bookings',
+    'assessment_shared': 'Shared assessments',
+    'session_reminder': 'Session reminders',
+    'follow_up_reminder': 'Follow-up reminders',
+    'pending_escalation': 'Requests awaiting a response',
+}
+
+
+def get_window(user_id):
+    pref = db.session.get(NotificationPreference, user_id)
+    if pref is not None:
+        return pref.digest_window
+    return current_app.config.get('NOTIFY_DEFAULT_WINDOW', 'hourly')
+
+
+def set_window(user_id, window):
+    """Store a user's digest window; the caller commits"""
+    if window not in DIGEST_WINDOWS:
+        raise ValueError(f"Unknown digest window {window!r}")
+    pref = db.session.get(NotificationPreference, user_id)
+    if pref is None:
+        pref = NotificationPreference(user_id=user_id)
+        db.session.add(pref)
+    pref.digest_window = window
+    return pref
+
+
+def notify(user, kind, subject, body, urgent=False, sender_type='user'):
+    """Notify `user` now if urgent or they want immediate emails, otherwise in their next digest"""
+    if user is None or not user.email:
+        return
+    window = 'immediate' if urgent else get_window(user.id)
+    if window == 'immediate':
+        queue_email(subject, body, user.email, sender_type)
+    elif window != 'off':
+        db.session.add(PendingNotification(user_id=user.id, kind=kind, subject=subject, body=body))
+
+
+def _digest(name, window, items):
+    if len(items) == 1:
+        return items[0].subject, items[0].body
+    subject = f"Your {window} MindCare summary: {len(items)} updates"
+    lines = [f"Hi {name},", "", f"Here is what happened since {items[0].created_at:%d %b %Y, %H:%M} UTC:"]
+    by_kind = {}
+    for item in items:
+        by_kind.setdefault(item.kind, []).append(item)
+    for kind, group in by_kind.items():
+        lines += ["", f"{KIND_LABELS.get(kind, kind)} ({len(group)})"]
+        lines += [f"- {item.created_at:%d %b %H:%M}  {item.body}" for item in group]
+    return subject, "\n".join(lines)
+
+
+def send_digests(now=None):
+    """Turn every buffer whose window has passed into one queued email; returns digests sent"""
+    now = now or datetime.utcnow()
+    default_window = current_app.config.get('NOTIFY_DEFAULT_WINDOW', 'hourly')
+    shortest = min(seconds for seconds in DIGEST_WINDOWS.values() if seconds)
+    due = db.session.execute(
+        select(PendingNotification.user_id, NotificationPreference.digest_window,
+               func.min(PendingNotification.created_at))
+        .outerjoin(NotificationPreference, NotificationPreference.user_id == PendingNotification.user_id)
+        .group_by(PendingNotification.user_id, NotificationPreference.digest_window)
+        .having(func.min(PendingNotification.created_at) <= now - timedelta(seconds=shortest))
+    ).all()
+
+    sent = 0
+    for user_id, window, oldest in due:
+        window = window or default_window
+        if oldest > now - timedelta(seconds=DIGEST_WINDOWS.get(window, 0)):
+            continue
+        items = db.session.execute(
+            select(PendingNotification.id, PendingNotification.kind, PendingNotification.subject,
+                   PendingNotification.body, PendingNotification.created_at)
+            .where(PendingNotification.user_id == user_id, PendingNotification.created_at <= now)
+            .order_by(PendingNotification.created_at, PendingNotification.id)
+        ).all()
+        ids = [item.id for item in items]
+        # Deleting first claims the items: if another worker got some of them, leave this digest to it
+        result = db.session.execute(delete(PendingNotification).where(PendingNotification.id.in_(ids))
+                                    .execution_options(synchronize_session=False))
+        if result.rowcount != len(ids):
+            db.session.rollback()
+            continue
+        user = db.session.execute(select(User.email, User.full_name).where(User.id == user_id)).first()
+        if user and user.email and window != 'off':
+            subject, body = _digest(user.full_name, window, items)
+            queue_email(subject, body, user.email)
+            sent += 1
+        db.session.commit()
+    if sent:
+        logging.info(f"Queued {sent} notification digests")
+    return sent
+
+
+def init_app(app):
+    background.register_job(app, 'notification-digests', send_digests,
+                            app.config.get('NOTIFY_DIGEST_POLL_SECONDS', 300))
@@ -0,0 +1,130 @@
+"""
+Password hashing off the request threads.
+
+Hashing and verification use werkzeug's KDF, which is slow on purpose. Instead
+of running it inline in the request thread, PasswordHasher sends it to a small
+process pool (PASSWORD_HASH_WORKERS per app process, created lazily so every
+gunicorn worker gets its own). The pool starts its processes with forkserver,
+not fork, so a script that hashes with workers needs the usual
+`if __name__ == '__main__':` guard. At most PASSWORD_HASH_QUEUE hashes may be in
+flight. A caller that cannot get a slot, or whose hash does not finish within
+PASSWORD_HASH_TIMEOUT seconds, gets PasswordHasherBusy and the route answers
+503 instead of piling up.
+
+The KDF is configurable (PASSWORD_HASH_METHOD, PASSWORD_SALT_LENGTH). Hashes
+made with other parameters still verify and are upgraded on the next login
+(see User.rehash_password_if_needed). PASSWORD_HASH_WORKERS=0 hashes inline.
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import generate_password_hash, check_password_hash
+
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+DEFAULT_SALT_LENGTH = 16
+
+
+def pool_context():
+    """multiprocessing context for hashing pools"""
+    # Not fork: the app process runs request and background job threads, and a forked child can
+    # inherit a lock one of them held. forkserver forks from a clean single-threaded server instead.
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+class PasswordHasherBusy(Exception):
+    """The hashing queue is full or a hash did not finish in time"""
+
+
+class PasswordHasher:
+    def __init__(self, method=DEFAULT_METHOD, salt_length=DEFAULT_SALT_LENGTH, workers=0, max_queue=None, timeout=5.0):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self.configure(method, salt_length, workers, max_queue, timeout)
+
+    def configure(self, method=DEFAULT_METHOD, salt_length=DEFAULT_SALT_LENGTH, workers=0, max_queue=None, timeout=5.0):
+        self.method = method
+        self.salt_length = salt_length
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max(1, max_queue or workers * 4))
+        self._stored_method = None
+        self.shutdown()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=pool_context())
+                self._pid = os.getpid()
+            return self._executor
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _run(self, func, *args):
+        if self.workers <= 0:
+            return func(*args)
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PasswordHasherBusy('Password hashing queue is full')
+        try:
+            future = self._pool().submit(func, *args)
+        except BrokenProcessPool:
+            self._slots.release()
+            logging.error("Password hashing pool died, restarting it")
+            self.shutdown()
+            raise PasswordHasherBusy('Password hashing pool restarted')
+        except Exception:
+            self._slots.release()
+            raise
+        # The slot is held until the work is really done, even if we stop waiting for it
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise PasswordHasherBusy('Password hashing timed out')
+        except BrokenProcessPool:
+            self.shutdown()
+            raise PasswordHasherBusy('Password hashing pool restarted')
+
+    def hash(self, password):
+        pwhash = self._run(generate_password_hash, password, self.method, self.salt_length)
+        self._stored_method = self._stored_method or pwhash.split('$', 1)[0]
+        return pwhash
+
+    def verify(self, pwhash, password):
+        if not pwhash:
+            return False
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """True if the hash was made with different KDF parameters or salt length than the configured ones"""
+        if not pwhash:
+            return False
+        if self._stored_method is None:
+            # werkzeug fills in defaults (e.g. pbkdf2:sha256 -> pbkdf2:sha256:<iterations>), so compare
+            # against what it actually writes; one throwaway hash per process finds out
+            self.hash('')
+        parts = pwhash.split('$')
+        return len(parts) != 3 or parts[0] != self._stored_method or len(parts[1]) != self.salt_length
+
+
+hasher = PasswordHasher()
+
+
+def init_app(app):
+    hasher.configure(
+        method=app.config.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD),
+        salt_length=app.config.get('PASSWORD_SALT_LENGTH', DEFAULT_SALT_LENGTH),
+        workers=app.config.get('PASSWORD_HASH_WORKERS', 0),
+        max_queue=app.config.get('PASSWORD_HASH_QUEUE'),
+        timeout=app.config.get('PASSWORD_HASH_TIMEOUT', 5.0),
+    )
@@ -0,0 +1,215 @@
+"""
+Account deletion and retention purges in bounded batches.
+
+The schema declares ON DELETE CASCADE (SET NULL for counsellor/reviewer
+references) and the ORM relationships use passive_deletes, so where the
+database enforces them a plain `db.session.delete(user)` leaves child rows to
+the database instead of loading them. SQLite only does that with
+SQLITE_FOREIGN_KEYS=1 on tables created with those clauses (see
+db_engine.py), so accounts are deleted here instead: bottom-up, batch_size
+rows per transaction. Memory stays flat, locks are held only for one batch,
+and it works whether or not the database has the cascades.
+
+Retention windows (0 keeps data forever):
+RETENTION_CHAT_DAYS, RETENTION_VENTING_DAYS, RETENTION_MODERATION_DAYS,
+RETENTION_EMAIL_DAYS.
+"""
+
+import logging
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, delete, update, or_, and_, func, case, tuple_
+from database import db
+from models import (User, ChatSession, ChatMessage, ChatArchive, Assessment, MeditationSession,
+                    UserDailyActivity, UserActivityTotals, VentingPost, VentingPostLike, VentingResponse,
+                    ModerationFlag, SoundVentingSession, ConsultationRequest, AvailabilitySlot, AvailabilityRule, EmailOutbox,
+                    NotificationPreference, PendingNotification, ScheduledJob, ConsultationCount, ChangeCounter,
+                    CalendarFeedToken)
+import change_counters
+import consultation_lists
+import calendar_feed
+from consultation_reminders import JOB_KINDS as CONSULTATION_JOB_KINDS
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def _delete_in_batches(table, condition, batch_size, progress=None, before_delete=None):
+    """DELETE rows matching `condition`, batch_size rows per transaction; returns rows deleted"""
+    keys = list(table.primary_key.columns)
+    total = 0
+    while True:
+        rows = db.session.execute(select(*keys).where(condition).limit(batch_size)).all()
+        if not rows:
+            break
+        if before_delete:
+            before_delete(rows)
+        if len(keys) == 1:
+            match = keys[0].in_([row[0] for row in rows])
+        else:
+            match = tuple_(*keys).in_([tuple(row) for row in rows])
+        db.session.execute(delete(table).where(match))
+        db.session.commit()
+        total += len(rows)
+        if progress:
+            progress(table.name, total)
+        if len(rows) < batch_size:
+            break
+    return total
+
+
+def _purge_posts(post_ids, batch_size, progress):
+    """Delete venting posts selected by the `post_ids` subquery and everything hanging off them"""
+    response_ids = select(VentingResponse.id).where(VentingResponse.post_id.in_(post_ids))
+    _delete_in_batches(VentingPostLike.__table__, VentingPostLike.post_id.in_(post_ids), batch_size, progress)
+    _delete_in_batches(ModerationFlag.__table__, and_(ModerationFlag.content_type == 'response',
+                                                      ModerationFlag.content_id.in_(response_ids)),
+                       batch_size, progress)
+    _delete_in_batches(VentingResponse.__table__, VentingResponse.post_id.in_(post_ids), batch_size, progress)
+    _delete_in_batches(ModerationFlag.__table__, and_(ModerationFlag.content_type == 'post',
+                                                      ModerationFlag.content_id.in_(post_ids)),
+                       batch_size, progress)
+    return _delete_in_batches(VentingPost.__table__, VentingPost.id.in_(post_ids), batch_size, progress)
+
+
+def _purge_chat_sessions(session_ids, batch_size, progress):
+    """Delete chat sessions selected by the `session_ids` subquery with their hot and archived messages"""
+    _delete_in_batches(ChatMessage.__table__, ChatMessage.session_id.in_(session_ids), batch_size, progress)
+    _delete_in_batches(ChatArchive.__table__, ChatArchive.session_id.in_(session_ids), batch_size, progress)
+    return _delete_in_batches(ChatSession.__table__, ChatSession.id.in_(session_ids), batch_size, progress)
+
+
+def purge_user(user_id, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    """Delete a user and all of their data; returns False if the user does not exist"""
+    if db.session.execute(select(User.id).where(User.id == user_id)).first() is None:
+        return False
+
+    _purge_chat_sessions(select(ChatSession.id).where(ChatSession.user_id == user_id), batch_size, progress)
+
+    def uncount_likes(rows):
+        # Likes this user gave on other people's posts
+        post_ids = [post_id for post_id, liker_id in rows if liker_id == user_id]
+        if post_ids:
+            db.session.execute(
+                update(VentingPost)
+                .where(VentingPost.id.in_(post_ids), VentingPost.user_id != user_id)
+                .values(likes=case((VentingPost.likes > 0, VentingPost.likes - 1), else_=0))
+                .execution_options(synchronize_session=False)
+            )
+    _delete_in_batches(VentingPostLike.__table__, VentingPostLike.user_id == user_id, batch_size, progress,
+                       before_delete=uncount_likes)
+    _purge_posts(select(VentingPost.id).where(VentingPost.user_id == user_id), batch_size, progress)
+    own_response_ids = select(VentingResponse.id).where(VentingResponse.user_id == user_id)
+    _delete_in_batches(ModerationFlag.__table__, or_(
+        ModerationFlag.user_id == user_id,
+        and_(ModerationFlag.content_type == 'response', ModerationFlag.content_id.in_(own_response_ids))
+    ), batch_size, progress)
+    _delete_in_batches(VentingResponse.__table__, VentingResponse.user_id == user_id, batch_size, progress)
+
+    # Their counsellors' dashboard counts are recomputed once the requests are gone, and the calendar
+    # feeds of both sides change
+    counsellor_ids = db.session.execute(
+        select(ConsultationRequest.counsellor_id).distinct()
+        .where(ConsultationRequest.user_id == user_id, ConsultationRequest.counsellor_id.isnot(None),
+               ConsultationRequest.counsellor_id != user_id)
+    ).scalars().all()
+    student_ids = db.session.execute(
+        select(ConsultationRequest.user_id).distinct().where(ConsultationRequest.counsellor_id == user_id)
+    ).scalars().all()
+    _delete_in_batches(ScheduledJob.__table__, and_(
+        ScheduledJob.kind.in_(CONSULTATION_JOB_KINDS),
+        ScheduledJob.target_id.in_(select(ConsultationRequest.id).where(ConsultationRequest.user_id == user_id))
+    ), batch_size, progress)
+    # Slots their requests held go back to the counsellors' open availability
+    db.session.execute(update(AvailabilitySlot).where(AvailabilitySlot.id.in_(
+        select(ConsultationRequest.slot_id).where(ConsultationRequest.user_id == user_id)
+    )).values(is_booked=False).execution_options(synchronize_session=False))
+    owned = [Assessment, MeditationSession, SoundVentingSession, UserDailyActivity, UserActivityTotals,
+             ConsultationRequest, PendingNotification, NotificationPreference]
+    for model in owned:
+        _delete_in_batches(model.__table__, model.__table__.c.user_id == user_id, batch_size, progress)
+    # Both routine task tables are mapped (see models.py)
+    for name in ('routine_task', 'routine_tasks'):
+        table = db.metadata.tables.get(name)
+        if table is not None:
+            _delete_in_batches(table, table.c.user_id == user_id, batch_size, progress)
+    _delete_in_batches(AvailabilitySlot.__table__, AvailabilitySlot.counsellor_id == user_id, batch_size, progress)
+    _delete_in_batches(AvailabilityRule.__table__, AvailabilityRule.counsellor_id == user_id, batch_size, progress)
+    change_counters.bump(change_counters.AVAILABILITY)
+
+    # References from other people's data are kept and detached
+    db.session.execute(update(ConsultationRequest).where(ConsultationRequest.counsellor_id == user_id)
+                       .values(counsellor_id=None, slot_id=None).execution_options(synchronize_session=False))
+    db.session.execute(delete(ConsultationCount).where(ConsultationCount.counsellor_id == user_id))
+    consultation_lists.rebuild(counsellor_ids)
+    calendar_feed.bump(counsellor_ids + student_ids)
+    db.session.execute(delete(ChangeCounter).where(ChangeCounter.key == calendar_feed.schedule_key(user_id)))
+    db.session.execute(delete(CalendarFeedToken).where(CalendarFeedToken.user_id == user_id))
+    db.session.execute(update(ModerationFlag).where(ModerationFlag.reviewed_by == user_id)
+                       .values(reviewed_by=None).execution_options(synchronize_session=False))
+    db.session.execute(delete(User).where(User.id == user_id))
+    db.session.commit()
+    if progress:
+        progress('user', 1)
+    logging.info(f"Purged user {user_id}")
+    return True
+
+
+def inactive_user_ids(days, role='student'):
+    """Ids of users with `role` who have not logged in for `days` days"""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    return db.session.execute(
+        select(User.id).where(User.role == role, func.coalesce(User.last_login, User.created_at) < cutoff)
+        .order_by(User.id)
+    ).scalars().all()
+
+
+def purge_expired(batch_size=DEFAULT_BATCH_SIZE, progress=None, now=None):
+    """Apply the configured retention windows; returns {category: rows deleted}"""
+    config = current_app.config
+    now = now or datetime.utcnow()
+    deleted = {}
+
+    days = config.get('RETENTION_CHAT_DAYS', 0)
+    if days:
+        cutoff = now - timedelta(days=days)
+        recent_message = select(ChatMessage.id).where(ChatMessage.session_id == ChatSession.id,
+                                                      ChatMessage.timestamp >= cutoff)
+        expired = select(ChatSession.id).where(
+            func.coalesce(ChatSession.session_end, ChatSession.session_start) < cutoff,
+            ~recent_message.exists()
+        )
+        deleted['chat_sessions'] = _purge_chat_sessions(expired, batch_size, progress)
+
+    days = config.get('RETENTION_VENTING_DAYS', 0)
+    if days:
+        cutoff = now - timedelta(days=days)
+        expired = select(VentingPost.id).where(VentingPost.created_at < cutoff)
+        deleted['venting_posts'] = _purge_posts(expired, batch_size, progress)
+
+    days = config.get('RETENTION_MODERATION_DAYS', 0)
+    if days:
+        cutoff = now - timedelta(days=days)
+        deleted['moderation_flags'] = _delete_in_batches(
+            ModerationFlag.__table__,
+            and_(ModerationFlag.status != 'flagged', ModerationFlag.scanned_at < cutoff),
+            batch_size, progress
+        )
+
+    days = config.get('RETENTION_EMAIL_DAYS', 0)
+    if days:
+        cutoff = now - timedelta(days=days)
+        deleted['emails'] = _delete_in_batches(
+            EmailOutbox.__table__,
+            and_(EmailOutbox.status != 'pending', EmailOutbox.created_at < cutoff),
+            batch_size, progress
+        )
+
+    days = config.get('RETENTION_SCHEDULED_JOB_DAYS', 0)
+    if days:
+        cutoff = now - timedelta(days=days)
+        deleted['scheduled_jobs'] = _delete_in_batches(
+            ScheduledJob.__table__,
+            and_(ScheduledJob.status != 'pending', ScheduledJob.due_at < cutoff),
+            batch_size, progress
+        )
+    return deleted
@@ -1,16 +1,39 @@
-from flask import render_template, request, redirect, url_for, flash, jsonify, session, send_file
+from flask import render_template, request, redirect, url_for, flash, jsonify, session, send_file, make_response, Response, stream_with_context, abort
+from werkzeug.http import is_resource_modified
 from flask_login import login_user, logout_user, login_required, current_user
 from app import app, db
-from models import User, ChatSession, ChatMessage, Assessment, MeditationSession, VentingPost, VentingResponse, ConsultationRequest, AvailabilitySlot, SoundVentingSession
+from models import User, ChatSession, ChatMessage, Assessment, MeditationSession, VentingPost, VentingResponse, VentingPostLike, ConsultationRequest, AvailabilitySlot, AvailabilityRule, SoundVentingSession
 from gemini_service import chat_with_ai, analyze_assessment_results, suggest_assessment
 from voice_service import voice_service
 from utils import (hash_student_id, calculate_phq9_score, calculate_gad7_score, 
                   calculate_ghq_score, get_assessment_questions, get_assessment_options,
                   format_time_ago, get_meditation_content)
 import json
+import hashlib
 import logging
 from datetime import datetime, timedelta
-from sqlalchemy import func, and_, case
+from sqlalchemy import func, case
+from sqlalchemy.orm import joinedload
+from db_routing import read_replica
+from activity import activity_summary
+from cohort_stats import get_mentor_stats
+from venting_feed import get_feed_page
+from like_buffer import like_buffer
+from venting_search import search_venting
+import moderation
+import booking
+import availability
+import change_counters
+import consultation_reminders
+import matching
+import consultation_lists
+import live
+import calendar_feed
+from availability import AvailabilityConflict
+from chat_archive import get_session_messages
+from passwords import PasswordHasherBusy
+from email_outbox import queue_email, send_now
+from notifications import notify, get_window, set_window, URGENT_SEVERITIES
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.utils import ImageReader
@@ -18,11 +41,6 @@ from PIL import Image
 import io
 import os
 
-# Email helper
-import smtplib
-import ssl
-from email.message import EmailMessage
-
 @app.route('/set_language/<language>')
 def set_language(language=None):
     """Set the language for the current session"""
@@ -31,37 +49,8 @@ def set_language(language=None):
     return redirect(request.referrer or url_for('dashboard'))
 
 def send_email(subject: str, body: str, to_email: str, sender_type: str = 'user') -> bool:
-    """Send email using environment SMTP settings; fallback to logging. Sender type can be 'user', 'mentor', or 'counsellor'."""
-    try:
-        smtp_host = os.environ.get('SMTP_HOST')
-        smtp_port = int(os.environ.get('SMTP_PORT', '587'))
-        smtp_user = os.environ.get('SMTP_USER')
-        smtp_pass = os.environ.get('SMTP_PASS')
-        # Set sender email based on type
-        if sender_type == 'mentor':
-            from_email = os.environ.get('MENTOR_EMAIL', smtp_user)
-        elif sender_type == 'counsellor':
-            from_email = os.environ.get('COUNSELLOR_EMAIL', smtp_user)
-        else:
-            from_email = os.environ.get('SMTP_FROM', smtp_user)
-        if not (smtp_host and smtp_user and smtp_pass and to_email):
-            app.logger.info(f"EMAIL (stub) to {to_email}: {subject} | {body}")
-            return False
-        msg = EmailMessage()
-        msg['Subject'] = subject
-        msg['From'] = from_email
-        msg['To'] = to_email
-        msg.set_content(body)
-        context = ssl.create_default_context()
-        with smtplib.SMTP(smtp_host, smtp_port) as server:
-            server.starttls(context=context)
-            server.login(smtp_user, smtp_pass)
-            server.send_message(msg)
-        return True
-    except Exception as e:
-        app.logger.warning(f"EMAIL send failed to {to_email}: {e}. Falling back to log. Subject: {subject}")
-        app.logger.info(f"EMAIL (stub) to {to_email}: {subject} | {body}")
-        return False
+    """Send an email right away over the pooled SMTP connections; routes use queue_email instead."""
+    return send_now(subject, body, to_email, sender_type)
 
 @app.route('/')
 def index():
@@ -91,7 +80,11 @@ def register():
         
         # Create new user
         user = User(username=username, email=email, full_name=full_name, role=role)
-        user.set_password(password)
+        try:
+            user.set_password(password)
+        except PasswordHasherBusy:
+            flash('Too many people are signing up right now. Please try again in a moment.', 'error')
+            return render_template('register.html'), 503
         
         if student_id:
             user.set_student_id(student_id)
@@ -115,16 +108,27 @@ def login():
         
         user = User.query.filter_by(username=username).first()
         
-        if user and user.check_password(password):
+        try:
+            valid = user is not None and user.check_password(password)
+            if valid:
+                user.rehash_password_if_needed(password)
+        except PasswordHasherBusy:
+            flash('Too many people are signing in right now. Please try again in a moment.', 'error')
+            return render_template('login.html'), 503
+        
+        if valid:
             login_user(user)
-            user.update_login_streak()
-            flash(f'Welcome back! Your login streak: {user.login_streak} days', 'success')
+            # Streak, last login and any password upgrade go out in one transaction
+            streak = user.update_login_streak()
+            role = user.role
+            db.session.commit()
+            flash(f'Welcome back! Your login streak: {streak} days', 'success')
             # Role-based landing
-            if user.role == 'counsellor':
+            if role == 'counsellor':
                 return redirect(url_for('counsellor_dashboard'))
-            if user.role == 'admin':
+            if role == 'admin':
                 return redirect(url_for('admin_dashboard'))
-            if user.role in ['teacher']:
+            if role in ['teacher']:
                 return redirect(url_for('mentor_dashboard'))
             return redirect(url_for('dashboard'))
         else:
@@ -154,22 +158,11 @@ def dashboard():
     tasks_progress = int((tasks_completed / total_tasks) * 100) if total_tasks > 0 else 0
     # Get user stats
     recent_assessments = Assessment.query.filter_by(user_id=current_user.id).order_by(Assessment.completed_at.desc()).limit(3).all()
-    meditation_streak = MeditationSession.query.filter_by(user_id=current_user.id).filter(
-        MeditationSession.date >= datetime.utcnow().date() - timedelta(days=7)
-    ).count()
-
-    # Weekly sessions count (from start of week)
-    today = datetime.utcnow().date()
-    start_of_week = today - timedelta(days=today.weekday())
-    weekly_sessions_count = MeditationSession.query.filter_by(user_id=current_user.id).filter(
-        MeditationSession.date >= start_of_week
-    ).count()
-
-    # Total seconds meditated
-    total_seconds = db.session.query(func.sum(MeditationSession.duration)).filter_by(
-        user_id=current_user.id
-    ).scalar() or 0
-    total_minutes_meditated = total_seconds // 60
+    # Meditation stats come from the daily activity rollup
+    activity = activity_summary(current_user.id, today)
+    meditation_streak = activity['sessions_last_7_days']
+    weekly_sessions_count = activity['weekly_sessions_count']
+    total_minutes_meditated = activity['total_minutes_meditated']
 
     # Get chat sessions with crisis flags
     crisis_sessions = ChatSession.query.filter_by(user_id=current_user.id, crisis_flag=True).count()
@@ -183,7 +176,8 @@ def dashboard():
                          tasks_completed=tasks_completed,
                          total_tasks=total_tasks,
                          tasks_progress=tasks_progress,
-                         login_streak=current_user.login_streak or 0)
+                         login_streak=current_user.login_streak or 0,
+                         digest_window=get_window(current_user.id))
 
 @app.route('/chatbot')
 @login_required
@@ -201,8 +195,8 @@ def chatbot():
         db.session.commit()
         session['chat_session_id'] = chat_session.id
     
-    # Get chat history
-    messages = ChatMessage.query.filter_by(session_id=chat_session.id).order_by(ChatMessage.timestamp).all()
+    # Get chat history (including any archived part of the session)
+    messages = get_session_messages(chat_session.id)
     
     return render_template('chatbot.html', messages=messages, session_id=chat_session.id)
 
@@ -227,7 +221,7 @@ def chat():
     db.session.add(user_msg)
     
     # Get chat history for context
-    chat_history = ChatMessage.query.filter_by(session_id=session_id).order_by(ChatMessage.timestamp).all()
+    chat_history = get_session_messages(chat_session.id)
     history_context = [{"role": "user" if msg.message_type == "user" else "assistant", "content": msg.content} for msg in chat_history[-10:]]
     
     # Get AI response
@@ -244,6 +238,10 @@ def chat():
         bot_msg.crisis_keywords = json.dumps(ai_result['crisis_keywords'])
         chat_session.crisis_flag = True
         chat_session.keywords_detected = json.dumps(ai_result['crisis_keywords'])
+        live.publish(live.role_topic('counsellor'), 'crisis_chat', {
+            'user_id': current_user.id,
+            'message': f'Crisis keywords detected in a chat with {current_user.full_name} ({current_user.username}).'
+        })
     
     db.session.add(bot_msg)
     db.session.commit()
@@ -309,6 +307,20 @@ def save_venting_session():
         logging.error(f"Error saving venting session: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/login_streak')
+@login_required
+def api_login_streak():
+    """Stored streak values, maintained at login by User.update_login_streak"""
+    row = db.session.query(User.login_streak, User.last_streak_date).filter(User.id == current_user.id).one()
+    today = datetime.utcnow().date()
+    # A streak is still alive until a full day passes without a login
+    active = row.last_streak_date is not None and row.last_streak_date >= today - timedelta(days=1)
+    return jsonify({
+        'login_streak': (row.login_streak or 0) if active else 0,
+        'last_streak_date': row.last_streak_date.isoformat() if row.last_streak_date else None,
+        'logged_in_today': row.last_streak_date == today,
+    })
+
 @app.route('/track_mood', methods=['POST'])
 @login_required
 def track_mood():
@@ -817,25 +829,13 @@ def save_breathing_session():
 def meditation():
     meditation_content = get_meditation_content()
 
-    # Calculate meditation stats for the current user
-    today = datetime.utcnow().date()
-    start_of_week = today - timedelta(days=today.weekday()) # Monday as start of week
-
-    weekly_sessions_count = MeditationSession.query.filter_by(user_id=current_user.id).filter(
-        MeditationSession.date >= start_of_week
-    ).count()
-
-    total_seconds = db.session.query(func.sum(MeditationSession.duration)).filter_by(
-        user_id=current_user.id
-    ).scalar() or 0
-
-    total_minutes_meditated = total_seconds // 60   # or round(total_seconds / 60, 1)
-
+    # Calculate meditation stats for the current user (week starts Monday)
+    activity = activity_summary(current_user.id)
 
     return render_template('meditation.html',
                            meditation_content=meditation_content,
-                           weekly_sessions_count=weekly_sessions_count,
-                           total_minutes_meditated=total_minutes_meditated)
+                           weekly_sessions_count=activity['weekly_sessions_count'],
+                           total_minutes_meditated=activity['total_minutes_meditated'])
 
 @app.route('/meditation_completed', methods=['POST'])
 @login_required
@@ -852,23 +852,16 @@ def meditation_completed():
         date=datetime.utcnow().date() # Record the date of completion
     )
     db.session.add(meditation_session)
+    # Notify user about successful meditation (optional encouragement, sent in their digest)
+    notify(
+        current_user, 'meditation_completed',
+        subject='Meditation completed',
+        body=f'Great job! You completed a {duration_seconds//60} minute {session_type} session today. Keep your streak going!'
+    )
     db.session.commit()
-    # Notify user about successful meditation (optional encouragement)
-    try:
-        send_email(
-            subject='Meditation completed',
-            body=f'Great job! You completed a {duration_seconds//60} minute {session_type} session today. Keep your streak going!',
-            to_email=current_user.email
-        )
-    except Exception:
-        pass
-    today = datetime.utcnow().date()
-    start_of_week = today - timedelta(days=today.weekday())
-    weekly_count = MeditationSession.query.filter_by(user_id=current_user.id).filter(
-        MeditationSession.date >= start_of_week
-    ).count()
-    today_sessions = MeditationSession.query.filter_by(user_id=current_user.id, date=today).all()
-    today_sessions_count = len(today_sessions)
+    activity = activity_summary(current_user.id)
+    weekly_count = activity['weekly_sessions_count']
+    today_sessions_count = activity['today_sessions_count']
     return jsonify({
         "success": True,
         "message": "Meditation session recorded",
@@ -896,9 +889,60 @@ def sound_venting():
 @app.route('/venting_hall')
 @login_required
 def venting_hall():
-    posts = VentingPost.query.order_by(VentingPost.created_at.desc()).all()
+    # First page only; the rest is loaded by infinite scroll from /api/venting_posts
+    posts, next_cursor = get_feed_page()
     
-    return render_template('venting_hall.html', posts=posts, format_time_ago=format_time_ago)
+    return render_template('venting_hall.html', posts=posts, next_cursor=next_cursor, format_time_ago=format_time_ago)
+
+@app.route('/api/venting_posts')
+@login_required
+def api_venting_posts():
+    posts, next_cursor = get_feed_page(request.args.get('cursor'), request.args.get('limit', type=int))
+    return jsonify({
+        'posts': [
+            {
+                'id': post.id,
+                'created_at': post.created_at.isoformat(),
+                'likes': (post.likes or 0) + like_buffer.pending(post.id),
+                'response_count': len(post.responses),
+                'html': render_template('venting_post_card.html', post=post, format_time_ago=format_time_ago)
+            } for post in posts
+        ],
+        'next_cursor': next_cursor
+    })
+
+# Roles allowed to search the venting hall for moderation
+MODERATOR_ROLES = ['counsellor', 'teacher', 'admin']
+
+@app.route('/venting_hall/search')
+@login_required
+def venting_search():
+    if current_user.role not in MODERATOR_ROLES:
+        flash('Access denied.', 'error')
+        return redirect(url_for('venting_hall'))
+    query = request.args.get('q', '').strip()
+    page = request.args.get('page', 1, type=int)
+    per_page = 20
+    results = []
+    if query:
+        # One extra row tells whether there is a next page
+        results = search_venting(query, page=page, per_page=per_page, lookahead=True)
+    return render_template('venting_search.html', query=query, results=results[:per_page],
+                           page=page, has_next=len(results) > per_page, format_time_ago=format_time_ago)
+
+@app.route('/api/venting_search')
+@login_required
+def api_venting_search():
+    if current_user.role not in MODERATOR_ROLES:
+        return jsonify({'error': 'Unauthorized'}), 403
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'results': []})
+    results = search_venting(query, page=request.args.get('page', 1, type=int),
+                             per_page=request.args.get('per_page', 20, type=int))
+    return jsonify({'results': [
+        {**r, 'snippet': str(r['snippet']), 'created_at': r['created_at'].isoformat()} for r in results
+    ]})
 
 @app.route('/create_post', methods=['POST'])
 @login_required
@@ -918,6 +962,7 @@ def create_post():
     
     db.session.add(post)
     db.session.commit()
+    moderation.enqueue('post', post.id)
     
     flash('Your post has been shared', 'success')
     return redirect(url_for('venting_hall'))
@@ -942,6 +987,7 @@ def respond_to_post():
     
     db.session.add(response)
     db.session.commit()
+    moderation.enqueue('response', response.id)
     
     flash('Your response has been added', 'success')
     return redirect(url_for('venting_hall'))
@@ -950,14 +996,25 @@ def respond_to_post():
 @login_required
 def like_post():
     post_id = int(request.form['post_id'])
-    post = VentingPost.query.get(post_id)
-    
-    if post:
-        post.likes += 1
-        db.session.commit()
+    # Buffered in memory and flushed in batches (see like_buffer.py)
+    liked = like_buffer.like(post_id, current_user.id)
     
+    if request.accept_mimetypes.best == 'application/json':
+        counts = like_buffer.get_counts([post_id])
+        return jsonify({'success': liked, 'likes': counts.get(post_id, 0)})
     return redirect(url_for('venting_hall'))
 
+@app.route('/api/venting_posts/likes')
+@login_required
+def api_venting_post_likes():
+    """Current like counts, including likes not yet flushed to the database"""
+    try:
+        post_ids = [int(i) for i in request.args.get('ids', '').split(',') if i.strip()][:100]
+    except ValueError:
+        return jsonify({'error': 'Invalid post ids'}), 400
+    counts = like_buffer.get_counts(post_ids)
+    return jsonify({str(post_id): likes for post_id, likes in counts.items()})
+
 @app.route('/delete_post/<int:post_id>', methods=['DELETE'])
 @login_required
 def delete_post(post_id):
@@ -969,10 +1026,15 @@ def delete_post(post_id):
     if post.user_id != current_user.id and not getattr(current_user, 'is_admin', False):
         return jsonify({'success': False, 'error': 'Unauthorized'}), 403
 
-    # Delete associated responses too
+    # Delete associated responses, likes and moderation results too
+    response_ids = [r.id for r in db.session.query(VentingResponse.id).filter_by(post_id=post.id)]
+    moderation.delete_flags('response', response_ids)
+    moderation.delete_flags('post', [post.id])
     VentingResponse.query.filter_by(post_id=post.id).delete()
+    VentingPostLike.query.filter_by(post_id=post.id).delete()
     db.session.delete(post)
     db.session.commit()
+    like_buffer.discard(post_id)
 
     return jsonify({'success': True}), 200
 
@@ -987,6 +1049,7 @@ def delete_response(response_id):
     if response.user_id != current_user.id and not getattr(current_user, 'is_admin', False):
         return jsonify({'success': False, 'error': 'Unauthorized'}), 403
 
+    moderation.delete_flags('response', [response.id])
     db.session.delete(response)
     db.session.commit()
     return jsonify({'success': True}), 200
@@ -997,47 +1060,97 @@ def delete_response(response_id):
 def consultation():
     user_requests = ConsultationRequest.query.filter_by(user_id=current_user.id).order_by(ConsultationRequest.created_at.desc()).all()
     counsellors = User.query.filter_by(role='counsellor').all()
-    from datetime import datetime, timedelta
-    for req in user_requests:
-        if req.status == 'booked':
-            flash(f'Your consultation with counsellor {req.counsellor.full_name} is booked!', 'success')
-            if req.session_datetime:
-                now = datetime.utcnow()
-                if req.session_datetime > now and req.session_datetime < now + timedelta(days=2):
-                    flash(f'Reminder: Your session is scheduled for {req.session_datetime.strftime("%d %b %Y, %I:%M %p")}', 'info')
-        elif req.status == 'rejected':
-            flash(f'Your consultation request was rejected by counsellor {req.counsellor.full_name}.', 'warning')
-    # Available slots (open, future)
-    open_slots = AvailabilitySlot.query.filter(
-        AvailabilitySlot.is_booked == False,
-        AvailabilitySlot.start_time >= datetime.utcnow()
-    ).order_by(AvailabilitySlot.start_time.asc()).all()
+    # Status changes and session reminders are emailed by consultation_reminders.py, not flashed here
+    # Open slots are loaded page by page from /api/open_slots
     # Pass current time to template for comparisons
-    return render_template('consultation.html', requests=user_requests, counsellors=counsellors, open_slots=open_slots, now=datetime.utcnow())
+    return render_template('consultation.html', requests=user_requests, counsellors=counsellors, now=datetime.utcnow(),
+                           calendar_url=calendar_feed.feed_url(current_user.id))
+
+@app.route('/calendar/<token>.ics')
+def calendar_ics(token):
+    """A user's schedule for calendar apps, which poll a secret URL instead of logging in (see calendar_feed.py)"""
+    user_id = calendar_feed.user_for_token(token)
+    user = db.session.get(User, user_id) if user_id else None
+    if user is None:
+        abort(404)
+    etag, last_modified = calendar_feed.feed_version(user.id)
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = make_response('', 304)
+    else:
+        response = Response(stream_with_context(calendar_feed.generate(user.id, user.role)), mimetype='text/calendar')
+        response.headers['Content-Disposition'] = 'inline; filename="mindcare.ics"'
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@app.route('/calendar/reset', methods=['POST'])
+@login_required
+def reset_calendar_feed():
+    calendar_feed.reset_token(current_user.id)
+    db.session.commit()
+    flash('Calendar feed link reset. Subscribe to the new link; the old one no longer works.', 'success')
+    return redirect(request.referrer or url_for('dashboard'))
 
 @app.route('/api/open_slots')
 @login_required
 def api_open_slots():
-    counsellor_id = request.args.get('counsellor_id', type=int)
-    q = AvailabilitySlot.query.filter(
-        AvailabilitySlot.is_booked == False,
-        AvailabilitySlot.start_time >= datetime.utcnow()
-    )
-    if counsellor_id:
-        q = q.filter(AvailabilitySlot.counsellor_id == counsellor_id)
-    slots = q.order_by(AvailabilitySlot.start_time.asc()).all()
-    return jsonify([
-        {
-            'id': s.id,
-            'counsellor': {
-                'id': s.counsellor.id,
-                'full_name': s.counsellor.full_name,
-                'username': s.counsellor.username
-            },
-            'start': s.start_time.isoformat(),
-            'end': s.end_time.isoformat()
-        } for s in slots
-    ])
+    """Open slots, earliest first, one page at a time.
+
+    Optional ?counsellor_id=, ?from= and ?to= (ISO date or datetime; a bare
+    `to` date is inclusive), ?cursor= from the previous page and ?limit=.
+    Slot times are naive local times, so from/to must not carry a UTC offset.
+    The ETag only changes when availability changes (or the cache window
+    rolls over), so polling clients mostly get a 304 after one key lookup.
+    """
+    now = datetime.utcnow()
+    try:
+        window_from = datetime.fromisoformat(request.args['from']) if request.args.get('from') else None
+        window_end = datetime.fromisoformat(request.args['to']) if request.args.get('to') else None
+    except ValueError:
+        return jsonify({'error': 'Invalid from/to date'}), 400
+    if any(value is not None and value.tzinfo is not None for value in (window_from, window_end)):
+        return jsonify({'error': 'from/to must be local times without a UTC offset'}), 400
+    window_start = max(now, window_from) if window_from else now
+    if window_end is not None and len(request.args['to']) == 10:
+        window_end += timedelta(days=1)
+    horizon = now + timedelta(days=availability.MAX_WINDOW_DAYS)
+    window_end = min(window_end or window_start + timedelta(days=app.config['AVAILABILITY_HORIZON_DAYS']), horizon)
+
+    # Slots drop out as they start, so the tag also rolls over every OPEN_SLOTS_CACHE_SECONDS
+    window = int(now.timestamp()) // app.config['OPEN_SLOTS_CACHE_SECONDS']
+    version = change_counters.version(change_counters.AVAILABILITY)
+    etag = hashlib.sha1(f"{version}|{window}|{request.query_string.decode()}".encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        slots, next_cursor = availability.open_slots_page(
+            window_start, window_end, request.args.get('counsellor_id', type=int) or None,
+            request.args.get('cursor'), request.args.get('limit', type=int))
+        # Names for the whole page in one query; generated slots have no row to join against
+        counsellors = {row.id: row for row in db.session.query(User.id, User.full_name, User.username)
+                       .filter(User.id.in_({s.counsellor_id for s in slots}))}
+        response = jsonify({
+            'slots': [
+                {
+                    'id': s.slot_id,
+                    'counsellor': {
+                        'id': s.counsellor_id,
+                        'full_name': counsellors[s.counsellor_id].full_name,
+                        'username': counsellors[s.counsellor_id].username
+                    },
+                    'start': s.start.isoformat(),
+                    'end': s.end.isoformat(),
+                    'book_url': url_for('book_slot', slot_id=s.slot_id) if s.slot_id else
+                                url_for('book_rule_slot', rule_id=s.rule_id, start=s.start.strftime('%Y-%m-%dT%H:%M'))
+                } for s in slots
+            ],
+            'next_cursor': next_cursor
+        })
+    response.set_etag(etag)
+    # Browsers revalidate on every fetch instead of reusing the copy blindly
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 
 # Routine Scheduler
@@ -1095,15 +1208,18 @@ def request_consultation():
     contact_preference = request.form['contact_preference']
     notes = request.form.get('notes', '')
     counsellor_id_raw = request.form.get('counsellor_id')
-    try:
-        counsellor_id = int(counsellor_id_raw)
-    except (TypeError, ValueError):
-        flash('Please select a valid counsellor.', 'error')
-        return redirect(url_for('consultation'))
-    counsellor = User.query.filter_by(id=counsellor_id, role='counsellor').first()
-    if not counsellor:
-        flash('Selected counsellor not found.', 'error')
-        return redirect(url_for('consultation'))
+    # "auto" leaves the choice to the matching engine (see matching.py)
+    counsellor = None
+    if counsellor_id_raw != 'auto':
+        try:
+            counsellor_id = int(counsellor_id_raw)
+        except (TypeError, ValueError):
+            flash('Please select a valid counsellor.', 'error')
+            return redirect(url_for('consultation'))
+        counsellor = User.query.filter_by(id=counsellor_id, role='counsellor').first()
+        if not counsellor:
+            flash('Selected counsellor not found.', 'error')
+            return redirect(url_for('consultation'))
 
     consultation = ConsultationRequest(
         user_id=current_user.id,
@@ -1111,24 +1227,39 @@ def request_consultation():
         time_slot=time_slot,
         contact_preference=contact_preference,
         additional_notes=notes,
-        counsellor_id=counsellor_id
+        counsellor_id=counsellor.id if counsellor else None
     )
 
     db.session.add(consultation)
-    db.session.commit()
+    consultation_reminders.sync(consultation)
 
-    # Notify counsellor
-    send_email(
+    if counsellor is None:
+        db.session.commit()
+        assigned = matching.assign_waiting().get(consultation.id)
+        if assigned:
+            flash(f'Your consultation request has been matched with {User.query.get(assigned).full_name}. You will be notified once they respond.', 'success')
+        else:
+            flash('All counsellors are fully booked right now. Your request is queued by urgency and you will be emailed as soon as a counsellor is assigned.', 'info')
+        return redirect(url_for('consultation'))
+
+    # Notify counsellor; high-urgency requests skip the digest
+    notify(
+        counsellor, 'consultation_request',
         subject='New consultation request',
         body=f'New consultation request from {current_user.full_name} ({current_user.username}). Urgency: {urgency}.',
-        to_email=counsellor.email
+        urgent=urgency == 'high'
     )
+    live.publish(live.user_topic(counsellor.id), 'consultation_request', {
+        'id': consultation.id,
+        'message': f'New {urgency}-urgency consultation request from {current_user.full_name}.'
+    })
     # Notify user (confirmation)
-    send_email(
+    queue_email(
         subject='Consultation request submitted',
         body=f'Your consultation request to {counsellor.full_name} has been submitted. Urgency: {urgency}. We will notify you once the counsellor responds.',
         to_email=current_user.email
     )
+    db.session.commit()
 
     flash(f'Your consultation request has been submitted to {counsellor.full_name}. You will be notified once they respond.', 'success')
     return redirect(url_for('consultation'))
@@ -1143,120 +1274,137 @@ def counsellor_availability():
         start = request.form.get('start_time')
         end = request.form.get('end_time')
         try:
-            from datetime import datetime
             start_dt = datetime.strptime(start, '%Y-%m-%dT%H:%M')
             end_dt = datetime.strptime(end, '%Y-%m-%dT%H:%M')
             if end_dt <= start_dt:
                 raise ValueError('End must be after start')
+            availability.check_slot(current_user.id, start_dt, end_dt)
             slot = AvailabilitySlot(counsellor_id=current_user.id, start_time=start_dt, end_time=end_dt)
             db.session.add(slot)
+            change_counters.bump(change_counters.AVAILABILITY)
             db.session.commit()
             flash('Availability slot added.', 'success')
+        except AvailabilityConflict as e:
+            db.session.rollback()
+            flash(str(e), 'error')
         except Exception as e:
             db.session.rollback()
             flash('Invalid date/time.', 'error')
         return redirect(url_for('counsellor_availability'))
     slots = AvailabilitySlot.query.filter_by(counsellor_id=current_user.id).order_by(AvailabilitySlot.start_time.asc()).all()
-    return render_template('counsellor_availability.html', slots=slots)
+    rules = AvailabilityRule.query.filter_by(counsellor_id=current_user.id).order_by(AvailabilityRule.start_minute.asc()).all()
+    return render_template('counsellor_availability.html', slots=slots, rules=rules, weekdays=availability.WEEKDAYS,
+                           today=datetime.utcnow().date())
+
+@app.route('/counsellor/availability/rules', methods=['POST'])
+@login_required
+def add_availability_rule():
+    if current_user.role != 'counsellor':
+        flash('Access denied.', 'error')
+        return redirect(url_for('dashboard'))
+    try:
+        start_h, start_m = map(int, request.form['rule_start'].split(':'))
+        end_h, end_m = map(int, request.form['rule_end'].split(':'))
+        if not (0 <= start_m < 60 and 0 <= end_m < 60):
+            raise ValueError('minutes out of range')
+        valid_from, valid_until = request.form.get('valid_from'), request.form.get('valid_until')
+        rule = AvailabilityRule(
+            counsellor_id=current_user.id,
+            weekdays=sum(1 << int(day) for day in request.form.getlist('weekdays') if 0 <= int(day) < 7),
+            start_minute=start_h * 60 + start_m,
+            end_minute=end_h * 60 + end_m,
+            slot_minutes=int(request.form.get('slot_minutes') or 30),
+            valid_from=datetime.strptime(valid_from, '%Y-%m-%d').date() if valid_from else datetime.utcnow().date(),
+            valid_until=datetime.strptime(valid_until, '%Y-%m-%d').date() if valid_until else None
+        )
+        availability.check_rule(rule)
+        db.session.add(rule)
+        change_counters.bump(change_counters.AVAILABILITY)
+        db.session.commit()
+        flash('Weekly availability added.', 'success')
+    except AvailabilityConflict as e:
+        db.session.rollback()
+        flash(str(e), 'error')
+    except (KeyError, ValueError):
+        db.session.rollback()
+        flash('Invalid days or times.', 'error')
+    return redirect(url_for('counsellor_availability'))
+
+@app.route('/counsellor/availability/rules/<int:rule_id>/delete', methods=['POST'])
+@login_required
+def delete_availability_rule(rule_id):
+    rule = AvailabilityRule.query.get_or_404(rule_id)
+    if rule.counsellor_id != current_user.id:
+        flash('Unauthorized action.', 'error')
+        return redirect(url_for('dashboard'))
+    availability.delete_rule(rule)
+    db.session.commit()
+    flash('Weekly availability removed. Slots already booked are kept.', 'info')
+    return redirect(url_for('counsellor_availability'))
 
 @app.route('/book_slot/<int:slot_id>', methods=['POST'])
 @login_required
 def book_slot(slot_id):
     slot = AvailabilitySlot.query.get_or_404(slot_id)
-    if slot.is_booked:
+    return _book_availability_slot(slot)
+
+@app.route('/book_rule_slot/<int:rule_id>/<start>', methods=['POST'])
+@login_required
+def book_rule_slot(rule_id, start):
+    """Book a slot generated from a weekly rule; its AvailabilitySlot row is created on the way"""
+    try:
+        start_dt = datetime.strptime(start, '%Y-%m-%dT%H:%M')
+    except ValueError:
+        start_dt = None
+    slot = availability.materialize(rule_id, start_dt) if start_dt else None
+    if slot is None:
+        db.session.rollback()
+        flash('Slot already booked.', 'warning')
+        return redirect(url_for('consultation'))
+    return _book_availability_slot(slot)
+
+def _book_availability_slot(slot):
+    # Claim the slot and create the consultation request tied to it in one transaction
+    consultation = booking.book_slot(slot, current_user.id)
+    if consultation is None:
+        db.session.rollback()
         flash('Slot already booked.', 'warning')
         return redirect(url_for('consultation'))
+    consultation_reminders.sync(consultation)
     counsellor = User.query.get(slot.counsellor_id)
-    # Create consultation request tied to this slot
-    consultation = ConsultationRequest(
-        user_id=current_user.id,
-        counsellor_id=slot.counsellor_id,
-        urgency_level='low',
-        time_slot=f"{slot.start_time.strftime('%d %b %Y %I:%M %p')} - {slot.end_time.strftime('%I:%M %p')}",
-        contact_preference='video',
-        additional_notes='Booked via availability slot',
-        status='pending'
-    )
-    slot.is_booked = True
-    db.session.add(consultation)
-    db.session.commit()
     # Notify counsellor
-    send_email(
+    notify(
+        counsellor, 'slot_booked',
         subject='Slot booked',
-        body=f'Slot booked by {current_user.full_name} ({current_user.username}) for {slot.start_time}.',
-        to_email=counsellor.email
+        body=f'Slot booked by {current_user.full_name} ({current_user.username}) for {slot.start_time}.'
     )
+    live.publish(live.user_topic(counsellor.id), 'slot_booked', {
+        'id': consultation.id,
+        'message': f'{current_user.full_name} booked your slot on {slot.start_time.strftime("%d %b %Y, %I:%M %p")}.'
+    })
     # Notify user (confirmation)
-    send_email(
+    queue_email(
         subject='Slot booking submitted',
-        body=f'You requested to book {slot.start_time.strftime('%d %b %Y, %I:%M %p')} with {counsellor.full_name}. You will receive a confirmation when the counsellor accepts.',
+        body=f'You requested to book {slot.start_time.strftime("%d %b %Y, %I:%M %p")} with {counsellor.full_name}. You will receive a confirmation when the counsellor accepts.',
         to_email=current_user.email
     )
+    db.session.commit()
     flash(f'Booked slot with {counsellor.full_name}. Awaiting confirmation.', 'success')
     return redirect(url_for('consultation'))
 
 @app.route('/mentor_dashboard')
 @login_required
+@read_replica
 def mentor_dashboard():
     if current_user.role not in ['teacher', 'admin']:
         flash('Access denied. This page is for mentors only.', 'error')
         return redirect(url_for('dashboard'))
     
-    # Analytics for mentors
-    total_students = User.query.filter_by(role='student').count()
-    
-    # Students by accommodation type
-    hostel_students = User.query.filter_by(role='student', accommodation_type='hostel').count()
-    local_students = User.query.filter_by(role='student', accommodation_type='local').count()
+    # Analytics for mentors, read from the materialized cohort stats (see cohort_stats.py)
+    stats, stats_refreshed_at = get_mentor_stats()
     
-    # Recent assessments statistics
-    recent_assessments = db.session.query(
-        Assessment.assessment_type,
-        Assessment.severity_level,
-        func.count(Assessment.id).label('count')
-    ).filter(
-        Assessment.completed_at >= datetime.utcnow() - timedelta(days=30)
-    ).group_by(Assessment.assessment_type, Assessment.severity_level).all()
-    
-    # Crisis flags in the last 30 days
-    crisis_sessions = ChatSession.query.filter(
-        and_(ChatSession.crisis_flag == True,
-             ChatSession.session_start >= datetime.utcnow() - timedelta(days=30))
-    ).count()
-    
-    # Login streaks
-    active_users = User.query.filter(
-        and_(User.role == 'student',
-             User.last_streak_date >= datetime.utcnow().date() - timedelta(days=7))
-    ).count()
-    
-    # Stress level comparison
-    hostel_stress = db.session.query(func.avg(Assessment.score)).filter(
-        and_(Assessment.assessment_type == 'PHQ-9',
-             Assessment.user_id.in_(
-                 db.session.query(User.id).filter_by(accommodation_type='hostel')
-             ))
-    ).scalar() or 0
-    
-    local_stress = db.session.query(func.avg(Assessment.score)).filter(
-        and_(Assessment.assessment_type == 'PHQ-9',
-             Assessment.user_id.in_(
-                 db.session.query(User.id).filter_by(accommodation_type='local')
-             ))
-    ).scalar() or 0
-    
-    stats = {
-        'total_students': total_students,
-        'hostel_students': hostel_students,
-        'local_students': local_students,
-        'recent_assessments': recent_assessments,
-        'crisis_sessions': crisis_sessions,
-        'active_users': active_users,
-        'hostel_avg_stress': round(hostel_stress, 2),
-        'local_avg_stress': round(local_stress, 2)
-    }
-    
-    return render_template('mentor_dashboard.html', stats=stats)
+    return render_template('mentor_dashboard.html', stats=stats, stats_refreshed_at=stats_refreshed_at,
+                           format_time_ago=format_time_ago)
 
 @app.route('/inkblot')
 @login_required
@@ -1376,18 +1524,51 @@ def counsellor_dashboard():
     if current_user.role != 'counsellor':
         flash('Access denied. This page is for counsellors only.', 'error')
         return redirect(url_for('dashboard'))
-    # Show all requests (pending, booked, rejected) for this counsellor
-    # Order: pending first, then booked, then others by date desc
-    status_order = case(
-        (ConsultationRequest.status == 'pending', 0),
-        (ConsultationRequest.status == 'booked', 1),
-        else_=2
-    )
-    requests = ConsultationRequest.query.filter_by(counsellor_id=current_user.id).order_by(
-        status_order, ConsultationRequest.created_at.desc()
-    ).all()
+    # One tab (pending, booked or history) at a time, a keyset page at a time
+    tab = request.args.get('tab', 'pending')
+    if tab not in consultation_lists.TABS:
+        tab = 'pending'
+    requests, next_cursor = consultation_lists.get_page(current_user.id, tab, request.args.get('cursor'))
+    recent_assessments = consultation_lists.recent_assessments(req.user_id for req in requests)
     from datetime import datetime
-    return render_template('counsellor_dashboard.html', requests=requests, now=datetime.utcnow())
+    flagged_items = moderation.get_open_flags()
+    return render_template('counsellor_dashboard.html', requests=requests, now=datetime.utcnow(),
+                           tab=tab, tab_counts=consultation_lists.get_counts(current_user.id),
+                           calendar_url=calendar_feed.feed_url(current_user.id),
+                           next_cursor=next_cursor, is_first_page=not request.args.get('cursor'),
+                           recent_assessments=recent_assessments,
+                           flagged_items=flagged_items, digest_window=get_window(current_user.id))
+
+@app.route('/live')
+@login_required
+def live_events():
+    # Server-Sent Events for this user's dashboards (see live.py)
+    topics = [live.user_topic(current_user.id), live.role_topic(current_user.role)]
+    return Response(live.stream(topics), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/moderation/flags/<int:flag_id>/review', methods=['POST'])
+@login_required
+def review_moderation_flag(flag_id):
+    if current_user.role != 'counsellor':
+        flash('Access denied. This page is for counsellors only.', 'error')
+        return redirect(url_for('dashboard'))
+    if moderation.mark_reviewed(flag_id, current_user.id):
+        flash('Flag marked as reviewed.', 'success')
+    else:
+        flash('Flag not found.', 'error')
+    return redirect(url_for('counsellor_dashboard'))
+
+@app.route('/notification_preferences', methods=['POST'])
+@login_required
+def notification_preferences():
+    try:
+        set_window(current_user.id, request.form.get('digest_window', ''))
+        db.session.commit()
+        flash('Notification preferences saved.', 'success')
+    except ValueError:
+        flash('Invalid notification setting.', 'error')
+    return redirect(request.referrer or url_for('dashboard'))
 
 @app.route('/_debug/consults')
 @login_required
@@ -1423,13 +1604,18 @@ def accept_consultation(request_id):
         flash('Unauthorized action.', 'error')
         return redirect(url_for('counsellor_dashboard'))
     req.status = 'booked'
-    db.session.commit()
+    consultation_reminders.sync(req)
     # Notify user
-    send_email(
+    queue_email(
         subject='Consultation accepted',
         body=f'Your consultation was accepted by {current_user.full_name}. You will receive scheduling details soon.',
         to_email=req.user.email
     )
+    live.publish(live.user_topic(req.user_id), 'consultation_updated', {
+        'id': req.id, 'status': req.status,
+        'message': f'{current_user.full_name} accepted your consultation request.'
+    })
+    db.session.commit()
     flash('Consultation accepted and booked. The user will be notified.', 'success')
     return redirect(url_for('counsellor_dashboard'))
 
@@ -1441,17 +1627,24 @@ def reject_consultation(request_id):
         flash('Unauthorized action.', 'error')
         return redirect(url_for('counsellor_dashboard'))
     req.status = 'rejected'
-    db.session.commit()
-    send_email(
+    booking.release_slot(req)
+    consultation_reminders.sync(req)
+    queue_email(
         subject='Consultation update',
         body=f'Your consultation request was rejected by {current_user.full_name}. You can request another counsellor from the portal.',
         to_email=req.user.email
     )
+    live.publish(live.user_topic(req.user_id), 'consultation_updated', {
+        'id': req.id, 'status': req.status,
+        'message': f'{current_user.full_name} could not take your consultation request. You can request another counsellor.'
+    })
+    db.session.commit()
     flash('Consultation rejected. The user will be notified.', 'info')
     return redirect(url_for('counsellor_dashboard'))
 
 @app.route('/view_user_assessment/<int:user_id>')
 @login_required
+@read_replica
 def view_user_assessment(user_id):
     if current_user.role != 'counsellor':
         flash('Access denied.', 'error')
@@ -1474,14 +1667,9 @@ def view_user_assessment(user_id):
     # Compute user stats for counsellor overview
     from datetime import datetime, timedelta
     today = datetime.utcnow().date()
-    start_of_week = today - timedelta(days=today.weekday())
-    weekly_sessions_count = MeditationSession.query.filter_by(user_id=user.id).filter(
-        MeditationSession.date >= start_of_week
-    ).count()
-    total_seconds = db.session.query(func.sum(MeditationSession.duration)).filter_by(
-        user_id=user.id
-    ).scalar() or 0
-    total_minutes_meditated = total_seconds // 60
+    activity = activity_summary(user.id, today, series_days=14)
+    weekly_sessions_count = activity['weekly_sessions_count']
+    total_minutes_meditated = activity['total_minutes_meditated']
     todays_tasks = RoutineTask.query.filter_by(user_id=user.id, created_date=today).all()
     # Additional analytics
     recent_30 = datetime.utcnow() - timedelta(days=30)
@@ -1500,15 +1688,9 @@ def view_user_assessment(user_id):
     # Login streak
     login_streak = current_user.login_streak or 0
     # Meditation time series (last 14 days)
-    days = [today - timedelta(days=i) for i in range(13, -1, -1)]
-    sessions_14 = MeditationSession.query.filter_by(user_id=user.id).filter(MeditationSession.date >= days[0]).all()
-    minutes_by_day = {d: 0 for d in days}
-    for s in sessions_14:
-        if s.date in minutes_by_day:
-            minutes_by_day[s.date] += (s.duration or 0) // 60
     meditation_series = {
-        'labels': [d.strftime('%d %b') for d in days],
-        'values': [minutes_by_day[d] for d in days]
+        'labels': [d.strftime('%d %b') for d, _ in activity['series']],
+        'values': [minutes for _, minutes in activity['series']]
     }
     # Assessment severity trend (last 10)
     last_ten = assessments[:10]
@@ -1537,26 +1719,57 @@ def view_user_assessment(user_id):
         meditation_series=meditation_series,
         severity_series=severity_series
     )
+
+@app.route('/view_user_chats/<int:user_id>')
+@login_required
+def view_user_chats(user_id):
+    if current_user.role != 'counsellor':
+        flash('Access denied.', 'error')
+        return redirect(url_for('counsellor_dashboard'))
+    user = User.query.get_or_404(user_id)
+    has_relationship = ConsultationRequest.query.filter_by(
+        user_id=user.id,
+        counsellor_id=current_user.id,
+        status='booked'
+    ).first() is not None
+    if not has_relationship:
+        flash('You can only view chat history for users with booked consultations.', 'error')
+        return redirect(url_for('counsellor_dashboard'))
+    # Most recent sessions first; archived sessions are read back from cold storage
+    chat_sessions = ChatSession.query.filter_by(user_id=user.id).order_by(
+        ChatSession.session_start.desc()
+    ).limit(10).all()
+    history = [(s, get_session_messages(s.id)) for s in chat_sessions]
+    return render_template('counsellor_chat_history.html', user=user, history=history)
 @app.route('/admin_dashboard')
 @login_required
+@read_replica
 def admin_dashboard():
     if current_user.role != 'admin':
         flash('Access denied. This page is for admins only.', 'error')
         return redirect(url_for('dashboard'))
-    from sqlalchemy.sql import func
-    total_users = User.query.count()
-    total_counsellors = User.query.filter_by(role='counsellor').count()
+    total_users, total_counsellors = db.session.query(
+        func.count(User.id),
+        func.coalesce(func.sum(case((User.role == 'counsellor', 1), else_=0)), 0)
+    ).one()
     total_bookings = ConsultationRequest.query.count()
-    recent_feedback = ConsultationRequest.query.filter(ConsultationRequest.feedback_rating != None).order_by(ConsultationRequest.created_at.desc()).limit(5).all()
-    # Top counsellors by bookings and avg rating
-    counsellors = User.query.filter_by(role='counsellor').all()
-    top_counsellors = []
-    for c in counsellors:
-        bookings = ConsultationRequest.query.filter_by(counsellor_id=c.id).count()
-        ratings = [req.feedback_rating for req in ConsultationRequest.query.filter_by(counsellor_id=c.id).filter(ConsultationRequest.feedback_rating != None).all()]
-        avg_rating = sum(ratings)/len(ratings) if ratings else 0
-        top_counsellors.append({'full_name': c.full_name, 'username': c.username, 'bookings': bookings, 'avg_rating': avg_rating})
-    top_counsellors = sorted(top_counsellors, key=lambda x: (x['bookings'], x['avg_rating']), reverse=True)[:5]
+    recent_feedback = ConsultationRequest.query.options(joinedload(ConsultationRequest.user)).filter(
+        ConsultationRequest.feedback_rating != None
+    ).order_by(ConsultationRequest.created_at.desc()).limit(5).all()
+    # Top counsellors by bookings and avg rating, aggregated and ranked in one grouped query
+    bookings = func.count(ConsultationRequest.id)
+    avg_rating = func.coalesce(func.avg(ConsultationRequest.feedback_rating), 0)
+    top_rows = db.session.query(
+        User.full_name, User.username,
+        bookings.label('bookings'),
+        avg_rating.label('avg_rating'),
+        func.count(ConsultationRequest.feedback_rating).label('rating_count')
+    ).outerjoin(ConsultationRequest, ConsultationRequest.counsellor_id == User.id).filter(
+        User.role == 'counsellor'
+    ).group_by(User.id, User.full_name, User.username).order_by(
+        bookings.desc(), avg_rating.desc()
+    ).limit(5).all()
+    top_counsellors = [row._asdict() for row in top_rows]
     return render_template('admin_dashboard.html', total_users=total_users, total_counsellors=total_counsellors, total_bookings=total_bookings, recent_feedback=recent_feedback, top_counsellors=top_counsellors)
 @app.route('/schedule_follow_up/<int:request_id>', methods=['POST'])
 @login_required
@@ -1569,16 +1782,17 @@ def schedule_follow_up(request_id):
     try:
         from datetime import datetime
         req.follow_up_datetime = datetime.strptime(follow_up_datetime_str, '%Y-%m-%dT%H:%M')
-        db.session.commit()
-        send_email(
+        consultation_reminders.sync(req)
+        queue_email(
             subject='Follow-up scheduled',
             body=f'Your follow-up is scheduled on {req.follow_up_datetime} with {current_user.full_name}.',
             to_email=req.user.email
         )
+        db.session.commit()
         flash('Follow-up session scheduled!', 'success')
     except Exception:
         flash('Invalid date/time format.', 'error')
-    return redirect(url_for('counsellor_dashboard'))
+    return redirect(url_for('counsellor_dashboard', tab='booked'))
 @app.route('/set_chat_video_link/<int:request_id>', methods=['POST'])
 @login_required
 def set_chat_video_link(request_id):
@@ -1587,14 +1801,14 @@ def set_chat_video_link(request_id):
         flash('Unauthorized or invalid request.', 'error')
         return redirect(url_for('counsellor_dashboard'))
     req.chat_video_link = request.form.get('chat_video_link')
-    db.session.commit()
-    send_email(
+    queue_email(
         subject='Session link available',
         body=f'Your session link is set: {req.chat_video_link}',
         to_email=req.user.email
     )
+    db.session.commit()
     flash('Chat/Video link set!', 'success')
-    return redirect(url_for('counsellor_dashboard'))
+    return redirect(url_for('counsellor_dashboard', tab='booked'))
 @app.route('/submit_feedback/<int:request_id>', methods=['POST'])
 @login_required
 def submit_feedback(request_id):
@@ -1617,7 +1831,7 @@ def add_session_notes(request_id):
     req.session_notes = request.form.get('session_notes')
     db.session.commit()
     flash('Session notes saved!', 'success')
-    return redirect(url_for('counsellor_dashboard'))
+    return redirect(url_for('counsellor_dashboard', tab='booked'))
 @app.route('/schedule_session/<int:request_id>', methods=['POST'])
 @login_required
 def schedule_session(request_id):
@@ -1629,16 +1843,17 @@ def schedule_session(request_id):
     try:
         from datetime import datetime
         req.session_datetime = datetime.strptime(session_datetime_str, '%Y-%m-%dT%H:%M')
-        db.session.commit()
-        send_email(
+        consultation_reminders.sync(req)
+        queue_email(
             subject='Session scheduled',
             body=f'Your session is scheduled for {req.session_datetime} with {current_user.full_name}.',
             to_email=req.user.email
         )
+        db.session.commit()
         flash('Session scheduled successfully!', 'success')
     except Exception:
         flash('Invalid date/time format.', 'error')
-    return redirect(url_for('counsellor_dashboard'))
+    return redirect(url_for('counsellor_dashboard', tab='booked'))
 
 @app.route('/cancel_booking/<int:request_id>', methods=['POST'])
 @login_required
@@ -1649,13 +1864,15 @@ def cancel_booking(request_id):
         return redirect(url_for('counsellor_dashboard'))
     prev_status = req.status
     req.status = 'cancelled'
-    db.session.commit()
+    booking.release_slot(req)
+    consultation_reminders.sync(req)
     if prev_status == 'booked' or prev_status == 'pending':
-        send_email(
+        queue_email(
             subject='Consultation cancelled',
             body=f'Your consultation with {current_user.full_name} has been cancelled. Please book a new slot or request another counsellor.',
             to_email=req.user.email
         )
+    db.session.commit()
     flash('Booking cancelled.', 'info')
     return redirect(url_for('counsellor_dashboard'))
 
@@ -1726,23 +1943,24 @@ def send_result_to_counsellor(assessment_id):
         status='pending'
     )
     db.session.add(new_request)
-    db.session.commit()
+    consultation_reminders.sync(new_request)
     # Notify counsellor and user
     try:
         counsellor = User.query.get(int(counsellor_id))
     except Exception:
         counsellor = None
-    if counsellor:
-        send_email(
-            subject='Assessment shared with you',
-            body=f'{current_user.full_name} sent {assessment.assessment_type} results (score {assessment.score}, {assessment.severity_level}).',
-            to_email=counsellor.email
-        )
-    send_email(
+    notify(
+        counsellor, 'assessment_shared',
+        subject='Assessment shared with you',
+        body=f'{current_user.full_name} sent {assessment.assessment_type} results (score {assessment.score}, {assessment.severity_level}).',
+        urgent=assessment.severity_level in URGENT_SEVERITIES
+    )
+    queue_email(
         subject='Assessment shared',
         body=f'Your {assessment.assessment_type} results were shared with the counsellor.',
         to_email=current_user.email
     )
+    db.session.commit()
     # Prepare analysis for template
     try:
         analysis = json.loads(assessment.recommendations) if assessment.recommendations else generate_analysis(assessment.assessment_type, assessment.score)
@@ -0,0 +1,150 @@
+"""
+Durable scheduler for one-off jobs that must run at a given time.
+
+Jobs are rows in scheduled_job, one per (kind, target_id), so scheduling is
+idempotent: scheduling again for the same time changes nothing, and a new
+time moves the existing row instead of adding a duplicate. A background job
+polls the (status, due_at) index every SCHEDULER_POLL_SECONDS. As in
+email_outbox.py, each due row is leased with a conditional UPDATE, so
+several workers can poll at once and every job runs in exactly one of them.
+If a worker dies mid-job, its lease runs out after SCHEDULER_LEASE_SECONDS
+and the job runs again. A handler's writes (e.g. queued emails) commit in
+the same transaction that marks its job done. Failed jobs retry with
+exponential backoff until SCHEDULER_MAX_ATTEMPTS.
+
+Handlers are registered per kind with the `@handler(kind)` decorator and
+receive the ScheduledJob row.
+"""
+
+import logging
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, update, or_
+from database import db
+from db_utils import insert_ignore
+from models import ScheduledJob
+import background
+
+HANDLERS = {}
+
+
+def handler(kind):
+    """Register the function that runs jobs of `kind`"""
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+def schedule(kind, target_id, due_at):
+    """Make `kind` run for `target_id` at `due_at`; a no-op if it is already set for that time. The caller commits."""
+    table = ScheduledJob.__table__
+    conn = db.session.connection()
+    where = (table.c.kind == kind, table.c.target_id == target_id)
+    values = {'due_at': due_at, 'status': 'pending', 'attempts': 0, 'locked_until': None, 'last_error': None}
+    existing = conn.execute(select(table.c.due_at, table.c.status).where(*where)).first()
+    if existing is None:
+        if insert_ignore(conn, table, {'kind': kind, 'target_id': target_id, 'created_at': datetime.utcnow(),
+                                       **values}):
+            return
+        existing = conn.execute(select(table.c.due_at, table.c.status).where(*where)).first()
+    if existing.due_at == due_at and existing.status != 'cancelled':
+        # Already pending, running or done for this time
+        return
+    conn.execute(update(table).where(*where).values(**values))
+
+
+def cancel(kind, target_id):
+    """Drop the pending run of `kind` for `target_id`, if any; the caller commits"""
+    db.session.execute(
+        update(ScheduledJob)
+        .where(ScheduledJob.kind == kind, ScheduledJob.target_id == target_id, ScheduledJob.status == 'pending')
+        .values(status='cancelled', locked_until=None)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _is_free(now):
+    return or_(ScheduledJob.locked_until.is_(None), ScheduledJob.locked_until <= now)
+
+
+def _claim(config, batch_size, now):
+    """Lease up to batch_size due jobs to this worker; returns their ids"""
+    due = db.session.execute(
+        select(ScheduledJob.id)
+        .where(ScheduledJob.status == 'pending', ScheduledJob.due_at <= now, _is_free(now))
+        .order_by(ScheduledJob.due_at, ScheduledJob.id)
+        .limit(batch_size)
+    ).scalars().all()
+    lease_until = now + timedelta(seconds=config.get('SCHEDULER_LEASE_SECONDS', 300))
+    claimed = []
+    for job_id in due:
+        # Conditional per row: a job another worker leased or that was rescheduled meanwhile no longer matches
+        result = db.session.execute(
+            update(ScheduledJob)
+            .where(ScheduledJob.id == job_id, ScheduledJob.status == 'pending', ScheduledJob.due_at <= now,
+                   _is_free(now))
+            .values(locked_until=lease_until, attempts=ScheduledJob.attempts + 1)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount:
+            claimed.append(job_id)
+    db.session.commit()
+    return claimed
+
+
+def _run(job, now):
+    func = HANDLERS.get(job.kind)
+    if func is None:
+        raise LookupError(f"No handler registered for scheduled job kind {job.kind!r}")
+    func(job)
+    # Only if it was not rescheduled while running; then the row stays pending for the new time
+    db.session.execute(
+        update(ScheduledJob)
+        .where(ScheduledJob.id == job.id, ScheduledJob.due_at == job.due_at, ScheduledJob.status == 'pending')
+        .values(status='done', done_at=now, locked_until=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def _failed(config, job_id, attempts, error, now):
+    db.session.rollback()
+    if attempts >= config.get('SCHEDULER_MAX_ATTEMPTS', 5):
+        values = {'status': 'failed', 'locked_until': None}
+    else:
+        delay = min(config.get('SCHEDULER_RETRY_BASE_SECONDS', 60) * 2 ** (attempts - 1),
+                    config.get('SCHEDULER_RETRY_MAX_SECONDS', 3600))
+        values = {'locked_until': now + timedelta(seconds=delay)}
+    db.session.execute(
+        update(ScheduledJob).where(ScheduledJob.id == job_id, ScheduledJob.status == 'pending')
+        .values(last_error=str(error)[:1000], **values)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def run_due(batch_size=None):
+    """Run every job that is due until none are left; returns the number run"""
+    config = current_app.config
+    batch_size = batch_size or config.get('SCHEDULER_BATCH_SIZE', 100)
+    total = 0
+    while True:
+        now = datetime.utcnow()
+        claimed = _claim(config, batch_size, now)
+        if not claimed:
+            return total
+        for job_id in claimed:
+            job = db.session.get(ScheduledJob, job_id)
+            attempts = job.attempts
+            try:
+                _run(job, now)
+                total += 1
+            except Exception as e:
+                logging.error(f"Scheduled job {job_id} ({job.kind}) failed: {e}")
+                _failed(config, job_id, attempts, e, now)
+        db.session.expunge_all()
+
+
+def init_app(app):
+    background.register_job(app, 'scheduled-jobs', run_due, app.config.get('SCHEDULER_POLL_SECONDS', 30))
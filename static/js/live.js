@@ -0,0 +1,22 @@
+/**
+ * Live updates (see live.py): show a banner when something changes for this
+ * user, instead of reloading the page to find out.
+ */
+document.addEventListener('DOMContentLoaded', function () {
+    const banner = document.getElementById('liveBanner');
+    if (!banner || !window.EventSource) {
+        return;
+    }
+    const text = banner.querySelector('.live-text');
+    const source = new EventSource(banner.dataset.url);
+    ['consultation_request', 'slot_booked', 'consultation_updated', 'crisis_chat'].forEach(function (name) {
+        source.addEventListener(name, function (event) {
+            text.textContent = JSON.parse(event.data).message;
+            banner.classList.remove('d-none');
+        });
+    });
+    // Missed events while falling behind: the page is stale, load it again
+    source.addEventListener('resync', function () {
+        window.location.reload();
+    });
+});
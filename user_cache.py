@@ -0,0 +1,147 @@
+"""
+Per-process identity cache for Flask-Login.
+
+The user loader used to run `User.query.get()` on every authenticated
+request. It now serves the fields the request path reads (id, role,
+username, full_name, email, login_streak) from a small TTL/LRU cache and
+returns a CachedUser wrapping them. Anything else, or any assignment, loads
+the full User row on first use, so routes that mutate the user still work
+on the real ORM object.
+
+Entries are dropped when a flush changes one of the cached fields or deletes
+the user, and on bulk UPDATE/DELETE statements against users. Other worker
+processes see such changes after USER_CACHE_TTL_SECONDS at the latest.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from flask_login import UserMixin
+from sqlalchemy import event, inspect, select
+from database import db
+from db_routing import RoutingSession
+from models import User
+
+CACHED_FIELDS = ('id', 'role', 'username', 'full_name', 'email', 'login_streak')
+
+
+class UserCache:
+    """Thread-safe LRU of user id -> cached field dict, each entry valid for `ttl` seconds"""
+
+    def __init__(self, ttl=30, max_size=1024):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # user_id -> (expires_at, fields)
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, user_id, fields):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, fields)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id=None):
+        """Drop one user, or everyone when user_id is None"""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+user_cache = UserCache()
+
+
+class CachedUser(UserMixin):
+    """Read-only snapshot of the logged-in user; the ORM row is loaded on first use of anything else"""
+
+    def __init__(self, fields):
+        self.__dict__['_fields'] = fields
+        self.__dict__['_user'] = None
+
+    def _load(self):
+        user = self.__dict__['_user']
+        if user is None:
+            user = db.session.get(User, self.__dict__['_fields']['id'])
+            self.__dict__['_user'] = user
+        return user
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        fields = self.__dict__['_fields']
+        user = self.__dict__['_user']
+        if name in fields and user is None:
+            return fields[name]
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+    def __repr__(self):
+        return f"<CachedUser {self.__dict__['_fields']['id']}>"
+
+
+def load_user(user_id):
+    """Flask-Login user loader: cached fields, no query on a cache hit"""
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+    fields = user_cache.get(user_id)
+    if fields is None:
+        row = db.session.execute(
+            select(*(User.__table__.c[name] for name in CACHED_FIELDS)).where(User.id == user_id)
+        ).mappings().first()
+        if row is None:
+            return None
+        fields = dict(row)
+        user_cache.put(user_id, fields)
+    return CachedUser(dict(fields))
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _invalidate_changed_users(db_session, flush_context):
+    for obj in db_session.dirty:
+        if isinstance(obj, User):
+            state = inspect(obj)
+            if any(state.attrs[name].history.has_changes() for name in CACHED_FIELDS):
+                user_cache.invalidate(obj.id)
+    for obj in db_session.deleted:
+        if isinstance(obj, User):
+            user_cache.invalidate(obj.id)
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _invalidate_bulk_changes(orm_execute_state):
+    # Statements touching a single known user say so (see User.update_login_streak)
+    user_id = orm_execute_state.execution_options.get('invalidate_user_id')
+    if user_id is not None:
+        user_cache.invalidate(user_id)
+    elif (orm_execute_state.is_update or orm_execute_state.is_delete) and \
+            User.__mapper__ in orm_execute_state.all_mappers:
+        user_cache.invalidate()
+
+
+def init_app(app):
+    user_cache.ttl = app.config.get('USER_CACHE_TTL_SECONDS', 30)
+    user_cache.max_size = app.config.get('USER_CACHE_SIZE', 1024)
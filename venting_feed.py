@@ -0,0 +1,55 @@
+"""
+Keyset-paginated venting hall feed.
+
+Posts are read newest first in pages of (created_at, id) keyset order, so the
+cost of a page does not depend on how many posts came before it. Authors,
+responses and response authors are eager-loaded with selectinload, giving a
+fixed four queries per page instead of 1 + 2N + M lazy loads.
+"""
+
+import base64
+from datetime import datetime
+from sqlalchemy import or_, and_
+from sqlalchemy.orm import selectinload
+from models import VentingPost, VentingResponse
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 50
+
+
+def encode_cursor(position):
+    """Opaque cursor string for a (datetime, int) keyset position"""
+    moment, key = position
+    raw = f"{moment.isoformat()}|{key}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return the (datetime, int) position from a cursor string, or None if it is missing or invalid"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, post_id = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(post_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def get_feed_page(cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """Return (posts, next_cursor) for the page after `cursor`; next_cursor is None on the last page"""
+    limit = max(1, min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
+    query = VentingPost.query.options(
+        selectinload(VentingPost.user),
+        selectinload(VentingPost.responses).selectinload(VentingResponse.user),
+    )
+    position = decode_cursor(cursor)
+    if position:
+        created_at, post_id = position
+        query = query.filter(or_(
+            VentingPost.created_at < created_at,
+            and_(VentingPost.created_at == created_at, VentingPost.id < post_id)
+        ))
+    posts = query.order_by(VentingPost.created_at.desc(), VentingPost.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_cursor((posts[limit - 1].created_at, posts[limit - 1].id)) if len(posts) > limit else None
+    return posts[:limit], next_cursor
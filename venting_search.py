@@ -0,0 +1,193 @@
+"""
+Full-text search over venting posts and responses.
+
+SQLite: FTS5 tables venting_post_fts / venting_response_fts keyed by the
+source row id and kept in sync by insert/update/delete triggers, ranked with
+bm25(). Postgres: GIN expression indexes on to_tsvector(content), which the
+database keeps in sync by itself, ranked with ts_rank().
+
+The FTS tables are filled from the existing rows when they are first
+created. `flask rebuild-search-index` indexes any source row still missing
+from them, a batch of ids at a time, or re-indexes everything with --full.
+"""
+
+import logging
+import re
+from datetime import datetime
+from markupsafe import Markup, escape
+from sqlalchemy import text
+from database import db
+
+FTS_TABLES = {
+    # fts table -> source table
+    'venting_post_fts': 'venting_post',
+    'venting_response_fts': 'venting_response',
+}
+PG_TS_CONFIG = 'simple'
+SNIPPET_START, SNIPPET_END = '\x02', '\x03'
+DEFAULT_PAGE_SIZE = 20
+
+
+def _dialect():
+    return db.engine.dialect.name
+
+
+def ensure_search_index():
+    """Create the full-text index structures for the current database if missing"""
+    dialect = _dialect()
+    with db.engine.begin() as conn:
+        if dialect == 'sqlite':
+            try:
+                for fts, source in FTS_TABLES.items():
+                    created = not _table_exists(conn, fts)
+                    conn.exec_driver_sql(
+                        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(content, tokenize='porter unicode61')")
+                    if created:
+                        # Rows written before the index existed; the triggers below cover the rest
+                        conn.exec_driver_sql(f"INSERT INTO {fts}(rowid, content) SELECT id, content FROM {source}")
+                    conn.exec_driver_sql(
+                        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {source} BEGIN "
+                        f"INSERT INTO {fts}(rowid, content) VALUES (new.id, new.content); END")
+                    conn.exec_driver_sql(
+                        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {source} BEGIN "
+                        f"DELETE FROM {fts} WHERE rowid = old.id; END")
+                    conn.exec_driver_sql(
+                        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF content ON {source} BEGIN "
+                        f"UPDATE {fts} SET content = new.content WHERE rowid = old.id; END")
+            except Exception as e:
+                logging.warning(f"SQLite FTS5 unavailable, venting search falls back to LIKE: {e}")
+        elif dialect == 'postgresql':
+            for source in FTS_TABLES.values():
+                conn.exec_driver_sql(
+                    f"CREATE INDEX IF NOT EXISTS ix_{source}_content_fts ON {source} "
+                    f"USING gin (to_tsvector('{PG_TS_CONFIG}', content))")
+
+
+def _table_exists(conn, name):
+    return conn.execute(
+        text("SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': name}
+    ).scalar() > 0
+
+
+def _has_fts(conn):
+    return _table_exists(conn, 'venting_post_fts')
+
+
+def rebuild_search_index(full=False, batch_size=5000, progress=None):
+    """Index source rows missing from the SQLite FTS tables; returns the number of rows indexed"""
+    if _dialect() != 'sqlite':
+        # Postgres expression indexes are maintained by the database
+        return 0
+    ensure_search_index()
+    total = 0
+    for fts, source in FTS_TABLES.items():
+        with db.engine.begin() as conn:
+            if full:
+                conn.exec_driver_sql(f"DELETE FROM {fts}")
+        after = 0
+        while True:
+            # Walk the source ids a batch at a time and add whichever of them the index lacks
+            with db.engine.begin() as conn:
+                upper = conn.execute(text(
+                    f"SELECT max(id) FROM (SELECT id FROM {source} WHERE id > :after ORDER BY id LIMIT :batch_size)"
+                ), {'after': after, 'batch_size': batch_size}).scalar()
+                if upper is None:
+                    break
+                total += conn.execute(text(
+                    f"INSERT INTO {fts}(rowid, content) "
+                    f"SELECT id, content FROM {source} WHERE id > :after AND id <= :upper "
+                    f"AND id NOT IN (SELECT rowid FROM {fts} WHERE rowid > :after AND rowid <= :upper)"
+                ), {'after': after, 'upper': upper}).rowcount
+            after = upper
+            if progress:
+                progress(fts, total)
+    return total
+
+
+def _fts5_query(query):
+    """Turn free text into a safe FTS5 query: every word must match, last word as a prefix"""
+    words = re.findall(r'\w+', query)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def _highlight(snippet):
+    return Markup(str(escape(snippet or ''))
+                  .replace(SNIPPET_START, '<mark>').replace(SNIPPET_END, '</mark>'))
+
+
+def search_venting(query, page=1, per_page=DEFAULT_PAGE_SIZE, lookahead=False):
+    """Ranked search across posts and responses.
+
+    Returns a list of dicts with kind ('post' or 'response'), id, post_id,
+    snippet (Markup with <mark> highlights), created_at and anonymous.
+    With lookahead, one row past the page is returned as well, so callers can
+    tell whether there is a next page without shifting the page offsets.
+    """
+    page = max(page or 1, 1)
+    per_page = max(1, min(per_page or DEFAULT_PAGE_SIZE, 100))
+    params = {'limit': per_page + (1 if lookahead else 0), 'offset': (page - 1) * per_page}
+    dialect = _dialect()
+
+    if dialect == 'sqlite' and _has_fts(db.session.connection()):
+        params['q'] = _fts5_query(query)
+        if not params['q']:
+            return []
+        snippet = "snippet({fts}, 0, char(2), char(3), '…', 16)"
+        sql = (
+            "SELECT 'post' AS kind, p.id, p.id AS post_id, " + snippet.format(fts='venting_post_fts') +
+            " AS snippet, bm25(venting_post_fts) AS rank, p.created_at, p.anonymous "
+            "FROM venting_post_fts JOIN venting_post p ON p.id = venting_post_fts.rowid "
+            "WHERE venting_post_fts MATCH :q "
+            "UNION ALL "
+            "SELECT 'response', r.id, r.post_id, " + snippet.format(fts='venting_response_fts') +
+            ", bm25(venting_response_fts), r.created_at, r.anonymous "
+            "FROM venting_response_fts JOIN venting_response r ON r.id = venting_response_fts.rowid "
+            "WHERE venting_response_fts MATCH :q "
+            "ORDER BY rank, created_at DESC LIMIT :limit OFFSET :offset"
+        )
+    elif dialect == 'postgresql':
+        params['q'] = query
+        headline = (f"ts_headline('{PG_TS_CONFIG}', {{alias}}.content, q, "
+                    "'StartSel=' || chr(2) || ', StopSel=' || chr(3) || ', MaxWords=30, MinWords=10')")
+        vector = f"to_tsvector('{PG_TS_CONFIG}', {{alias}}.content)"
+        sql = (
+            "SELECT 'post' AS kind, p.id, p.id AS post_id, " + headline.format(alias='p') +
+            " AS snippet, ts_rank(" + vector.format(alias='p') + ", q) AS rank, p.created_at, p.anonymous "
+            f"FROM venting_post p, websearch_to_tsquery('{PG_TS_CONFIG}', :q) q "
+            "WHERE " + vector.format(alias='p') + " @@ q "
+            "UNION ALL "
+            "SELECT 'response', r.id, r.post_id, " + headline.format(alias='r') +
+            ", ts_rank(" + vector.format(alias='r') + ", q), r.created_at, r.anonymous "
+            f"FROM venting_response r, websearch_to_tsquery('{PG_TS_CONFIG}', :q) q "
+            "WHERE " + vector.format(alias='r') + " @@ q "
+            "ORDER BY rank DESC, created_at DESC LIMIT :limit OFFSET :offset"
+        )
+    else:
+        # No full-text support: unranked substring match, newest first
+        params['q'] = f"%{query}%"
+        sql = (
+            "SELECT 'post' AS kind, id, id AS post_id, content AS snippet, 0 AS rank, created_at, anonymous "
+            "FROM venting_post WHERE content LIKE :q "
+            "UNION ALL "
+            "SELECT 'response', id, post_id, content, 0, created_at, anonymous "
+            "FROM venting_response WHERE content LIKE :q "
+            "ORDER BY created_at DESC LIMIT :limit OFFSET :offset"
+        )
+
+    rows = db.session.execute(text(sql), params).mappings().all()
+    return [
+        {
+            'kind': row['kind'],
+            'id': row['id'],
+            'post_id': row['post_id'],
+            'snippet': _highlight(row['snippet']),
+            # Raw SQLite rows come back as ISO strings
+            'created_at': (datetime.fromisoformat(row['created_at'])
+                           if isinstance(row['created_at'], str) else row['created_at']),
+            'anonymous': bool(row['anonymous']),
+        } for row in rows
+    ]